@@ -0,0 +1,115 @@
+"""Compares `utils.extract_fulltext(_with_spacing)` with the former recursive versions
+
+The former implementations called themselves for every child element, so deeply\
+nested documents could hit Python's recursion limit. Run with:
+
+    python benchmarks/bench_fulltext.py --divs 2000 --depth 20
+"""
+
+import argparse
+import re
+import sys
+import timeit
+
+from lxml import etree as ET
+
+from acdh_tei_pyutils.utils import extract_fulltext, extract_fulltext_with_spacing
+
+BLOCK_ELEMENTS = ["p", "salute", "dateline", "closer", "seg", "opener", "div", "head"]
+
+
+def make_doc(divs: int, depth: int) -> ET.Element:
+    """returns a tei:body with `divs` tei:div each nesting tei:seg `depth` levels deep"""
+    seg = "Wort <hi>und</hi> <space unit='chars'/>noch <note>Anm.</note> eins"
+    for _ in range(depth):
+        seg = f"<seg>{seg}</seg> Schluss"
+    body = "\n".join(
+        f"<div><head>Kapitel {i}</head><p>{seg}</p></div>" for i in range(divs)
+    )
+    return ET.fromstring(
+        f'<body xmlns="http://www.tei-c.org/ns/1.0">{body}</body>',
+        parser=ET.XMLParser(huge_tree=True),
+    )
+
+
+def recursive_fulltext(root_node, tag_blacklist):
+    """the former implementation of `extract_fulltext`"""
+    text_parts = []
+
+    def _collect_text(node):
+        if node.tag in tag_blacklist:
+            return
+        if node.text:
+            text_parts.append(node.text)
+        for child in node:
+            _collect_text(child)
+            if child.tail:
+                text_parts.append(child.tail)
+
+    _collect_text(root_node)
+    return " ".join("".join(text_parts).split())
+
+
+def recursive_fulltext_with_spacing(root_node, tag_blacklist, block_elements):
+    """the former implementation of `extract_fulltext_with_spacing` (without its\
+    handling of comments)"""
+
+    def extract_text_recursive(element):
+        if str(element.tag).split("}")[-1] in tag_blacklist:
+            return ""
+        text_parts = []
+        if element.text:
+            text_parts.append(element.text)
+        for child in element:
+            tag_name = str(child.tag).split("}")[-1]
+            if tag_name == "space":
+                if child.get("unit", "") == "chars":
+                    text_parts.append(" ")
+                if child.tail:
+                    text_parts.append(child.tail)
+                continue
+            if tag_name in block_elements:
+                text_parts.append(" ")
+            child_text = extract_text_recursive(child)
+            if child_text:
+                text_parts.append(child_text)
+            if tag_name in block_elements:
+                text_parts.append(" ")
+            if child.tail:
+                text_parts.append(child.tail)
+        return "".join(text_parts)
+
+    return re.sub(r"\s+", " ", extract_text_recursive(root_node)).strip()
+
+
+def best(func, repeat: int) -> float:
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--divs", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=20, help="nesting of tei:seg")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), args.depth * 3 + 100))
+    root = make_doc(args.divs, args.depth)
+    blacklist = ["{http://www.tei-c.org/ns/1.0}note"]
+    assert recursive_fulltext(root, blacklist) == extract_fulltext(root, blacklist)
+    assert recursive_fulltext_with_spacing(
+        root, ["note"], BLOCK_ELEMENTS
+    ) == extract_fulltext_with_spacing(root, ["note"])
+    print(f"{args.divs} divs, tei:seg nested {args.depth} levels deep")
+    before = best(lambda: recursive_fulltext(root, blacklist), args.repeat)
+    after = best(lambda: extract_fulltext(root, blacklist), args.repeat)
+    print(f"extract_fulltext:              {before:.3f}s -> {after:.3f}s")
+    before = best(
+        lambda: recursive_fulltext_with_spacing(root, ["note"], BLOCK_ELEMENTS),
+        args.repeat,
+    )
+    after = best(lambda: extract_fulltext_with_spacing(root, ["note"]), args.repeat)
+    print(f"extract_fulltext_with_spacing: {before:.3f}s -> {after:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Measures throughput and peak memory of the main entry points on synthetic corpora
+
+Every benchmark runs in a fresh process on a corpus written by\
+`acdh_tei_pyutils.synthetic.generate_corpus`, so the peak resident memory of one\
+run is not inflated by the previous ones. Save the results with `--json` and pass\
+them to a later run with `--compare` to see regressions and improvements. Run with:
+
+    python benchmarks/bench_suite.py --sizes 100,1000 --refs 20 --json before.json
+    python benchmarks/bench_suite.py --sizes 100,1000 --refs 20 --compare before.json
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from acdh_tei_pyutils.synthetic import generate_corpus
+
+BENCHMARKS = (
+    "mentions_to_indices",
+    "denormalize_indices",
+    "extract_ne_offsets",
+    "extract_fulltext_with_spacing",
+    "make_bibl_label",
+)
+
+
+def max_rss_mb() -> float:
+    """the peak resident memory of this process and its finished children in MiB"""
+    rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_cli(command, args: list) -> None:
+    with (
+        open(os.devnull, "w") as devnull,
+        contextlib.redirect_stdout(devnull),
+        contextlib.redirect_stderr(devnull),
+    ):
+        command.main(args, standalone_mode=False)
+
+
+def setup(name: str, corpus: dict, jobs: int):
+    """returns a function running the benchmark and the number of items it processes"""
+    editions = os.path.join(os.path.dirname(corpus["editions"][0]), "*.xml")
+    indices = os.path.join(os.path.dirname(corpus["indices"][0]), "*.xml")
+    docs = len(corpus["editions"])
+    if name == "mentions_to_indices":
+        from acdh_tei_pyutils.cli import mentions_to_indices
+
+        args = ["-f", editions, "-i", indices, "-t", "erwähnt in", "-j", str(jobs)]
+        return lambda: run_cli(mentions_to_indices, args), docs
+    if name == "denormalize_indices":
+        from acdh_tei_pyutils.cli import denormalize_indices
+
+        args = ["-f", editions, "-i", indices, "-d", ".//tei:date/@when"]
+        args += ["-j", str(jobs)]
+        return lambda: run_cli(denormalize_indices, args), docs
+    if name == "extract_ne_offsets":
+        from acdh_tei_pyutils.tei import TeiReader
+
+        readers = [TeiReader(x) for x in corpus["editions"]]
+        return lambda: [x.extract_ne_offsets() for x in readers], docs
+    if name == "extract_fulltext_with_spacing":
+        from acdh_tei_pyutils.tei import TeiReader
+        from acdh_tei_pyutils.utils import extract_fulltext_with_spacing
+
+        bodies = [TeiReader(x).any_xpath(".//tei:body")[0] for x in corpus["editions"]]
+        return lambda: [
+            extract_fulltext_with_spacing(x, ["note"]) for x in bodies
+        ], docs
+    if name == "make_bibl_label":
+        from acdh_tei_pyutils.tei import TeiReader
+        from acdh_tei_pyutils.utils import make_bibl_label
+
+        (listbibl,) = [x for x in corpus["indices"] if x.endswith("listbibl.xml")]
+        bibls = TeiReader(listbibl).any_xpath(".//tei:biblStruct")
+        return lambda: [make_bibl_label(x) for x in bibls], len(bibls)
+    raise ValueError(f"unknown benchmark {name}")
+
+
+def run_one(name: str, corpus_args: dict, jobs: int) -> dict:
+    """generates a corpus and runs a single benchmark on it, meant to run in a fresh process"""
+    with tempfile.TemporaryDirectory(prefix="acdh_tei_bench_") as tmp_dir:
+        corpus = generate_corpus(tmp_dir, **corpus_args)
+        func, items = setup(name, corpus, jobs)
+        setup_mb = max_rss_mb()
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        peak_mb = max_rss_mb()
+    return {
+        "benchmark": name,
+        "docs": corpus_args["docs"],
+        "items": items,
+        "seconds": round(seconds, 4),
+        "items_per_second": round(items / seconds, 1) if seconds else None,
+        "setup_mb": round(setup_mb, 1),
+        "peak_mb": round(peak_mb, 1),
+    }
+
+
+def change(new, old) -> str:
+    if not old or new is None:
+        return ""
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes", default="100,1000", help="comma separated numbers of documents"
+    )
+    parser.add_argument("--refs", type=int, default=10, help="tei:rs per document")
+    parser.add_argument(
+        "--entities", type=int, help="number of entities, defaults to 2 per document"
+    )
+    parser.add_argument("--paragraphs", type=int, default=3)
+    parser.add_argument("--paragraph-words", type=int, default=60)
+    parser.add_argument("--depth", type=int, default=0, help="nesting of tei:seg")
+    parser.add_argument("--notes", type=int, default=0, help="tei:note per entity")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument(
+        "--bench",
+        action="append",
+        choices=BENCHMARKS,
+        help="run only this benchmark, can be repeated",
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of a former run written by --json")
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            for x in json.load(f)["results"]:
+                previous[(x["benchmark"], x["docs"])] = x
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    print(
+        f"{'benchmark':<30} {'docs':>7} {'items':>7} {'seconds':>9} {'items/s':>10}"
+        f" {'peak MiB':>9}"
+    )
+    for docs in [int(x) for x in args.sizes.split(",")]:
+        corpus_args = {
+            "docs": docs,
+            "refs": args.refs,
+            "entities": args.entities or max(docs * 2, 4),
+            "paragraphs": args.paragraphs,
+            "paragraph_words": args.paragraph_words,
+            "depth": args.depth,
+            "notes": args.notes,
+            "seed": args.seed,
+        }
+        for name in args.bench or BENCHMARKS:
+            with ctx.Pool(1) as pool:
+                result = pool.apply(run_one, (name, corpus_args, args.jobs))
+            result["corpus"] = corpus_args
+            results.append(result)
+            line = (
+                f"{name:<30} {docs:>7} {result['items']:>7} {result['seconds']:>9.3f}"
+                f" {result['items_per_second']:>10} {result['peak_mb']:>9}"
+            )
+            old = previous.get((name, docs))
+            if old is not None:
+                line += (
+                    f"  throughput {change(result['items_per_second'], old['items_per_second'])}"
+                    f", memory {change(result['peak_mb'], old['peak_mb'])}"
+                )
+            print(line)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Compares `TeiReader.get_text_nes_list` with the former per-NE extraction
+
+The former implementation evaluated `.//text()` for every paragraph and again\
+for every NE (`create_plain_text` and `extract_ne_dicts`). Run with:
+
+    python benchmarks/bench_text_nes.py --paragraphs 2000 --nes 20
+"""
+
+import argparse
+import timeit
+
+from acdh_tei_pyutils.tei import NER_TAG_MAP, TeiReader
+
+
+def make_doc(paragraphs: int, nes: int) -> str:
+    """returns a TEI document with `paragraphs` tei:p each tagging `nes` NEs"""
+    types = ["place", "person", "org", "bibl"]
+    p = " ".join(
+        f'Satz {i} mit <rs type="{types[i % 4]}">Name <hi>{i}</hi></rs> und\n'
+        f"   etwas <persName>Text</persName> dazwischen."
+        for i in range(nes)
+    )
+    body = "\n".join(f"<p>{p}</p>" for _ in range(paragraphs))
+    return f'<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>{body}</body></text></TEI>'
+
+
+def per_ne(doc: TeiReader, parent_nodes: str, ne_xpath: str) -> list:
+    """the former implementation of `get_text_nes_list`"""
+    result = []
+    for node in doc.tree.xpath(parent_nodes, namespaces=doc.ns_tei):
+        text = doc.create_plain_text(node)
+        ner_dicts = doc.extract_ne_dicts(node, ne_xpath, NER_TAG_MAP)
+        result.append({"text": text, "ner_dicts": ner_dicts})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--nes", type=int, default=20, help="NEs per paragraph")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    doc = TeiReader(make_doc(args.paragraphs, args.nes))
+    parent_nodes = ".//tei:body//tei:p"
+    ne_xpath = ".//tei:rs|.//tei:persName"
+    assert per_ne(doc, parent_nodes, ne_xpath) == doc.get_text_nes_list(
+        parent_nodes, ne_xpath
+    )
+    before = min(
+        timeit.repeat(
+            lambda: per_ne(doc, parent_nodes, ne_xpath), number=1, repeat=args.repeat
+        )
+    )
+    after = min(
+        timeit.repeat(
+            lambda: doc.get_text_nes_list(parent_nodes, ne_xpath),
+            number=1,
+            repeat=args.repeat,
+        )
+    )
+    print(f"{args.paragraphs} paragraphs, {args.nes * 2} NEs each")
+    print(f"per NE:      {before:.3f}s")
+    print(f"single pass: {after:.3f}s ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,109 @@
 """Console script for acdh_collatex_utils."""
 
 import glob
-import os
-from collections import defaultdict
+import json
+import time
 
 import click
 import tqdm
 from lxml import etree as ET
 
-from acdh_tei_pyutils.tei import TeiEnricher
-from acdh_tei_pyutils.utils import previous_and_next
+from acdh_tei_pyutils.entities import (
+    EntityProjection,
+    EntityStore,
+    SerializedEntities,
+    build_join_index,
+    denormalize_files,
+    denormalize_incremental,
+    load_entities,
+    project_entities,
+)
+from acdh_tei_pyutils.fulltext import BLOCK_ELEMENTS, export_fulltext
+from acdh_tei_pyutils.manifest import Manifest
+from acdh_tei_pyutils.mentions import (
+    collect_mentions,
+    is_index_file,
+)
+from acdh_tei_pyutils.ner import SHARD_FORMATS, ShardWriter, export_ne_offsets
+from acdh_tei_pyutils.session import TreeCache
+from acdh_tei_pyutils.stats import RunStats
+from acdh_tei_pyutils.tei import NER_TAG_MAP, TeiEnricher
+from acdh_tei_pyutils.utils import add_base_and_id_to_files
+from acdh_tei_pyutils.writer import WriteBehindQueue
+from acdh_tei_pyutils.xpath import disable_xpath_profiling, enable_xpath_profiling
 
 NS = {
     "tei": "http://www.tei-c.org/ns/1.0",
     "xml": "http://www.w3.org/XML/1998/namespace",
 }
 
+# options shared by several console scripts
+write_behind_option = click.option(
+    "--write-behind",
+    default=0,
+    show_default=True,
+    type=int,
+    help="number of background threads writing the changed files while the next ones are processed, 0 writes synchronously",
+)
+stats_option = click.option(
+    "--stats",
+    "stats_file",
+    required=False,
+    help="write a JSON report with the wall and CPU time, processed files, parse and serialize time and memory peaks of every phase to this file",
+)
+trace_memory_option = click.option(
+    "--trace-memory",
+    is_flag=True,
+    help="add the peaks of Python allocations traced with tracemalloc to the --stats report; slows down the run",
+)
+profile_xpath_option = click.option(
+    "--profile-xpath",
+    default=0,
+    show_default=True,
+    type=int,
+    help="time the evaluations of XPath expressions and print this many slowest ones at the end, also added to the --stats report; expressions evaluated in worker processes (-j other than 1) are not timed",
+)
+
 
 @click.command()  # pragma: no cover
 @click.option(
     "-g", "--glob-pattern", default="./editions/*.xml", show_default=True
 )  # pragma: no cover
 @click.option("-b", "--base-value")  # pragma: no cover
-def add_base_id_next_prev(glob_pattern, base_value):  # pragma: no cover
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=int,
+    help="number of worker processes, 0 uses all cores",
+)  # pragma: no cover
+@stats_option  # pragma: no cover
+@trace_memory_option  # pragma: no cover
+def add_base_id_next_prev(
+    glob_pattern, base_value, jobs, stats_file, trace_memory
+):  # pragma: no cover
     """Console script add @xml:base, @xml:id and @prev @next attributes to root element"""
+    stats = RunStats("add-attributes", trace_memory)
     files = sorted(glob.glob(glob_pattern))
-
-    for prev_value, current, next_value in tqdm.tqdm(
-        previous_and_next(files), total=len(files)
-    ):
-        doc = TeiEnricher(current)
-        id_value = os.path.split(current)[1]
-        if prev_value:
-            prev_id = os.path.split(prev_value)[1]
-        else:
-            prev_id = None
-        if next_value:
-            next_id = os.path.split(next_value)[1]
-        else:
-            next_id = None
-        doc.add_base_and_id(base_value, id_value, prev_id, next_id)
-        doc.tree_to_file(file=current)
+    stats.begin("add_attributes", files)
+    results = add_base_and_id_to_files(files, base_value, jobs=jobs, progress=tqdm.tqdm)
+    stats.end()
+    for changed, error in results.values():
+        if error is not None:
+            print(error)
+    written = sum(changed for changed, _ in results.values())
+    unchanged = sum(
+        not changed and error is None for changed, error in results.values()
+    )
+    click.echo(
+        click.style(
+            f"rewrote {written} of {len(files)} files, {unchanged} were unchanged",
+            fg="green",
+        )
+    )
+    if stats_file:
+        stats.write(stats_file)
 
 
 @click.command()  # pragma: no cover
@@ -62,70 +125,75 @@ def add_base_id_next_prev(glob_pattern, base_value):  # pragma: no cover
     default='.//tei:title[@type="main"]/text()',
     show_default=True,
 )  # pragma: no cover
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=int,
+    help="number of worker processes used to collect the mentions, 0 uses all cores",
+)  # pragma: no cover
+@click.option(
+    "--streaming",
+    is_flag=True,
+    help="collect mentions with a streaming parser; supports only simple mention XPaths like './/tei:rs[@ref]/@ref' and title/date XPaths pointing into the tei:teiHeader",
+)  # pragma: no cover
+@write_behind_option  # pragma: no cover
+@stats_option  # pragma: no cover
+@trace_memory_option  # pragma: no cover
+@profile_xpath_option  # pragma: no cover
 def mentions_to_indices(
-    files, indices, mention_xpath, event_title, title_xpath
+    files,
+    indices,
+    mention_xpath,
+    event_title,
+    title_xpath,
+    jobs,
+    streaming,
+    write_behind,
+    stats_file,
+    trace_memory,
+    profile_xpath,
 ):  # pragma: no cover
     """Console script write pointers to mentions in index-docs"""
+    stats = RunStats("mentions-to-indices", trace_memory)
+    if profile_xpath:
+        enable_xpath_profiling()
     files = sorted(glob.glob(files))
     index_files = sorted(glob.glob(indices))
-    ref_doc_dict = defaultdict(list)
-    doc_ref_dict = defaultdict(list)
     click.echo(
         click.style(f"collecting list of mentions from {len(files)} docs", fg="green")
     )
-    for x in tqdm.tqdm(files):
-        filename = os.path.split(x)[1]
-        doc = TeiEnricher(x)
-        doc_base = doc.any_xpath("./@xml:base")[0]
-        doc_id = doc.any_xpath("./@xml:id")[0]
-        doc_uri = f"{doc_base}/{doc_id}"
-        doc_title = doc.any_xpath(title_xpath)[0]
-        refs = doc.any_xpath(mention_xpath)
-        for ref in set(refs):
-            if ref.startswith("#"):
-                ref = ref[1:]
-            ref_doc_dict[ref].append(
-                {
-                    "doc_uri": doc_uri,
-                    "doc_path": x,
-                    "doc_title": doc_title,
-                    "doc_id": doc_id,
-                    "doc_date": None,
-                    "doc_title_sec": None,
-                }
-            )
-            doc_ref_dict[filename].append(ref)
+    stats.begin("harvest", files)
+    ref_doc_dict = collect_mentions(
+        files,
+        jobs=jobs,
+        progress=tqdm.tqdm,
+        mention_xpath=mention_xpath,
+        title_xpath=title_xpath,
+        multi_refs=False,
+        strict=True,
+        streaming=streaming,
+    )
     click.echo(
         click.style(
             f"collected {len(ref_doc_dict.keys())} of mentioned entities from {len(files)} docs",
             fg="green",
         )
     )
-    for x in index_files:
-        doc = TeiEnricher(x)
-        ent_nodes = doc.any_xpath(".//tei:body//*[@xml:id]")
-        for ent in ent_nodes:
-            ent_id = ent.xpath("@xml:id", namespaces=doc.nsmap)[0]
-            mentions = ref_doc_dict[ent_id]
-            ent_name = ent.tag
-            note_grp = doc.create_mention_list(mentions, event_title)
-            try:
-                list(note_grp[0])
-                # TEI schema does not allow noteGrp in event after e.g. listPerson, ... so we need to insert it before
-                if ent_name == "{http://www.tei-c.org/ns/1.0}event":
-                    ent.insert(1, note_grp)
-                else:
-                    ent.append(note_grp)
-            except IndexError:
-                pass
-        doc.tree_to_file(file=x)
-
-    all_ent_nodes = {}
-    for x in index_files:
-        doc = TeiEnricher(x)
-        ent_nodes = doc.any_xpath(".//tei:body//*[@xml:id]")
-        for ent in ent_nodes:
-            all_ent_nodes[ent.xpath("@xml:id")[0]] = ent
+    slug_cache = {}
+    stats.begin("annotate_indices", index_files)
+    with WriteBehindQueue(workers=write_behind) as writer:
+        for x in index_files:
+            doc = TeiEnricher(x)
+            doc.add_mention_lists(ref_doc_dict, event_title, slug_cache=slug_cache)
+            writer.write(doc, x)
+    stats.end()
+    for msg in writer.errors.values():
+        print(msg)
+    if stats_file:
+        stats.write(stats_file)
+    print_xpath_profile(profile_xpath)
     click.echo(click.style("DONE", fg="green"))
 
 
@@ -150,6 +218,56 @@ def mentions_to_indices(
 @click.option(
     "--standoff", is_flag=True, help="write entity-lists into tei:standoff element"
 )
+@click.option(
+    "--entity-store",
+    required=False,
+    help="keep the index entries in this SQLite file, it is only rebuilt if an index file changed",
+)  # pragma: no cover
+@click.option(
+    "--manifest",
+    required=False,
+    help="keep a manifest of hashes and mentions in this file and only process what changed since the last run",
+)  # pragma: no cover
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=int,
+    help="number of worker processes used to collect mentions and write files, 0 uses all cores",
+)  # pragma: no cover
+@click.option(
+    "--cache-mb",
+    default=512,
+    show_default=True,
+    type=int,
+    help="memory budget for keeping parsed documents between the processing steps, 0 disables it",
+)  # pragma: no cover
+@click.option(
+    "--streaming",
+    is_flag=True,
+    help="collect mentions with a streaming parser; supports only simple mention XPaths like './/tei:rs[@ref]/@ref' and title/date XPaths pointing into the tei:teiHeader",
+)  # pragma: no cover
+@click.option(
+    "--strip-element",
+    multiple=True,
+    help="local name of a child element of the index entries which is not copied into the files, e.g. noteGrp; can be repeated",
+)  # pragma: no cover
+@click.option(
+    "--max-notes",
+    type=int,
+    required=False,
+    help="copy at most this many tei:note elements of every tei:noteGrp of the index entries into the files",
+)  # pragma: no cover
+@click.option(
+    "--keep-element",
+    multiple=True,
+    help="local name of a child element of the index entries which is copied into the files, all others are left out; can be repeated",
+)  # pragma: no cover
+@write_behind_option  # pragma: no cover
+@stats_option  # pragma: no cover
+@trace_memory_option  # pragma: no cover
+@profile_xpath_option  # pragma: no cover
 def denormalize_indices(
     files,
     indices,
@@ -158,193 +276,150 @@ def denormalize_indices(
     title_sec_xpath,
     date_xpath,
     standoff,
+    entity_store,
+    manifest,
+    jobs,
+    cache_mb,
+    streaming,
+    strip_element,
+    max_notes,
+    keep_element,
+    write_behind,
+    stats_file,
+    trace_memory,
+    profile_xpath,
     blacklist_ids=[],
 ):  # pragma: no cover
     """Write pointers to mentions in index-docs and copy index entries into docs"""
+    stats = RunStats("denormalize-indices", trace_memory)
+    if profile_xpath:
+        enable_xpath_profiling()
     files = sorted(glob.glob(files))
     index_files = sorted(glob.glob(indices))
-    ref_doc_dict = defaultdict(list)
-    doc_ref_dict = defaultdict(list)
-    click.echo(
-        click.style(f"collecting list of mentions from {len(files)} docs", fg="green")
-    )
-    for x in tqdm.tqdm(files):
-        filename = os.path.split(x)[1]
-        if "list" in filename:
-            continue
-        doc = TeiEnricher(x)
-        doc_base = doc.any_xpath("./@xml:base")[0]
-        doc_id = doc.any_xpath("./@xml:id")[0]
-        doc_uri = f"{doc_base}/{doc_id}"
-        try:
-            doc_title = doc.any_xpath(title_xpath)[0]
-        except IndexError:
-            doc_title = f"ERROR in title xpath of file: {doc_id}"
-            print(f"ERROR in -x title xpath of file: {doc_id}")
-        if title_sec_xpath:
-            try:
-                doc_title_sec = doc.any_xpath(title_sec_xpath)[0]
-            except IndexError:
-                doc_title_sec = f"ERROR in -xs secondary title xpath of file: {doc_id}"
-                print(f"ERROR in secondary title xpath of file: {doc_id}")
-        else:
-            doc_title_sec = None
-        if date_xpath:
-            try:
-                doc_date = doc.any_xpath(date_xpath)[0]
-            except IndexError:
-                doc_date = f"ERROR in date xpath of file: {doc_id}"
-                print(f"ERROR in -d date xpath of file: {doc_id}")
-        else:
-            doc_date = None
-        refs = doc.any_xpath(mention_xpath)
-        for ref in set(refs):
-            if ref.startswith("#") and len(ref.split(" ")) == 1:
-                ref = ref[1:]
-            if ref.startswith("#") and len(ref.split(" ")) > 1:
-                refs = ref.split(" ")
-                ref = refs[0]
-                ref = ref[1:]
-                for r in refs[1:]:
-                    ref_doc_dict[r[1:]].append(
-                        {
-                            "doc_uri": doc_uri,
-                            "doc_id": doc_id,
-                            "doc_path": x,
-                            "doc_title": doc_title,
-                            "doc_title_sec": doc_title_sec,
-                            "doc_date": doc_date,
-                        }
-                    )
-            ref_doc_dict[ref].append(
-                {
-                    "doc_uri": doc_uri,
-                    "doc_id": doc_id,
-                    "doc_path": x,
-                    "doc_title": doc_title,
-                    "doc_title_sec": doc_title_sec,
-                    "doc_date": doc_date,
-                }
+    session = TreeCache(max_mb=cache_mb)
+    projection = EntityProjection(strip_element, max_notes, keep_element)
+    with WriteBehindQueue(workers=write_behind) as writer:
+        if manifest:
+            settings = {
+                "mention_xpath": mention_xpath,
+                "title_xpath": title_xpath,
+                "title_sec_xpath": title_sec_xpath,
+                "date_xpath": date_xpath,
+                "standoff": standoff,
+                "blacklist_ids": sorted(blacklist_ids),
+                "streaming": streaming,
+            }
+            if projection:
+                settings["projection"] = projection.settings()
+            errors = denormalize_incremental(
+                files,
+                index_files,
+                Manifest(manifest, settings),
+                jobs=jobs,
+                blacklist_ids=blacklist_ids,
+                load=lambda: load_index_entities(
+                    index_files, entity_store, session, projection
+                ),
+                progress=tqdm.tqdm,
+                session=session,
+                writer=writer,
+                stats=stats,
+                echo=lambda x: click.echo(click.style(x, fg="green")),
+            )
+            for msg in errors:
+                print(msg)
+            if stats_file:
+                stats.write(stats_file)
+            print_xpath_profile(profile_xpath)
+            click.echo(click.style("DONE", fg="green"))
+            return
+        click.echo(
+            click.style(
+                f"collecting list of mentions from {len(files)} docs", fg="green"
             )
-            doc_ref_dict[filename].append(ref)
-    click.echo(
-        click.style(
-            f"collected {len(ref_doc_dict.keys())} of mentioned entities from {len(files)} docs",
-            fg="green",
         )
-    )
-    for x in index_files:
-        doc = TeiEnricher(x)
-        ent_nodes = doc.any_xpath(".//tei:body//*[@xml:id]")
-        for ent in ent_nodes:
-            ent_id = ent.xpath("@xml:id")[0]
-            mention = ref_doc_dict[ent_id]
-            if ent_id in blacklist_ids:
-                continue
-            ent_name = ent.tag
-            note_grp = doc.create_mention_list(mention)
-            try:
-                list(note_grp[0])
-                # TEI schema does not allow noteGrp in event after e.g. listPerson, ... so we need to insert it before
-                if ent_name == "{http://www.tei-c.org/ns/1.0}event":
-                    ent.insert(1, note_grp)
-                else:
-                    ent.append(note_grp)
-            except IndexError:
-                pass
-        doc.tree_to_file(file=x)
+        to_harvest = [x for x in files if not is_index_file(x)]
+        stats.begin("harvest", to_harvest)
+        ref_doc_dict = collect_mentions(
+            to_harvest,
+            jobs=jobs,
+            progress=tqdm.tqdm,
+            session=session,
+            mention_xpath=mention_xpath,
+            title_xpath=title_xpath,
+            title_sec_xpath=title_sec_xpath,
+            date_xpath=date_xpath,
+            streaming=streaming,
+        )
+        click.echo(
+            click.style(
+                f"collected {len(ref_doc_dict.keys())} of mentioned entities from {len(files)} docs",
+                fg="green",
+            )
+        )
+        slug_cache = {}
+        stats.begin("annotate_indices", index_files)
+        for x in index_files:
+            doc = session.get(x)
+            doc.add_mention_lists(
+                ref_doc_dict, blacklist_ids=blacklist_ids, slug_cache=slug_cache
+            )
+            writer.write(doc, x)
+        # the index entries get moved out of the index documents
+        for msg in writer.flush().values():
+            print(msg)
 
-    all_ent_nodes = {}
-    for x in index_files:
-        doc = TeiEnricher(x)
-        ent_nodes = doc.any_xpath(".//tei:body//*[@xml:id]")
-        for ent in ent_nodes:
-            all_ent_nodes[ent.xpath("@xml:id")[0]] = ent
+        stats.begin("load_entities", index_files)
+        all_ent_nodes = load_index_entities(
+            index_files, entity_store, session, projection
+        )
 
-    click.echo(
-        click.style(
-            f"writing {len(all_ent_nodes)} index entries into {len(files)} files",
-            fg="green",
+        click.echo(
+            click.style(
+                f"writing {len(all_ent_nodes)} index entries into {len(files)} files",
+                fg="green",
+            )
         )
-    )
-    for x in tqdm.tqdm(files):
-        try:
-            filename = os.path.split(x)[1]
-            doc = TeiEnricher(x)
+        stats.begin("write_editions", files)
+        errors = denormalize_files(
+            files,
+            all_ent_nodes,
+            jobs=jobs,
+            progress=tqdm.tqdm,
+            session=session,
+            writer=writer if jobs == 1 else None,
+            mention_xpath=mention_xpath,
+            standoff=standoff,
+        )
+        stats.end()
+        for x in files:
+            if errors[x]:
+                print(errors[x])
+        if stats_file:
+            stats.write(stats_file)
+        print_xpath_profile(profile_xpath)
+        click.echo(click.style("DONE", fg="green"))
 
-            if standoff:
-                root_node = doc.any_xpath("//tei:TEI")[0]
-            else:
-                root_node = doc.any_xpath(".//tei:text")[0]
-                for bad in doc.any_xpath(".//tei:back"):
-                    bad.getparent().remove(bad)
-            refs = doc.any_xpath(mention_xpath)
-            ent_dict = defaultdict(list)
-            for ref in set(refs):
-                # print(ref, type(ref))
-                if ref.startswith("#") and len(ref.split(" ")) == 1:
-                    ent_id = ref[1:]
-                elif ref.startswith("#") and len(ref.split(" ")) > 1:
-                    refs = ref.split(" ")
-                    ref = refs[0]
-                    ent_id = ref[1:]
-                    for r in refs[1:]:
-                        try:
-                            index_ent = all_ent_nodes[r[1:]]
-                            ent_dict[index_ent.tag].append(index_ent)
-                        except KeyError:
-                            continue
-                else:
-                    ent_id = ref
-                try:
-                    index_ent = all_ent_nodes[ent_id]
-                    ent_dict[index_ent.tag].append(index_ent)
-                except KeyError:
-                    continue
-            if standoff:
-                back_node = ET.Element("{http://www.tei-c.org/ns/1.0}standOff")
-            else:
-                back_node = ET.Element("{http://www.tei-c.org/ns/1.0}back")
-            for key in ent_dict.keys():
-                if key.endswith("person"):
-                    list_person = ET.Element("{http://www.tei-c.org/ns/1.0}listPerson")
-                    back_node.append(list_person)
-                    for ent in ent_dict[key]:
-                        list_person.append(ent)
-                if key.endswith("place"):
-                    list_place = ET.Element("{http://www.tei-c.org/ns/1.0}listPlace")
-                    back_node.append(list_place)
-                    for ent in ent_dict[key]:
-                        list_place.append(ent)
-                if key.endswith("org"):
-                    list_org = ET.Element("{http://www.tei-c.org/ns/1.0}listOrg")
-                    back_node.append(list_org)
-                    for ent in ent_dict[key]:
-                        list_org.append(ent)
-                if key.endswith("bibl") or key.endswith("biblStruct"):
-                    list_bibl = ET.Element("{http://www.tei-c.org/ns/1.0}listBibl")
-                    back_node.append(list_bibl)
-                    for ent in ent_dict[key]:
-                        list_bibl.append(ent)
-                if key.endswith("item"):
-                    list_item = ET.Element("{http://www.tei-c.org/ns/1.0}list")
-                    back_node.append(list_item)
-                    for ent in ent_dict[key]:
-                        list_item.append(ent)
-                if key.endswith("event"):
-                    list_eve = ET.Element("{http://www.tei-c.org/ns/1.0}listEvent")
-                    back_node.append(list_eve)
-                    for ent in ent_dict[key]:
-                        list_eve.append(ent)
-            if len(back_node) > 0:
-                if standoff:
-                    root_node.insert(1, back_node)
-                else:
-                    root_node.append(back_node)
-            doc.tree_to_file(file=x)
-        except Exception as e:
-            print(f"failed to process {x} due to {e}")
-    click.echo(click.style("DONE", fg="green"))
+
+def print_xpath_profile(limit):  # pragma: no cover
+    """prints the `limit` slowest XPath expressions and stops profiling"""
+    profile = disable_xpath_profiling()
+    if limit and profile is not None:
+        click.echo(click.style(f"{limit} slowest XPath expressions", fg="green"))
+        click.echo(profile.table(limit))
+
+
+def load_index_entities(
+    index_files, entity_store=None, session=None, projection=None
+):  # pragma: no cover
+    """returns either a dict of all index entries or, if a path is passed, an up to date `EntityStore`;\
+    both are projected with the optional `EntityProjection`"""
+    if entity_store:
+        store = EntityStore(entity_store)
+        if store.update(index_files, session=session):
+            click.echo(click.style(f"rebuilt entity store {entity_store}", fg="green"))
+        return project_entities(store, projection)
+    return project_entities(load_entities(index_files, session=session), projection)
 
 
 @click.command()  # pragma: no cover
@@ -363,68 +438,299 @@ def denormalize_indices(
 @click.option(
     "-t", "--doc-work", default="./data/indices/index_work_day.xml", show_default=True
 )  # pragma: no cover
-def schnitzler(files, indices, doc_person, doc_work):  # pragma: no cover
+@click.option(
+    "--day-index",
+    type=(str, str),
+    multiple=True,
+    help="an additional index joined by day and the name of the list element its entries are put into, e.g. --day-index ./data/indices/index_event_day.xml listEvent; can be repeated",
+)  # pragma: no cover
+@click.option(
+    "--day-xpath",
+    required=False,
+    help="XPath expression returning the day of a document, by default it is taken from file names like entry__1900-01-01.xml",
+)  # pragma: no cover
+@click.option(
+    "--item-xpath",
+    default=".//item",
+    show_default=True,
+    help="items of the day indices, their @target holds the day",
+)  # pragma: no cover
+@click.option(
+    "--ref-xpath",
+    default="./ref/text()",
+    show_default=True,
+    help="entity ids of an item of the day indices",
+)  # pragma: no cover
+@click.option(
+    "--entity-store",
+    required=False,
+    help="keep the index entries in this SQLite file, it is only rebuilt if an index file changed",
+)  # pragma: no cover
+@write_behind_option  # pragma: no cover
+@stats_option  # pragma: no cover
+@trace_memory_option  # pragma: no cover
+def schnitzler(
+    files,
+    indices,
+    doc_person,
+    doc_work,
+    day_index,
+    day_xpath,
+    item_xpath,
+    ref_xpath,
+    entity_store,
+    write_behind,
+    stats_file,
+    trace_memory,
+):  # pragma: no cover
     """Console script write pointers to mentions in index-docs"""
+    stats = RunStats("schnitzler", trace_memory)
     files = sorted(glob.glob(files))
     index_files = sorted(glob.glob(indices))
-    doc_person = TeiEnricher(doc_person)
-    doc_work = TeiEnricher(doc_work)
-    all_ent_nodes = {}
-    for x in index_files:
-        doc = TeiEnricher(x)
-        ent_nodes = doc.any_xpath(".//tei:body//*[@xml:id]")
-        for ent in ent_nodes:
-            all_ent_nodes[ent.xpath("@xml:id")[0]] = ent
+    join_day_indices = [doc_person, doc_work] + [x for x, _ in day_index]
+    stats.begin("load_day_indices", join_day_indices)
+    join_indices = [
+        (
+            build_join_index(
+                TeiEnricher(x), item_xpath=item_xpath, ref_xpath=ref_xpath
+            ),
+            f"{{http://www.tei-c.org/ns/1.0}}{list_name}",
+        )
+        for x, list_name in [(doc_person, "listPerson"), (doc_work, "listBibl")]
+        + list(day_index)
+    ]
+    stats.begin("load_entities", index_files)
+    all_ent_nodes = load_index_entities(index_files, entity_store)
+    if write_behind and isinstance(all_ent_nodes, dict):
+        # the index entries get moved into the documents, which must not happen\
+        # to a document still waiting to be written
+        all_ent_nodes = SerializedEntities(all_ent_nodes)
 
     no_matches = []
-    for x in tqdm.tqdm(files, total=len(files)):
-        day = x.split("/")[-1].replace("entry__", "").replace(".xml", "")
-        doc = TeiEnricher(x)
-        root_node = doc.any_xpath(".//tei:text")[0]
-        back_node = ET.Element("{http://www.tei-c.org/ns/1.0}back")
-        for bad in doc.any_xpath(".//tei:back"):
-            bad.getparent().remove(bad)
-
-        xpath = f".//item[@target='{day}']/ref/text()"
-        ids = doc_person.any_xpath(xpath)
-        list_person_node = ET.Element("{http://www.tei-c.org/ns/1.0}listPerson")
-        if len(ids) > 0:
-            for id in ids:
-                try:
-                    nodes = all_ent_nodes[id]
-                except KeyError:
-                    no_matches.append(id)
-                    continue
-                list_person_node.append(nodes)
-            if len(list_person_node) > 0:
-                back_node.append(list_person_node)
+    stats.begin("write_editions", files)
+    with WriteBehindQueue(workers=write_behind) as writer:
+        for x in tqdm.tqdm(files, total=len(files)):
+            doc = TeiEnricher(x)
+            if day_xpath:
+                day = doc.any_xpath(day_xpath)
+                # expressions like substring(...) return a string instead of a list
+                day = str(day[0] if isinstance(day, list) else day)
+            else:
+                day = x.split("/")[-1].replace("entry__", "").replace(".xml", "")
+            root_node = doc.any_xpath(".//tei:text")[0]
+            back_node = ET.Element("{http://www.tei-c.org/ns/1.0}back")
+            for bad in doc.any_xpath(".//tei:back"):
+                bad.getparent().remove(bad)
 
-        ids = doc_work.any_xpath(xpath)
-        list_work_node = ET.Element("{http://www.tei-c.org/ns/1.0}listBibl")
-        if len(ids) > 0:
-            for id in ids:
-                try:
-                    nodes = all_ent_nodes[id]
-                except KeyError:
-                    no_matches.append(id)
-                    continue
-                list_work_node.append(nodes)
-            if len(list_work_node) > 0:
-                back_node.append(list_work_node)
-        place_ids = doc.any_xpath('.//tei:rs[@ref and @type="place"]/@ref')
-        if len(place_ids) > 0:
-            list_place_node = ET.Element("{http://www.tei-c.org/ns/1.0}listPlace")
-            for pl in place_ids:
-                try:
-                    pl_node = all_ent_nodes[pl[1:]]
-                except KeyError:
-                    no_matches.append(pl)
-                    continue
-                list_place_node.append(pl_node)
-            if len(list_place_node) > 0:
-                back_node.append(list_place_node)
-        if len(back_node) > 0:
-            root_node.append(back_node)
-            doc.tree_to_file(file=x)
+            lists = [
+                (list_tag, [(ref, ref) for ref in join_index.get(day, [])])
+                for join_index, list_tag in join_indices
+            ]
+            place_ids = doc.any_xpath('.//tei:rs[@ref and @type="place"]/@ref')
+            lists.append(
+                (
+                    "{http://www.tei-c.org/ns/1.0}listPlace",
+                    [(ref[1:], ref) for ref in place_ids],
+                )
+            )
+            added = {}
+            for list_tag, refs in lists:
+                list_node = ET.Element(list_tag)
+                for ent_id, ref in refs:
+                    try:
+                        node = all_ent_nodes[ent_id]
+                    except KeyError:
+                        no_matches.append(ref)
+                        continue
+                    # an element of a dict moves on every append, so a repeated entity\
+                    # ends up at its last position; copies returned by an EntityStore or\
+                    # SerializedEntities are treated the same way
+                    previous = added.get(ent_id)
+                    if previous is not None and previous is not node:
+                        previous.getparent().remove(previous)
+                    added[ent_id] = node
+                    list_node.append(node)
+                if len(list_node) > 0:
+                    back_node.append(list_node)
+            if len(back_node) > 0:
+                root_node.append(back_node)
+                writer.write(doc, x)
+    stats.end()
+    for msg in writer.errors.values():
+        print(msg)
     distinct_no_match = set(no_matches)
     print(distinct_no_match)
+    if stats_file:
+        stats.write(stats_file)
+
+
+@click.command()  # pragma: no cover
+@click.option(
+    "-f", "--files", default="./editions/*.xml", show_default=True
+)  # pragma: no cover
+@click.option(
+    "-o", "--output-dir", default="./ner", show_default=True
+)  # pragma: no cover
+@click.option(
+    "-p", "--parent-nodes", default=".//tei:body//tei:p", show_default=True
+)  # pragma: no cover
+@click.option(
+    "-n", "--ne-xpath", default=".//tei:rs", show_default=True
+)  # pragma: no cover
+@click.option(
+    "--tag-map",
+    required=False,
+    help="JSON file with a mapping of TEI tags/@type values to NER labels, replaces the default NER_TAG_MAP",
+)  # pragma: no cover
+@click.option(
+    "--format",
+    "shard_format",
+    default="jsonl",
+    show_default=True,
+    type=click.Choice(SHARD_FORMATS),
+    help="'docbin' writes spaCy DocBin files and needs spaCy to be installed",
+)  # pragma: no cover
+@click.option(
+    "--shard-mb", default=64, show_default=True, type=int, help="size limit of a shard"
+)  # pragma: no cover
+@click.option(
+    "--lang",
+    default="de",
+    show_default=True,
+    help="language of the spaCy tokenizer used for the 'docbin' format",
+)  # pragma: no cover
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=int,
+    help="number of worker processes, 0 uses all cores",
+)  # pragma: no cover
+def export_ner_data(
+    files,
+    output_dir,
+    parent_nodes,
+    ne_xpath,
+    tag_map,
+    shard_format,
+    shard_mb,
+    lang,
+    jobs,
+):  # pragma: no cover
+    """Console script writing NER training data of all files into size limited shards"""
+    files = sorted(glob.glob(files))
+    ner_tag_map = NER_TAG_MAP
+    if tag_map:
+        with open(tag_map, encoding="utf-8") as f:
+            ner_tag_map = json.load(f)
+    click.echo(
+        click.style(f"extracting NER examples from {len(files)} docs", fg="green")
+    )
+    start = time.perf_counter()
+    with ShardWriter(
+        output_dir,
+        max_bytes=shard_mb * 1024 * 1024,
+        shard_format=shard_format,
+        lang=lang,
+    ) as writer:
+        errors = export_ne_offsets(
+            files,
+            writer,
+            jobs=jobs,
+            progress=tqdm.tqdm,
+            parent_nodes=parent_nodes,
+            ne_xpath=ne_xpath,
+            NER_TAG_MAP=ner_tag_map,
+        )
+    duration = time.perf_counter() - start
+    for msg in errors.values():
+        print(msg)
+    click.echo(
+        click.style(
+            f"wrote {writer.examples} examples with {writer.entities} entities into {len(writer.shards)} shards in {output_dir}",
+            fg="green",
+        )
+    )
+    click.echo(
+        click.style(
+            f"processed {len(files)} docs in {duration:.1f}s ({len(files) / max(duration, 1e-9):.1f} docs/sec)",
+            fg="green",
+        )
+    )
+
+
+@click.command()  # pragma: no cover
+@click.option(
+    "-f", "--files", default="./editions/*.xml", show_default=True
+)  # pragma: no cover
+@click.option(
+    "-o", "--output", default="./fulltext.jsonl", show_default=True
+)  # pragma: no cover
+@click.option("--id-xpath", default="./@xml:id", show_default=True)  # pragma: no cover
+@click.option(
+    "-x", "--title-xpath", default=".//tei:title/text()", show_default=True
+)  # pragma: no cover
+@click.option("-d", "--date-xpath", required=False)  # pragma: no cover
+@click.option(
+    "-t",
+    "--text-xpath",
+    default=".//tei:body",
+    show_default=True,
+    help="elements whose text is extracted",
+)  # pragma: no cover
+@click.option(
+    "-b",
+    "--blacklist",
+    multiple=True,
+    help="local name of an element whose text is left out, can be repeated",
+)  # pragma: no cover
+@click.option(
+    "--block",
+    multiple=True,
+    help=f"local name of an element surrounded by a space, can be repeated [default: {' '.join(BLOCK_ELEMENTS)}]",
+)  # pragma: no cover
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=int,
+    help="number of worker processes, 0 uses all cores",
+)  # pragma: no cover
+def export_fulltext_data(
+    files,
+    output,
+    id_xpath,
+    title_xpath,
+    date_xpath,
+    text_xpath,
+    blacklist,
+    block,
+    jobs,
+):  # pragma: no cover
+    """Console script writing id, title, date and fulltext of all files as newline delimited JSON"""
+    files = sorted(glob.glob(files))
+    click.echo(click.style(f"extracting fulltext from {len(files)} docs", fg="green"))
+    start = time.perf_counter()
+    written, errors = export_fulltext(
+        files,
+        output,
+        jobs=jobs,
+        progress=tqdm.tqdm,
+        id_xpath=id_xpath,
+        title_xpath=title_xpath,
+        date_xpath=date_xpath,
+        text_xpath=text_xpath,
+        tag_blacklist=blacklist,
+        block_elements=block or BLOCK_ELEMENTS,
+    )
+    duration = time.perf_counter() - start
+    for msg in errors.values():
+        print(msg)
+    click.echo(
+        click.style(
+            f"wrote {written} docs into {output} in {duration:.1f}s ({len(files) / max(duration, 1e-9):.1f} docs/sec)",
+            fg="green",
+        )
+    )
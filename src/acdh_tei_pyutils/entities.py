@@ -0,0 +1,658 @@
+"""Helpers to load index entries and to copy them into TEI documents"""
+
+import copy
+import os
+import sqlite3
+from collections import defaultdict
+from collections.abc import Mapping
+
+from lxml import etree as ET
+
+from acdh_tei_pyutils.manifest import entity_hash, file_hash, mentions_hash
+from acdh_tei_pyutils.mentions import harvest_mentions, is_index_file, split_refs
+from acdh_tei_pyutils.parallel import parallel_map
+from acdh_tei_pyutils.tei import XML_ID, TeiEnricher
+from acdh_tei_pyutils.writer import write_tree
+from acdh_tei_pyutils.xpath import XPATH_CACHE
+
+TEI_NS = "http://www.tei-c.org/ns/1.0"
+
+# read-only entity lookup of a worker process, see `set_worker_entities`
+_ENTITIES = None
+
+
+def load_entities(index_files: list, session=None) -> dict:
+    """parses the passed in index files and collects all entities with an @xml:id
+
+    :param index_files: a list of paths to index files like listperson.xml
+    :param session: an optional `session.TreeCache`; cached documents are used and\
+        removed from the cache, as the entities get moved into other documents
+    :return: a dict mapping @xml:id values to their elements
+    """
+    all_ent_nodes = {}
+    for x in index_files:
+        if session is not None:
+            doc = session.take(x)
+        else:
+            doc = TeiEnricher(x)
+        ent_nodes = doc.any_xpath(".//tei:body//*[@xml:id]")
+        for ent in ent_nodes:
+            all_ent_nodes[ent.get(XML_ID)] = ent
+    return all_ent_nodes
+
+
+def _entity_fragment(ent: ET.Element) -> bytes:
+    """serializes an entity without its tail
+
+    A detached copy is serialized, so the fragment only declares the namespaces the\
+    entity uses, just like the element itself when it gets moved into another document.
+    """
+    return ET.tostring(copy.deepcopy(ent), with_tail=False)
+
+
+class SerializedEntities(Mapping):
+    """a read-only, picklable mapping of @xml:id values to serialized entities
+
+    Each lookup parses the stored fragment into a new element, so workers can\
+    freely append the returned nodes to their own trees.
+    """
+
+    def __init__(self, entities: dict):
+        """
+        :param entities: a dict mapping @xml:id values to elements, e.g. from `load_entities`
+        """
+        self.fragments = {
+            key: (_entity_fragment(value), value.tail)
+            for key, value in entities.items()
+        }
+
+    def __getitem__(self, key):
+        fragment, tail = self.fragments[key]
+        node = ET.fromstring(fragment)
+        node.tail = tail
+        return node
+
+    def __iter__(self):
+        return iter(self.fragments)
+
+    def __len__(self):
+        return len(self.fragments)
+
+
+class EntityProjection:
+    """controls which children of an index entry are copied into the editions
+
+    Index entries carrying a tei:noteGrp of all their mentions would otherwise\
+    copy these mentions into every edition they are mentioned in. Element names\
+    are local names in the TEI namespace like `noteGrp` or names in Clark notation.
+    """
+
+    def __init__(self, strip=(), max_notes: int = None, keep=()):
+        """
+        :param strip: names of child elements which are removed, e.g. `noteGrp`
+        :param max_notes: keep at most this many tei:note elements in every tei:noteGrp
+        :param keep: if passed, only child elements with these names are kept
+        """
+        self.strip = frozenset(self._clark(x) for x in strip)
+        self.max_notes = max_notes
+        self.keep = frozenset(self._clark(x) for x in keep)
+
+    @staticmethod
+    def _clark(name: str) -> str:
+        return name if name.startswith("{") else f"{{{TEI_NS}}}{name}"
+
+    def settings(self) -> dict:
+        """returns the projection as a JSON serializable dict, e.g. for a `Manifest`"""
+        return {
+            "strip": sorted(self.strip),
+            "max_notes": self.max_notes,
+            "keep": sorted(self.keep),
+        }
+
+    def __bool__(self) -> bool:
+        return bool(self.strip or self.keep or self.max_notes is not None)
+
+    def __call__(self, ent: ET.Element) -> ET.Element:
+        """removes the not projected children of an entity in place
+
+        :return: the passed in entity
+        """
+        for child in list(ent):
+            if (self.keep and child.tag not in self.keep) or child.tag in self.strip:
+                ent.remove(child)
+        if self.max_notes is not None:
+            for note_grp in ent.iterchildren(f"{{{TEI_NS}}}noteGrp"):
+                for note in note_grp.findall(f"{{{TEI_NS}}}note")[self.max_notes :]:
+                    note_grp.remove(note)
+        return ent
+
+
+class ProjectedEntities(Mapping):
+    """a read-only mapping applying an `EntityProjection` to every looked up entity
+
+    Meant for mappings returning a new element on each lookup like an `EntityStore`;\
+    picklable if the wrapped mapping is.
+    """
+
+    def __init__(self, entities: Mapping, projection: EntityProjection):
+        self.entities = entities
+        self.projection = projection
+
+    def __getitem__(self, key):
+        return self.projection(self.entities[key])
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def __len__(self):
+        return len(self.entities)
+
+
+def project_entities(entities: Mapping, projection: EntityProjection) -> Mapping:
+    """applies an `EntityProjection` to all entities of a mapping
+
+    :param entities: a dict mapping @xml:id values to elements, e.g. from `load_entities`,\
+        which are changed in place, or a mapping returning new elements like an `EntityStore`
+    :param projection: an `EntityProjection`, nothing happens if it is empty or None
+    :return: the passed in dict or a `ProjectedEntities`
+    """
+    if not projection:
+        return entities
+    if isinstance(entities, dict):
+        for ent in entities.values():
+            projection(ent)
+        return entities
+    return ProjectedEntities(entities, projection)
+
+
+class EntityStore(Mapping):
+    """a persistent, SQLite backed mapping of @xml:id values to index entries
+
+    The store keeps the serialized entities together with the hashes of the index\
+    files they were read from. It is only rebuilt if an index file was added,\
+    removed or changed since the last `update`. Entities are parsed on lookup;\
+    each lookup returns a new element.
+
+    Instances can be passed to worker processes, each process opens its own connection.
+    """
+
+    # stores written by an older version of this class are rebuilt
+    VERSION = 1
+
+    def __init__(self, db_path: str, index_files: list = None):
+        """
+        :param db_path: location of the SQLite database, created if missing
+        :param index_files: if passed, `update` is called with these files
+        """
+        self.db_path = db_path
+        self._con = None
+        self._pid = None
+        if index_files is not None:
+            self.update(index_files)
+
+    @property
+    def con(self) -> sqlite3.Connection:
+        if self._con is None or self._pid != os.getpid():
+            self._con = sqlite3.connect(self.db_path)
+            self._pid = os.getpid()
+            self._con.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, sha256 TEXT);
+                CREATE TABLE IF NOT EXISTS entities (
+                    id TEXT PRIMARY KEY, fragment BLOB, tail TEXT, file TEXT
+                );
+                """
+            )
+        return self._con
+
+    def update(self, index_files: list, session=None) -> bool:
+        """(re)builds the store if the passed in index files differ from the stored ones
+
+        :param index_files: a list of paths to index files like listperson.xml
+        :param session: an optional `session.TreeCache` to read the index files from
+        :return: True if the store was rebuilt
+        """
+        hashes = {os.path.abspath(x): file_hash(x) for x in index_files}
+        stored = dict(self.con.execute("SELECT path, sha256 FROM files"))
+        version = self.con.execute("PRAGMA user_version").fetchone()[0]
+        if stored == hashes and version == self.VERSION:
+            return False
+        with self.con:
+            self.con.execute(f"PRAGMA user_version = {self.VERSION}")
+            self.con.execute("DELETE FROM files")
+            self.con.execute("DELETE FROM entities")
+            for x in index_files:
+                doc = session.get(x) if session is not None else TeiEnricher(x)
+                self.con.executemany(
+                    "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?)",
+                    (
+                        (
+                            ent.get(XML_ID),
+                            _entity_fragment(ent),
+                            ent.tail,
+                            os.path.abspath(x),
+                        )
+                        for ent in doc.any_xpath(".//tei:body//*[@xml:id]")
+                    ),
+                )
+            self.con.executemany("INSERT INTO files VALUES (?, ?)", hashes.items())
+        return True
+
+    def close(self) -> None:
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+    def __getitem__(self, key):
+        row = self.con.execute(
+            "SELECT fragment, tail FROM entities WHERE id = ?", (key,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        node = ET.fromstring(row[0])
+        node.tail = row[1]
+        return node
+
+    def __iter__(self):
+        return (x[0] for x in self.con.execute("SELECT id FROM entities"))
+
+    def __len__(self):
+        return self.con.execute("SELECT count(*) FROM entities").fetchone()[0]
+
+    def __getstate__(self):
+        return {"db_path": self.db_path}
+
+    def __setstate__(self, state):
+        self.db_path = state["db_path"]
+        self._con = None
+        self._pid = None
+
+
+def set_worker_entities(entities: Mapping) -> None:
+    """process pool initializer storing the entity lookup used by `denormalize_file`"""
+    global _ENTITIES
+    _ENTITIES = entities
+
+
+def build_join_index(
+    doc,
+    item_xpath: str = ".//item",
+    key_attribute: str = "target",
+    ref_xpath: str = "./ref/text()",
+) -> dict:
+    """maps the keys of an auxiliary index like Schnitzler's index_person_day.xml to entity ids
+
+    Such an index holds items like `<item target="1900-01-01"><ref>pmb1</ref></item>`.\
+    The document is read once, so joining a document with the index by its key is\
+    a dict lookup instead of an XPath like `.//item[@target='1900-01-01']/ref/text()`.
+
+    :param doc: a `TeiReader` (or `TeiEnricher`) of the auxiliary index
+    :param item_xpath: XPath expression returning the items
+    :param key_attribute: the name of the attribute holding an item's key
+    :param ref_xpath: XPath expression evaluated on every item, returning the entity ids
+    :return: a dict mapping keys to lists of entity ids in document order
+    """
+    refs = XPATH_CACHE.compile(ref_xpath, doc.nsmap)
+    join_index = defaultdict(list)
+    for item in doc.any_xpath(item_xpath):
+        key = item.get(key_attribute)
+        if key is not None:
+            join_index[key] += [str(x) for x in refs(item)]
+    return dict(join_index)
+
+
+def remove_nested_entities(selected: dict) -> None:
+    """removes entities from the passed in ones which are nested in another one of them
+
+    Moving the elements of a dict like the one of `load_entities` into a document moves\
+    a nested entity out of its parent. Mappings returning new elements, like\
+    `SerializedEntities` or an `EntityStore`, return the nested entity a second time\
+    inside its parent, which would duplicate its @xml:id in the document.
+
+    :param selected: a dict mapping @xml:id values to the entities to copy into a document
+    """
+    for ent in selected.values():
+        for nested in XPATH_CACHE(ent, ".//*[@xml:id]"):
+            if nested.get(XML_ID) in selected:
+                nested.getparent().remove(nested)
+
+
+def build_back_node(ent_dict: dict, standoff: bool = False) -> ET.Element:
+    """wraps entities into tei:listPerson, tei:listPlace, ... elements
+
+    :param ent_dict: a dict mapping element names (Clark notation) to lists of entities
+    :param standoff: return a tei:standOff instead of a tei:back element
+    :return: a tei:back or tei:standOff element
+    """
+    if standoff:
+        back_node = ET.Element(f"{{{TEI_NS}}}standOff")
+    else:
+        back_node = ET.Element(f"{{{TEI_NS}}}back")
+    for key in ent_dict.keys():
+        if key.endswith("person"):
+            list_person = ET.Element(f"{{{TEI_NS}}}listPerson")
+            back_node.append(list_person)
+            for ent in ent_dict[key]:
+                list_person.append(ent)
+        if key.endswith("place"):
+            list_place = ET.Element(f"{{{TEI_NS}}}listPlace")
+            back_node.append(list_place)
+            for ent in ent_dict[key]:
+                list_place.append(ent)
+        if key.endswith("org"):
+            list_org = ET.Element(f"{{{TEI_NS}}}listOrg")
+            back_node.append(list_org)
+            for ent in ent_dict[key]:
+                list_org.append(ent)
+        if key.endswith("bibl") or key.endswith("biblStruct"):
+            list_bibl = ET.Element(f"{{{TEI_NS}}}listBibl")
+            back_node.append(list_bibl)
+            for ent in ent_dict[key]:
+                list_bibl.append(ent)
+        if key.endswith("item"):
+            list_item = ET.Element(f"{{{TEI_NS}}}list")
+            back_node.append(list_item)
+            for ent in ent_dict[key]:
+                list_item.append(ent)
+        if key.endswith("event"):
+            list_eve = ET.Element(f"{{{TEI_NS}}}listEvent")
+            back_node.append(list_eve)
+            for ent in ent_dict[key]:
+                list_eve.append(ent)
+    return back_node
+
+
+def denormalize_file(
+    file_path: str,
+    mention_xpath: str = ".//tei:rs[@ref]/@ref",
+    standoff: bool = False,
+    entities: Mapping = None,
+    session=None,
+    writer=None,
+):
+    """copies all entities referenced in the passed in file into its tei:back or tei:standOff
+
+    :param file_path: path to the TEI document to process, the document gets overwritten
+    :param mention_xpath: XPath expression returning the refs of mentioned entities
+    :param standoff: write the entities into a tei:standOff instead of a tei:back element
+    :param entities: a mapping of @xml:id values to entities, defaults to the one set by\
+        `set_worker_entities`
+    :param session: an optional `session.TreeCache` holding an already parsed version\
+        of the file
+    :param writer: an optional `writer.WriteBehindQueue` the document is handed over to\
+        instead of writing it right away
+    :return: None or an error message if the file could not be processed
+    """
+    if entities is None:
+        entities = _ENTITIES
+    try:
+        if session is not None:
+            doc = session.take(file_path)
+        else:
+            doc = TeiEnricher(file_path)
+        if standoff:
+            root_node = doc.any_xpath("//tei:TEI")[0]
+        else:
+            root_node = doc.any_xpath(".//tei:text")[0]
+            for bad in doc.any_xpath(".//tei:back"):
+                bad.getparent().remove(bad)
+        ent_ids = []
+        for ref in dict.fromkeys(doc.any_xpath(mention_xpath)):
+            ent_ids += split_refs(ref)
+        selected = {}
+        for ent_id in dict.fromkeys(ent_ids):
+            try:
+                selected[ent_id] = entities[ent_id]
+            except KeyError:
+                continue
+        remove_nested_entities(selected)
+        ent_dict = defaultdict(list)
+        for index_ent in selected.values():
+            ent_dict[index_ent.tag].append(index_ent)
+        back_node = build_back_node(ent_dict, standoff=standoff)
+        if len(back_node) > 0:
+            if standoff:
+                root_node.insert(1, back_node)
+            else:
+                root_node.append(back_node)
+        if writer is not None:
+            writer.write(doc, file_path)
+        else:
+            write_tree(doc.tree, file_path)
+    except Exception as e:
+        return f"failed to process {file_path} due to {e}"
+    return None
+
+
+def denormalize_files(
+    files: list,
+    entities: dict,
+    jobs: int = 1,
+    progress=None,
+    session=None,
+    writer=None,
+    **kwargs,
+) -> dict:
+    """runs `denormalize_file` for all passed in files, optionally in worker processes
+
+    :param files: a list of file paths
+    :param entities: a dict mapping @xml:id values to elements, e.g. from `load_entities`,\
+        or a picklable mapping returning new elements like an `EntityStore`
+    :param jobs: number of worker processes, `1` runs in process, `0` uses all cores
+    :param progress: an optional callable wrapping the results iterator, e.g. `tqdm.tqdm`
+    :param session: an optional `session.TreeCache`, only used when running in process;\
+        cached files are processed first
+    :param writer: an optional `writer.WriteBehindQueue`, only used when running in\
+        process; all files are written when this function returns
+    :param kwargs: passed on to `denormalize_file`
+    :return: a dict mapping the file paths to None or an error message
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if len(files) < 2:
+        # `parallel_map` would run in process without calling the initializer
+        jobs = 1
+    if jobs == 1:
+        if session is not None:
+            files = [x for x in files if x in session] + [
+                x for x in files if x not in session
+            ]
+        if writer is not None and writer.workers and isinstance(entities, dict):
+            # the elements of a dict get moved into the documents, which must not\
+            # happen to a document still waiting to be written
+            entities = SerializedEntities(entities)
+        results = parallel_map(
+            denormalize_file,
+            files,
+            entities=entities,
+            session=session,
+            writer=writer,
+            **kwargs,
+        )
+    else:
+        results = parallel_map(
+            denormalize_file,
+            files,
+            jobs=jobs,
+            initializer=set_worker_entities,
+            initargs=(
+                SerializedEntities(entities)
+                if isinstance(entities, dict)
+                else entities,
+            ),
+            **kwargs,
+        )
+    if progress is not None:
+        results = progress(results, total=len(files))
+    results = dict(zip(files, results))
+    if writer is not None and jobs == 1:
+        errors = writer.flush()
+        for x in files:
+            if x in errors:
+                results[x] = errors[x]
+    return results
+
+
+def denormalize_incremental(
+    files: list,
+    index_files: list,
+    manifest,
+    jobs: int = 1,
+    blacklist_ids=(),
+    load=None,
+    progress=None,
+    session=None,
+    writer=None,
+    stats=None,
+    echo=None,
+) -> list:
+    """like `denormalize-indices` annotates the index files with the mentions of the\
+    files and copies the index entries into the files, but only processes what changed\
+    since the run recorded in `manifest`
+
+    Only new or changed files are harvested. Only index entries whose mentions changed\
+    get new mention lists and only files which changed or mention a changed index entry\
+    are written. The manifest is saved at the end.
+
+    :param files: a list of file paths, matched index files are processed like the files
+    :param index_files: a list of paths to index files like listperson.xml
+    :param manifest: a `manifest.Manifest`, its settings hold the XPaths used, the\
+        blacklisted ids and `standoff`
+    :param jobs: number of worker processes, `1` runs in process, `0` uses all cores
+    :param blacklist_ids: ids of index entries which get no mention lists
+    :param load: an optional callable returning the entities to copy into the files,\
+        e.g. an `EntityStore`; only called if files need to be written, defaults to\
+        `load_entities` of the index files
+    :param progress: an optional callable wrapping the results iterators, e.g. `tqdm.tqdm`
+    :param session: an optional `session.TreeCache`, only used when running in process
+    :param writer: an optional `writer.WriteBehindQueue`
+    :param stats: an optional `stats.RunStats` the phases are reported to
+    :param echo: an optional callable receiving progress messages
+    :return: a list of error messages
+    """
+    if load is None:
+
+        def load():
+            return load_entities(index_files, session=session)
+
+    messages = []
+    settings = manifest.settings
+    manifest.editions = {k: v for k, v in manifest.editions.items() if k in files}
+    changed_files = manifest.changed_files(files, manifest.editions)
+    to_harvest = [x for x in changed_files if not is_index_file(x)]
+    if echo is not None:
+        echo(f"collecting list of mentions from {len(to_harvest)} new or changed docs")
+    if stats is not None:
+        stats.begin("harvest", to_harvest)
+    results = parallel_map(
+        harvest_mentions,
+        to_harvest,
+        jobs=jobs,
+        mention_xpath=settings["mention_xpath"],
+        title_xpath=settings["title_xpath"],
+        title_sec_xpath=settings["title_sec_xpath"],
+        date_xpath=settings["date_xpath"],
+        streaming=settings["streaming"],
+        session=session if jobs == 1 else None,
+    )
+    if progress is not None:
+        results = progress(results, total=len(to_harvest))
+    for x, result in zip(to_harvest, results):
+        doc_dict, mentioned, errors = result
+        messages += errors
+        manifest.editions[x] = {"sha256": None, "doc": doc_dict, "refs": mentioned}
+    for x in changed_files:
+        if is_index_file(x):
+            manifest.editions[x] = {"sha256": None, "doc": None, "refs": []}
+    ref_doc_dict = manifest.ref_doc_dict(files)
+
+    changed_entities = set()
+    written_indices = set()
+    slug_cache = {}
+    if stats is not None:
+        stats.begin("annotate_indices", index_files)
+    for x in list(manifest.indices):
+        if x not in index_files:
+            changed_entities.update(manifest.indices.pop(x)["entities"])
+    for x in index_files:
+        record = manifest.indices.get(x)
+        if record is None or record["sha256"] != file_hash(x):
+            ent_ids = None
+        else:
+            ent_ids = {
+                key
+                for key, value in record["entities"].items()
+                if mentions_hash(ref_doc_dict.get(key, [])) != value[0]
+            }
+            if not ent_ids:
+                continue
+        doc = session.get(x) if session is not None else TeiEnricher(x)
+        doc.add_mention_lists(
+            ref_doc_dict,
+            blacklist_ids=blacklist_ids,
+            ent_ids=ent_ids,
+            replace=True,
+            slug_cache=slug_cache,
+        )
+        old_entities = record["entities"] if record else {}
+        entities = {}
+        for ent in doc.any_xpath(".//tei:body//*[@xml:id]"):
+            ent_id = ent.get(XML_ID)
+            entities[ent_id] = [
+                mentions_hash(ref_doc_dict.get(ent_id, [])),
+                entity_hash(ent),
+            ]
+            if old_entities.get(ent_id, [None, None])[1] != entities[ent_id][1]:
+                changed_entities.add(ent_id)
+        changed_entities.update(set(old_entities) - set(entities))
+        if writer is not None:
+            writer.write(doc, x)
+        else:
+            write_tree(doc.tree, x)
+        written_indices.add(x)
+        manifest.indices[x] = {"sha256": None, "entities": entities}
+
+    to_write = [
+        x
+        for x in files
+        if x in changed_files
+        or changed_entities.intersection(manifest.editions[x]["refs"])
+        or (is_index_file(x) and changed_entities)
+    ]
+    if echo is not None:
+        echo(
+            f"{len(changed_entities)} changed index entries, writing {len(to_write)} files"
+        )
+    if writer is not None:
+        for x, error in writer.flush().items():
+            messages.append(error)
+            written_indices.discard(x)
+    if to_write:
+        if stats is not None:
+            stats.begin("load_entities", index_files)
+        all_ent_nodes = load()
+        if stats is not None:
+            stats.begin("write_editions", to_write)
+        errors = denormalize_files(
+            to_write,
+            all_ent_nodes,
+            jobs=jobs,
+            progress=progress,
+            session=session,
+            writer=writer if jobs == 1 else None,
+            mention_xpath=settings["mention_xpath"],
+            standoff=settings["standoff"],
+        )
+        for x, error in errors.items():
+            if error:
+                messages.append(error)
+                continue
+            manifest.editions[x]["sha256"] = file_hash(x)
+            if x in manifest.indices:
+                written_indices.add(x)
+    if stats is not None:
+        stats.end()
+    for x in written_indices:
+        manifest.indices[x]["sha256"] = file_hash(x)
+    manifest.save()
+    return messages
@@ -0,0 +1,210 @@
+"""A non-recursive engine extracting the fulltext of (TEI) elements"""
+
+import json
+import os
+
+from lxml import etree as ET
+
+from acdh_tei_pyutils.parallel import parallel_map
+from acdh_tei_pyutils.tei import TeiReader
+
+SKIP = 1
+BLOCK = 2
+SPACE = 4
+
+
+class FulltextExtractor:
+    """extracts the normalized text of an element and its descendants
+
+    The element tree is walked with `lxml.etree.iterwalk` instead of recursion, so\
+    the depth of a document is not limited by Python's recursion limit. An instance\
+    can be reused for any number of documents; the element names passed in are\
+    turned into sets once and the classification of every tag is cached.
+    """
+
+    def __init__(
+        self,
+        tag_blacklist=(),
+        block_elements=(),
+        space_elements=(),
+        local_names: bool = False,
+    ):
+        """
+        :param tag_blacklist: names of elements whose text (but not tail) is left out
+        :param block_elements: names of elements surrounded by a space, e.g. tei:p
+        :param space_elements: names of elements like tei:space which are replaced by a\
+            space if their @unit is 'chars'; their content is left out
+        :param local_names: if False, names are compared with the tags in Clark notation,\
+            e.g. '{http://www.tei-c.org/ns/1.0}abbr', otherwise only with the local name\
+            of an element in any namespace, e.g. 'abbr'
+        """
+        self.tag_blacklist = frozenset(tag_blacklist)
+        self.block_elements = frozenset(block_elements)
+        self.space_elements = frozenset(space_elements)
+        self.local_names = local_names
+        self._kinds = {}
+
+    def _kind(self, tag) -> int:
+        """returns the SKIP, BLOCK and SPACE flags of a tag"""
+        try:
+            return self._kinds[tag]
+        except KeyError:
+            pass
+        kind = 0
+        # comments and processing instructions have a function as tag
+        if isinstance(tag, str):
+            name = tag.rsplit("}", 1)[-1] if self.local_names else tag
+            if name in self.space_elements:
+                kind |= SPACE
+            if name in self.block_elements:
+                kind |= BLOCK
+            if name in self.tag_blacklist:
+                kind |= SKIP
+        self._kinds[tag] = kind
+        return kind
+
+    def text_parts(self, root_node: ET.Element) -> list:
+        """returns the not normalized text chunks of the passed in element in document order"""
+        if self._kind(root_node.tag) & SKIP:
+            return []
+        kinds = self._kinds
+        parts = []
+        append = parts.append
+        walker = ET.iterwalk(root_node, events=("start", "end", "comment", "pi"))
+        for event, el in walker:
+            if event == "start":
+                kind = kinds.get(el.tag)
+                if kind is None:
+                    kind = self._kind(el.tag)
+                if kind and el is not root_node:
+                    if kind & SPACE:
+                        if el.get("unit", "") == "chars":
+                            append(" ")
+                        walker.skip_subtree()
+                        continue
+                    if kind & BLOCK:
+                        append(" ")
+                    if kind & SKIP:
+                        walker.skip_subtree()
+                        continue
+                text = el.text
+                if text:
+                    append(text)
+            elif event == "end":
+                if el is root_node:
+                    break
+                kind = kinds[el.tag]
+                if kind & BLOCK and not kind & SPACE:
+                    append(" ")
+                tail = el.tail
+                if tail:
+                    append(tail)
+            else:
+                # like the former recursive implementations the text of comments and
+                # processing instructions is kept
+                if el.text:
+                    append(el.text)
+                if el.tail:
+                    append(el.tail)
+        return parts
+
+    def extract(self, root_node: ET.Element) -> str:
+        """returns the text of the passed in element with whitespace normalized
+
+        :param root_node: an lxml element, its tail is not part of the result
+        :return: the text with whitespace collapsed into single spaces and stripped
+        """
+        return " ".join("".join(self.text_parts(root_node)).split())
+
+    __call__ = extract
+
+
+BLOCK_ELEMENTS = ("p", "salute", "dateline", "closer", "seg", "opener", "div", "head")
+
+
+def file_fulltext(
+    file_path: str,
+    id_xpath: str = "./@xml:id",
+    title_xpath: str = ".//tei:title/text()",
+    date_xpath: str = None,
+    text_xpath: str = ".//tei:body",
+    tag_blacklist=(),
+    block_elements=BLOCK_ELEMENTS,
+) -> tuple[dict, str]:
+    """parses a single document and extracts its metadata and fulltext for a search index
+
+    The names in `tag_blacklist` and `block_elements` are local names like in\
+    `utils.extract_fulltext_with_spacing`, `tei:space` elements are replaced by a space.
+
+    :param file_path: path to a TEI document
+    :param id_xpath: XPath expression returning the id of the document, defaults to the\
+        name of the file without extension if nothing matches
+    :param title_xpath: XPath expression returning the document's title
+    :param date_xpath: XPath expression returning the document's date
+    :param text_xpath: XPath expression returning the elements whose text is indexed
+    :param tag_blacklist: names of elements whose text is left out
+    :param block_elements: names of elements surrounded by a space
+    :return: a tuple of (dict with the keys `id`, `title`, `date`, `file` and `fulltext`,\
+        None or an error message)
+    """
+    try:
+        doc = TeiReader(file_path)
+
+        def first(xpath):
+            if not xpath:
+                return None
+            result = doc.any_xpath(xpath)
+            return str(result[0]) if result else None
+
+        doc_id = first(id_xpath)
+        if doc_id is None:
+            doc_id = os.path.splitext(os.path.basename(file_path))[0]
+        extractor = FulltextExtractor(
+            tag_blacklist, block_elements, ("space",), local_names=True
+        )
+        fulltext = " ".join(
+            x for x in (extractor(node) for node in doc.any_xpath(text_xpath)) if x
+        )
+        doc_dict = {
+            "id": doc_id,
+            "title": first(title_xpath),
+            "date": first(date_xpath),
+            "file": file_path,
+            "fulltext": fulltext,
+        }
+    except Exception as e:
+        return {}, f"failed to process {file_path} due to {e}"
+    return doc_dict, None
+
+
+def export_fulltext(
+    files: list, output_file: str, jobs: int = 1, progress=None, **kwargs
+) -> tuple[int, dict]:
+    """writes the fulltext documents of all passed in files as newline delimited JSON
+
+    The files are processed in worker processes and every document is written as\
+    soon as it arrives in the order of the passed in files, so only the documents\
+    not yet written are kept in memory.
+
+    :param files: a list of file paths
+    :param output_file: path of the NDJSON file, directories are created if missing
+    :param jobs: number of worker processes, `1` runs in process, `0` uses all cores
+    :param progress: an optional callable wrapping the results iterator, e.g. `tqdm.tqdm`
+    :param kwargs: passed on to `file_fulltext`
+    :return: a tuple of (number of written documents, dict mapping the file paths which\
+        could not be processed to error messages)
+    """
+    results = parallel_map(file_fulltext, files, jobs=jobs, **kwargs)
+    if progress is not None:
+        results = progress(results, total=len(files))
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    written = 0
+    errors = {}
+    with open(output_file, "w", encoding="utf-8") as f:
+        for (doc_dict, error), file_path in zip(results, files):
+            if error is not None:
+                errors[file_path] = error
+                continue
+            f.write(json.dumps(doc_dict, ensure_ascii=False) + "\n")
+            written += 1
+    return written, errors
@@ -0,0 +1,110 @@
+"""A manifest of content hashes and harvested mentions used for incremental runs"""
+
+import hashlib
+import json
+import os
+
+from lxml import etree as ET
+
+from acdh_tei_pyutils.mentions import MentionIndex
+
+MANIFEST_VERSION = 1
+
+
+def file_hash(file_path: str) -> str:
+    """returns the sha256 hex digest of the content of the passed in file"""
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def entity_hash(ent: ET.Element) -> str:
+    """returns a hash of the serialized entity, i.e. of what gets copied into the editions"""
+    return hashlib.sha256(ET.tostring(ent)).hexdigest()
+
+
+def mentions_hash(mentions: list) -> str:
+    """returns a hash of a list of doc-dicts as used to create an entity's tei:noteGrp"""
+    values = [
+        [x["doc_id"], x["doc_title"], x["doc_title_sec"], x["doc_date"]]
+        for x in mentions
+    ]
+    return hashlib.sha256(json.dumps(values).encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    """stores what a previous `denormalize-indices` run read and wrote
+
+    For every edition the manifest records the hash of the file as written, its\
+    doc-dict and the ids it mentions. For every index file it records the hash\
+    of the file as written and per entity the hash of its mentions and of the\
+    entity itself.
+    """
+
+    def __init__(self, path: str, settings: dict):
+        """loads the manifest from `path`; a missing manifest or one written with\
+        different settings is treated as empty
+
+        :param path: location of the manifest (JSON) file
+        :param settings: all options which influence the output, e.g. the used XPaths
+        """
+        self.path = path
+        self.settings = settings
+        self.editions = {}
+        self.indices = {}
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if (
+                data.get("version") == MANIFEST_VERSION
+                and data.get("settings") == settings
+            ):
+                self.editions = data["editions"]
+                self.indices = data["indices"]
+
+    def save(self) -> str:
+        """writes the manifest to a temporary file and moves it into place
+
+        :return: the location of the manifest
+        """
+        data = {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "editions": self.editions,
+            "indices": self.indices,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        return self.path
+
+    def changed_files(self, files: list, records: dict) -> list:
+        """returns those of the passed in files whose content differs from the recorded hash
+
+        :param files: a list of file paths
+        :param records: either `self.editions` or `self.indices`
+        :return: a list of new or changed files
+        """
+        changed = []
+        for x in files:
+            try:
+                recorded = records[x]["sha256"]
+            except KeyError:
+                recorded = None
+            if recorded is None or recorded != file_hash(x):
+                changed.append(x)
+        return changed
+
+    def ref_doc_dict(self, files: list) -> MentionIndex:
+        """rebuilds the dict of entity-id -> list of doc-dicts from the recorded editions
+
+        :param files: the edition files in processing order
+        :return: a `mentions.MentionIndex` like the one returned by `mentions.collect_mentions`
+        """
+        ref_doc_dict = MentionIndex()
+        for x in files:
+            record = self.editions.get(x)
+            if record is None or record["doc"] is None:
+                continue
+            ref_doc_dict.add(record["doc"], record["refs"])
+        return ref_doc_dict
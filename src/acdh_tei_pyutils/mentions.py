@@ -0,0 +1,356 @@
+"""Helpers to collect mentions of index entries from TEI documents"""
+
+import os
+import re
+from array import array
+from collections.abc import Mapping, Sequence
+
+from acdh_xml_pyutils.xml import NSMAP
+from lxml import etree as ET
+
+from acdh_tei_pyutils.parallel import parallel_map
+from acdh_tei_pyutils.tei import TeiReader
+from acdh_tei_pyutils.xpath import cached_xpath
+
+NS_TEI = {"tei": "http://www.tei-c.org/ns/1.0"}
+TEI_HEADER = "{http://www.tei-c.org/ns/1.0}teiHeader"
+NAME = r"[A-Za-z_][\w.-]*(?::[A-Za-z_][\w.-]*)?"
+MENTION_XPATH_PATTERN = re.compile(
+    rf"^(?:\.)?//(\*|{NAME})(?:\[@({NAME})\])?/@({NAME})$"
+)
+
+
+def split_refs(ref: str, multi_refs: bool = True) -> list:
+    """normalizes a (mention-)ref value into a list of entity ids
+
+    A single `#some_id` is returned without the leading `#`, values like\
+    `#id_1 #id_2` are split into their parts if `multi_refs` is True.
+
+    :param ref: the value of e.g. tei:rs/@ref
+    :param multi_refs: split whitespace separated lists of `#`-prefixed refs
+    :return: a list of entity ids, the first ref last
+    """
+    if not multi_refs:
+        if ref.startswith("#"):
+            return [ref[1:]]
+        return [ref]
+    parts = ref.split(" ")
+    if ref.startswith("#") and len(parts) == 1:
+        return [ref[1:]]
+    if ref.startswith("#") and len(parts) > 1:
+        return [r[1:] for r in parts[1:]] + [parts[0][1:]]
+    return [ref]
+
+
+def describe_doc(
+    xpath,
+    doc_id: str,
+    title_xpath: str,
+    title_sec_xpath: str = None,
+    date_xpath: str = None,
+    strict: bool = False,
+) -> tuple[dict, list]:
+    """evaluates the title and date XPaths of a document
+
+    :param xpath: a callable evaluating an XPath expression against the document
+    :param doc_id: the @xml:id of the document, used in error messages
+    :return: a tuple of (dict with the keys `doc_title`, `doc_title_sec`, `doc_date`,\
+        list of error messages)
+    """
+    errors = []
+    try:
+        doc_title = str(xpath(title_xpath)[0])
+    except IndexError:
+        if strict:
+            raise
+        doc_title = f"ERROR in title xpath of file: {doc_id}"
+        errors.append(f"ERROR in -x title xpath of file: {doc_id}")
+    if title_sec_xpath:
+        try:
+            doc_title_sec = str(xpath(title_sec_xpath)[0])
+        except IndexError:
+            doc_title_sec = f"ERROR in -xs secondary title xpath of file: {doc_id}"
+            errors.append(f"ERROR in secondary title xpath of file: {doc_id}")
+    else:
+        doc_title_sec = None
+    if date_xpath:
+        try:
+            doc_date = str(xpath(date_xpath)[0])
+        except IndexError:
+            doc_date = f"ERROR in date xpath of file: {doc_id}"
+            errors.append(f"ERROR in -d date xpath of file: {doc_id}")
+    else:
+        doc_date = None
+    values = {
+        "doc_title": doc_title,
+        "doc_title_sec": doc_title_sec,
+        "doc_date": doc_date,
+    }
+    return values, errors
+
+
+def harvest_mentions(
+    file_path: str,
+    mention_xpath: str = ".//tei:rs[@ref]/@ref",
+    title_xpath: str = ".//tei:title/text()",
+    title_sec_xpath: str = None,
+    date_xpath: str = None,
+    multi_refs: bool = True,
+    strict: bool = False,
+    session=None,
+    streaming: bool = False,
+) -> tuple[dict, list, list]:
+    """parses a single document and extracts its metadata and the ids it refers to
+
+    The returned values are plain python objects so they can be cheaply sent back\
+    from a worker process.
+
+    :param file_path: path to a TEI document with @xml:base and @xml:id on its root
+    :param mention_xpath: XPath expression returning the refs of mentioned entities
+    :param title_xpath: XPath expression returning the document's title
+    :param title_sec_xpath: XPath expression returning a secondary title
+    :param date_xpath: XPath expression returning the document's date
+    :param multi_refs: split `#id_1 #id_2` like refs into single ids
+    :param strict: raise an IndexError if the title can't be found instead of reporting it
+    :param session: an optional `session.TreeCache` to read the document from and keep it in
+    :param streaming: use `harvest_mentions_streaming` instead of parsing the whole document
+    :return: a tuple of (doc-dict, list of mentioned ids, list of error messages)
+    """
+    if streaming:
+        return harvest_mentions_streaming(
+            file_path,
+            mention_xpath=mention_xpath,
+            title_xpath=title_xpath,
+            title_sec_xpath=title_sec_xpath,
+            date_xpath=date_xpath,
+            multi_refs=multi_refs,
+            strict=strict,
+        )
+    if session is not None:
+        doc = session.get(file_path)
+    else:
+        doc = TeiReader(file_path)
+    doc_base = str(doc.any_xpath("./@xml:base")[0])
+    doc_id = str(doc.any_xpath("./@xml:id")[0])
+    values, errors = describe_doc(
+        doc.any_xpath, doc_id, title_xpath, title_sec_xpath, date_xpath, strict
+    )
+    mentioned = []
+    # dict.fromkeys instead of set to keep the results independent of hash seeds
+    for ref in dict.fromkeys(str(x) for x in doc.any_xpath(mention_xpath)):
+        mentioned += split_refs(ref, multi_refs=multi_refs)
+    doc_dict = {
+        "doc_uri": f"{doc_base}/{doc_id}",
+        "doc_id": doc_id,
+        "doc_path": file_path,
+        **values,
+    }
+    return doc_dict, mentioned, errors
+
+
+def _clark(name: str) -> str:
+    """turns a prefixed name like `tei:rs` or `xml:id` into Clark notation"""
+    if ":" not in name:
+        return name
+    prefix, local_name = name.split(":", 1)
+    return f"{{{NSMAP[prefix]}}}{local_name}"
+
+
+def streaming_pattern(mention_xpath: str) -> tuple:
+    """translates a simple mention XPath into a pattern usable while streaming a document
+
+    Supported are expressions like `.//tei:rs[@ref]/@ref`, `//tei:persName/@ref` or\
+    `.//*[@key]/@key`, i.e. an element name (or `*`), an optional `[@attribute]`\
+    predicate and the attribute to return.
+
+    :param mention_xpath: the XPath expression
+    :raises: `ValueError` if the expression can't be translated
+    :return: a tuple of (element name or None, required attribute or None, attribute),\
+        all names in Clark notation
+    """
+    match = MENTION_XPATH_PATTERN.match(mention_xpath.strip())
+    if match is None:
+        raise ValueError(
+            f"streaming mode only supports mention XPaths like './/tei:rs[@ref]/@ref', got: {mention_xpath}"
+        )
+    tag, condition, attr = match.groups()
+    try:
+        return (
+            None if tag == "*" else _clark(tag),
+            _clark(condition) if condition else None,
+            _clark(attr),
+        )
+    except KeyError as e:
+        raise ValueError(f"unknown namespace prefix {e} in: {mention_xpath}") from e
+
+
+def harvest_mentions_streaming(
+    file_path: str,
+    mention_xpath: str = ".//tei:rs[@ref]/@ref",
+    title_xpath: str = ".//tei:title/text()",
+    title_sec_xpath: str = None,
+    date_xpath: str = None,
+    multi_refs: bool = True,
+    strict: bool = False,
+) -> tuple[dict, list, list]:
+    """like `harvest_mentions` but reads the document with `lxml.etree.iterparse`
+
+    Elements are discarded as soon as they are read, so memory usage does not grow\
+    with the size of the document. The mention XPath is restricted to the forms\
+    described in `streaming_pattern`. The title and date XPaths are evaluated as\
+    soon as the tei:teiHeader is read, i.e. they have to point into the header.
+
+    :return: a tuple of (doc-dict, list of mentioned ids, list of error messages)
+    """
+    tag, condition, attr = streaming_pattern(mention_xpath)
+    root = None
+    in_header = False
+    values = None
+    refs = []
+    for event, elem in ET.iterparse(file_path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+                doc_base = str(cached_xpath(root, "./@xml:base")[0])
+                doc_id = str(cached_xpath(root, "./@xml:id")[0])
+                continue
+            if elem.tag == TEI_HEADER:
+                in_header = True
+            if (tag is None or elem.tag == tag) and (
+                condition is None or condition in elem.attrib
+            ):
+                value = elem.get(attr)
+                if value is not None:
+                    refs.append(value)
+            continue
+        if elem.tag == TEI_HEADER and values is None:
+            in_header = False
+            values, errors = describe_doc(
+                lambda x, root=root: cached_xpath(root, x, NS_TEI),
+                doc_id,
+                title_xpath,
+                title_sec_xpath,
+                date_xpath,
+                strict,
+            )
+        if in_header or elem is root:
+            continue
+        elem.clear(keep_tail=True)
+        parent = elem.getparent()
+        while elem.getprevious() is not None:
+            del parent[0]
+    if values is None:
+        values, errors = describe_doc(
+            lambda x: cached_xpath(root, x, NS_TEI),
+            doc_id,
+            title_xpath,
+            title_sec_xpath,
+            date_xpath,
+            strict,
+        )
+    mentioned = []
+    for ref in dict.fromkeys(refs):
+        mentioned += split_refs(ref, multi_refs=multi_refs)
+    doc_dict = {
+        "doc_uri": f"{doc_base}/{doc_id}",
+        "doc_id": doc_id,
+        "doc_path": file_path,
+        **values,
+    }
+    return doc_dict, mentioned, errors
+
+
+class Mentions(Sequence):
+    """the doc-dicts of the documents mentioning an entity, see `MentionIndex`"""
+
+    __slots__ = ("docs", "positions")
+
+    def __init__(self, docs: list, positions: array):
+        self.docs = docs
+        self.positions = positions
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.docs[x] for x in self.positions[i]]
+        return self.docs[self.positions[i]]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class MentionIndex(Mapping):
+    """a read-only mapping of entity ids to the docs mentioning them
+
+    Every document is stored once in the `docs` table, an entity only keeps the\
+    positions of its documents in this table in an `array`. Looking up an entity\
+    returns a `Mentions` sequence of doc-dicts, so the index can be used wherever\
+    a dict of entity-id -> list of doc-dicts is expected, e.g. by\
+    `TeiEnricher.add_mention_lists`.
+    """
+
+    def __init__(self):
+        self.docs = []
+        self._positions = {}
+
+    def add(self, doc_dict: dict, mentioned: list) -> None:
+        """adds a document and the ids of the entities it mentions
+
+        :param doc_dict: the doc-dict as returned by `harvest_mentions`
+        :param mentioned: a list of entity ids, an id may occur more than once
+        """
+        if not mentioned:
+            return
+        position = len(self.docs)
+        self.docs.append(doc_dict)
+        for ent_id in mentioned:
+            try:
+                self._positions[ent_id].append(position)
+            except KeyError:
+                self._positions[ent_id] = array("I", (position,))
+
+    def __getitem__(self, ent_id) -> Mentions:
+        return Mentions(self.docs, self._positions[ent_id])
+
+    def __iter__(self):
+        return iter(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
+
+
+def collect_mentions(
+    files: list, jobs: int = 1, progress=None, session=None, **kwargs
+) -> MentionIndex:
+    """harvests the mentions of all passed in files into a mapping of entity-id -> doc-dicts
+
+    :param files: a list of file paths
+    :param jobs: number of worker processes, `1` runs in process, `0` uses all cores
+    :param progress: an optional callable wrapping the results iterator, e.g. `tqdm.tqdm`
+    :param session: an optional `session.TreeCache`, only used when running in process
+    :param kwargs: passed on to `harvest_mentions`
+    :return: a `MentionIndex` mapping entity ids to the docs mentioning them
+    """
+    ref_doc_dict = MentionIndex()
+    if jobs == 1:
+        kwargs["session"] = session
+    results = parallel_map(harvest_mentions, files, jobs=jobs, **kwargs)
+    if progress is not None:
+        results = progress(results, total=len(files))
+    for doc_dict, mentioned, errors in results:
+        for msg in errors:
+            print(msg)
+        ref_doc_dict.add(doc_dict, mentioned)
+    return ref_doc_dict
+
+
+def is_index_file(file_path: str) -> bool:
+    """checks if the file name of the passed in path looks like an index file (e.g. listperson.xml)"""
+    return "list" in os.path.split(file_path)[1]
@@ -0,0 +1,193 @@
+"""Export of NER training data from a corpus of TEI documents"""
+
+import json
+import os
+
+from acdh_tei_pyutils.parallel import parallel_map
+from acdh_tei_pyutils.tei import NER_TAG_MAP, TeiReader
+
+SHARD_FORMATS = ("jsonl", "docbin")
+# jsonl lines are collected up to this size before they are appended to the shard
+LINES_BUFFER_BYTES = 1024 * 1024
+
+
+def file_ne_offsets(
+    file_path: str,
+    parent_nodes: str = ".//tei:body//tei:p",
+    ne_xpath: str = ".//tei:rs",
+    NER_TAG_MAP: dict = NER_TAG_MAP,
+    skip_empty: bool = True,
+) -> tuple[list, str]:
+    """runs `TeiReader.iter_ne_offsets` on a single file
+
+    :param file_path: path to a TEI document
+    :param skip_empty: leave out parent nodes without any text
+    :return: a tuple of (list of spacy-like NER tuples, None or an error message)
+    """
+    try:
+        doc = TeiReader(file_path)
+        examples = [
+            x
+            for x in doc.iter_ne_offsets(parent_nodes, ne_xpath, NER_TAG_MAP)
+            if x[0] or not skip_empty
+        ]
+    except Exception as e:
+        return [], f"failed to process {file_path} due to {e}"
+    return examples, None
+
+
+class ShardWriter:
+    """writes NER examples into numbered shards of limited size
+
+    Shards are named `{prefix}-00000.jsonl`, `{prefix}-00001.jsonl`, ... A new shard\
+    is started as soon as the current one exceeds `max_bytes`. In the `jsonl` format\
+    every line holds `{"text": ..., "entities": [[start, end, label], ...], "file": ...}`.\
+    The `docbin` format writes `spacy.tokens.DocBin` files (`.spacy`) instead and needs\
+    spaCy to be installed; the size of those shards is estimated from their JSONL size.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        prefix: str = "ner",
+        max_bytes: int = 64 * 1024 * 1024,
+        shard_format: str = "jsonl",
+        lang: str = "de",
+    ):
+        """
+        :param output_dir: directory the shards are written to, created if missing
+        :param prefix: file name prefix of the shards
+        :param max_bytes: size limit of a shard
+        :param shard_format: `jsonl` or `docbin`
+        :param lang: language of the blank spaCy pipeline used to tokenize `docbin` examples
+        """
+        if shard_format not in SHARD_FORMATS:
+            raise ValueError(f"unknown shard format: {shard_format}")
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.shard_format = shard_format
+        self.shards = []
+        self.examples = 0
+        self.entities = 0
+        self._lines = None
+        self._buffered = 0
+        self._size = 0
+        self._nlp = None
+        self._doc_bin = None
+        if shard_format == "docbin":
+            import spacy
+
+            self._nlp = spacy.blank(lang)
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _open_shard(self) -> None:
+        ext = "jsonl" if self.shard_format == "jsonl" else "spacy"
+        path = os.path.join(
+            self.output_dir, f"{self.prefix}-{len(self.shards):05}.{ext}"
+        )
+        self.shards.append(path)
+        self._size = 0
+        if self.shard_format == "jsonl":
+            with open(path, "w", encoding="utf-8"):
+                pass
+            self._lines = []
+            self._buffered = 0
+        else:
+            from spacy.tokens import DocBin
+
+            self._doc_bin = DocBin(store_user_data=True)
+
+    def _close_shard(self) -> None:
+        if self._lines is not None:
+            self._flush_lines()
+            self._lines = None
+        if self._doc_bin is not None:
+            self._doc_bin.to_disk(self.shards[-1])
+            self._doc_bin = None
+
+    def _flush_lines(self) -> None:
+        with open(self.shards[-1], "a", encoding="utf-8") as f:
+            f.writelines(self._lines)
+        self._lines.clear()
+        self._buffered = 0
+
+    def write(self, example: tuple, file_path: str = None) -> None:
+        """adds a spacy-like NER tuple like ('Wien', {'entities': [(0, 4, 'LOC')]})
+
+        :param file_path: the source of the example, stored alongside it
+        """
+        text, annotations = example
+        entities = [list(x) for x in annotations["entities"]]
+        line = json.dumps(
+            {"text": text, "entities": entities, "file": file_path},
+            ensure_ascii=False,
+        )
+        if self._lines is None and self._doc_bin is None:
+            self._open_shard()
+        if self.shard_format == "jsonl":
+            self._lines.append(line + "\n")
+            self._buffered += len(line)
+            if self._buffered >= LINES_BUFFER_BYTES:
+                self._flush_lines()
+        else:
+            self._doc_bin.add(self._make_doc(text, entities, file_path))
+        self._size += len(line.encode("utf-8")) + 1
+        self.examples += 1
+        self.entities += len(entities)
+        if self._size >= self.max_bytes:
+            self._close_shard()
+
+    def _make_doc(self, text: str, entities: list, file_path: str):
+        from spacy.util import filter_spans
+
+        doc = self._nlp.make_doc(text)
+        spans = [
+            doc.char_span(start, end, label=label, alignment_mode="contract")
+            for start, end, label in entities
+        ]
+        doc.ents = filter_spans([x for x in spans if x is not None])
+        doc.user_data["file"] = file_path
+        return doc
+
+    def close(self) -> list:
+        """closes the current shard
+
+        :return: the paths of all written shards
+        """
+        self._close_shard()
+        return self.shards
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def export_ne_offsets(
+    files: list, writer: ShardWriter, jobs: int = 1, progress=None, **kwargs
+) -> dict:
+    """extracts the NER examples of all passed in files and writes them with `writer`
+
+    The files are processed in worker processes, the results are written in the\
+    order of the passed in files as soon as they arrive.
+
+    :param files: a list of file paths
+    :param writer: a `ShardWriter`
+    :param jobs: number of worker processes, `1` runs in process, `0` uses all cores
+    :param progress: an optional callable wrapping the results iterator, e.g. `tqdm.tqdm`
+    :param kwargs: passed on to `file_ne_offsets`
+    :return: a dict mapping the file paths which could not be processed to error messages
+    """
+    results = parallel_map(file_ne_offsets, files, jobs=jobs, **kwargs)
+    if progress is not None:
+        results = progress(results, total=len(files))
+    errors = {}
+    for (examples, error), file_path in zip(results, files):
+        if error is not None:
+            errors[file_path] = error
+            continue
+        for x in examples:
+            writer.write(x, file_path)
+    return errors
@@ -0,0 +1,61 @@
+"""Applies a function to many items in worker processes"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+
+def _map_chunk(worker, chunk: list) -> list:
+    return [worker(x) for x in chunk]
+
+
+def parallel_map(
+    func,
+    items: list,
+    jobs: int = 1,
+    chunksize: int = None,
+    initializer=None,
+    initargs: tuple = (),
+    **kwargs,
+):
+    """applies `func` to every item and yields the results in the order of the passed in items
+
+    At most `2 * jobs` chunks are processed or waiting to be consumed at a time, so the\
+    memory held by finished results stays bounded however many items are passed in.
+
+    :param func: a module level (i.e. picklable) function, called as `func(item, **kwargs)`
+    :param items: a list of e.g. file paths
+    :param jobs: number of worker processes, `1` runs everything in the current process,\
+        `0` uses all available cores
+    :param chunksize: number of items sent to a worker at once, defaults to a value derived\
+        from the number of items and workers
+    :param initializer: called with `initargs` once in every worker process, not used\
+        when running in the current process
+    :param initargs: arguments passed to `initializer`
+    :return: a generator of results
+    """
+    worker = partial(func, **kwargs)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs == 1 or len(items) < 2:
+        yield from map(worker, items)
+        return
+    if chunksize is None:
+        chunksize = max(1, min(64, len(items) // (jobs * 4)))
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=initializer, initargs=initargs
+    ) as executor:
+        pending = deque()
+        try:
+            for start in range(0, len(items), chunksize):
+                chunk = items[start : start + chunksize]
+                pending.append(executor.submit(_map_chunk, worker, chunk))
+                if len(pending) >= jobs * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # e.g. if the consumer stops early
+            for future in pending:
+                future.cancel()
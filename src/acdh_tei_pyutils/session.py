@@ -0,0 +1,89 @@
+"""A cache of parsed documents shared by the phases of a command run"""
+
+import os
+from collections import OrderedDict
+
+from acdh_tei_pyutils.tei import TeiEnricher
+
+
+class TreeCache:
+    """keeps parsed documents in memory so a file is parsed only once per run
+
+    The cache is bounded by a memory budget. As the size of an lxml tree can't be\
+    measured cheaply it is estimated as `size_factor` times the size of the file.\
+    If the budget is exceeded the least recently used documents are evicted.
+
+    Documents are returned as they are, i.e. changes made to a document are\
+    visible to all later users of the cache.
+    """
+
+    def __init__(self, max_mb: int = 512, size_factor: int = 8):
+        """
+        :param max_mb: the memory budget in megabytes, `0` disables caching
+        :param size_factor: estimated ratio between the size of a parsed tree and its file
+        """
+        self.max_bytes = max_mb * 1024 * 1024
+        self.size_factor = size_factor
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._docs = OrderedDict()
+
+    def get(self, file_path: str, doc_class=TeiEnricher):
+        """returns the cached document or parses and caches it
+
+        :param file_path: path to an XML/TEI document
+        :param doc_class: the class used to parse documents not in the cache
+        :return: a `TeiEnricher` (or `doc_class`) instance
+        """
+        key = os.path.abspath(file_path)
+        try:
+            doc, _ = self._docs[key]
+        except KeyError:
+            self.misses += 1
+            doc = doc_class(file_path)
+            self.put(file_path, doc)
+            return doc
+        self.hits += 1
+        self._docs.move_to_end(key)
+        return doc
+
+    def take(self, file_path: str, doc_class=TeiEnricher):
+        """like `get` but removes the document from the cache and does not cache a\
+        freshly parsed one; meant for the last user of a document"""
+        doc = self.pop(file_path)
+        if doc is None:
+            self.misses += 1
+            return doc_class(file_path)
+        self.hits += 1
+        return doc
+
+    def put(self, file_path: str, doc) -> None:
+        """adds a document to the cache and evicts the least recently used ones if needed"""
+        self.pop(file_path)
+        doc_size = os.path.getsize(file_path) * self.size_factor
+        if doc_size > self.max_bytes:
+            return
+        self._docs[os.path.abspath(file_path)] = (doc, doc_size)
+        self.size += doc_size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self._docs.popitem(last=False)
+            self.size -= evicted_size
+
+    def pop(self, file_path: str):
+        """removes a document from the cache
+
+        :return: the cached document or None
+        """
+        try:
+            doc, doc_size = self._docs.pop(os.path.abspath(file_path))
+        except KeyError:
+            return None
+        self.size -= doc_size
+        return doc
+
+    def __contains__(self, file_path: str) -> bool:
+        return os.path.abspath(file_path) in self._docs
+
+    def __len__(self) -> int:
+        return len(self._docs)
@@ -0,0 +1,190 @@
+"""Per-phase reports of the time, CPU time, processed files and memory of a run"""
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import UTC, datetime
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # not available on Windows
+    resource = None
+
+from acdh_tei_pyutils.xpath import XPATH_CACHE
+
+
+class IOTimes:
+    """sums up the time spent parsing and serializing documents in this process
+
+    `TeiReader` counts every parsed document and `writer.write_tree` every written\
+    one; with write-behind threads the times of all threads are added up. Work done in\
+    worker processes is not counted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = {"parse": 0.0, "serialize": 0.0}
+        self.counts = {"parse": 0, "serialize": 0}
+
+    @contextmanager
+    def timing(self, kind: str):
+        """adds the time spent in the `with` block to `kind`, e.g. 'parse' or 'serialize'"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.seconds[kind] = self.seconds.get(kind, 0.0) + seconds
+                self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def snapshot(self) -> dict:
+        """returns a dict mapping the kinds to (seconds, count) tuples"""
+        with self._lock:
+            return {
+                kind: (seconds, self.counts[kind])
+                for kind, seconds in self.seconds.items()
+            }
+
+
+IO_TIMES = IOTimes()
+
+
+def peak_rss_mb() -> tuple[float, float]:
+    """returns the peak resident memory of this process and of its largest finished\
+    child process in MiB, None if it cannot be determined"""
+    if resource is None:  # pragma: no cover
+        return None, None
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (
+        round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    )
+
+
+def _cpu_seconds() -> float:
+    """user and system time of this process and its finished child processes"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _file_bytes(files) -> int:
+    size = 0
+    for x in files:
+        try:
+            size += os.path.getsize(x)
+        except OSError:
+            pass
+    return size
+
+
+class RunStats:
+    """collects the wall and CPU time, processed files and memory peaks of the phases of a run
+
+    A phase lasts from `begin` until the next phase begins or `end` is called. CPU\
+    time includes worker processes once they finished, e.g. at the end of a\
+    `parallel_map`. Parse and serialize times are taken from `IO_TIMES`, so they only\
+    cover documents handled in this process.
+    """
+
+    def __init__(self, command: str, trace_memory: bool = False):
+        """
+        :param command: the name of the run, e.g. the console script
+        :param trace_memory: trace Python allocations with `tracemalloc` and report\
+            their peak per phase; this slows down the run
+        """
+        self.command = command
+        self.started = datetime.now(UTC).isoformat(timespec="seconds")
+        self.phases = []
+        self._current = None
+        self._start_wall = time.perf_counter()
+        self._start_cpu = _cpu_seconds()
+        self._tracing = trace_memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        self.trace_memory = trace_memory
+
+    def begin(self, name: str, files=()) -> None:
+        """ends the running phase and begins a new one
+
+        :param name: the name of the phase, e.g. 'harvest'
+        :param files: paths of the files processed in this phase, their number and size\
+            are reported
+        """
+        self.end()
+        files = list(files)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self._current = {
+            "name": name,
+            "files": len(files),
+            "bytes": _file_bytes(files),
+            "_wall": time.perf_counter(),
+            "_cpu": _cpu_seconds(),
+            "_io": IO_TIMES.snapshot(),
+        }
+
+    def end(self) -> None:
+        """ends the running phase, if any"""
+        phase = self._current
+        if phase is None:
+            return
+        self._current = None
+        wall = time.perf_counter() - phase.pop("_wall")
+        phase["wall_seconds"] = round(wall, 4)
+        phase["cpu_seconds"] = round(_cpu_seconds() - phase.pop("_cpu"), 4)
+        phase["files_per_second"] = round(phase["files"] / wall, 2) if wall else None
+        before = phase.pop("_io")
+        for kind, (seconds, count) in IO_TIMES.snapshot().items():
+            old_seconds, old_count = before.get(kind, (0.0, 0))
+            phase[f"{kind}_seconds"] = round(seconds - old_seconds, 4)
+            phase[f"{kind}_count"] = count - old_count
+        phase["peak_rss_mb"], phase["children_peak_rss_mb"] = peak_rss_mb()
+        if self.trace_memory:
+            phase["tracemalloc_peak_mb"] = round(
+                tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2
+            )
+        self.phases.append(phase)
+
+    def report(self) -> dict:
+        """ends the running phase and returns the report
+
+        :return: a dict with the totals of the run and a list of `phases`
+        """
+        self.end()
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        report = {
+            "command": self.command,
+            "started": self.started,
+            "argv": sys.argv[1:],
+            "wall_seconds": round(time.perf_counter() - self._start_wall, 4),
+            "cpu_seconds": round(_cpu_seconds() - self._start_cpu, 4),
+        }
+        report["peak_rss_mb"], report["children_peak_rss_mb"] = peak_rss_mb()
+        if self.trace_memory:
+            report["tracemalloc_peak_mb"] = max(
+                (x["tracemalloc_peak_mb"] for x in self.phases), default=0.0
+            )
+        if XPATH_CACHE.profile is not None:
+            report["xpath"] = XPATH_CACHE.profile.slowest(None)
+        report["phases"] = self.phases
+        return report
+
+    def write(self, file_path: str) -> dict:
+        """writes the report as JSON
+
+        :param file_path: the location to save the report to
+        :return: the report
+        """
+        report = self.report()
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report
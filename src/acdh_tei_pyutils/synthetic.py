@@ -0,0 +1,244 @@
+"""Deterministic generators of synthetic TEI editions and index files for benchmarks"""
+
+import os
+import random
+
+TEI_NS = "http://www.tei-c.org/ns/1.0"
+
+ENTITY_KINDS = ("person", "place", "org", "bibl")
+INDEX_FILES = {
+    "person": ("listperson.xml", "listPerson"),
+    "place": ("listplace.xml", "listPlace"),
+    "org": ("listorg.xml", "listOrg"),
+    "bibl": ("listbibl.xml", "listBibl"),
+}
+WORDS = (
+    "und",
+    "der",
+    "die",
+    "das",
+    "ein",
+    "eine",
+    "mit",
+    "von",
+    "zu",
+    "im",
+    "auf",
+    "sich",
+    "nicht",
+    "auch",
+    "als",
+    "wie",
+    "Brief",
+    "Haus",
+    "Stadt",
+    "Abend",
+    "Morgen",
+    "Reise",
+    "Theater",
+    "Buch",
+    "heute",
+    "gestern",
+    "sehr",
+    "geschrieben",
+    "gelesen",
+    "gesehen",
+    "lieber",
+    "schöne",
+    "lange",
+    "wieder",
+    "schon",
+    "noch",
+)
+FORENAMES = ("Arthur", "Hermann", "Olga", "Hugo", "Clara", "Felix", "Marie")
+SURNAMES = ("Schnitzler", "Bahr", "Gussmann", "Hofmannsthal", "Pollaczek", "Salten")
+PLACES = ("Wien", "Berlin", "Salzburg", "Altaussee", "Prag", "Venedig", "Paris")
+
+
+def entity_ids(entities: int) -> list[str]:
+    """returns the ids of `entities` entities, the kinds of `ENTITY_KINDS` take turns
+
+    :param entities: the number of entities
+    :return: a list of ids like `person_000000`, `place_000001`
+    """
+    return [f"{ENTITY_KINDS[i % len(ENTITY_KINDS)]}_{i:06d}" for i in range(entities)]
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def _entity(ent_id: str, rng: random.Random, notes: int) -> str:
+    kind = ent_id.split("_", 1)[0]
+    year = rng.randint(1800, 1900)
+    note_grp = "".join(
+        f'<note type="mentions" corresp="doc_{rng.randint(0, 99999):05d}.xml">'
+        f"{_words(rng, 6)}</note>"
+        for _ in range(notes)
+    )
+    if note_grp:
+        note_grp = f"<noteGrp>{note_grp}</noteGrp>"
+    idno = f'<idno type="uri">https://example.org/{ent_id}</idno>'
+    if kind == "person":
+        return (
+            f'<person xml:id="{ent_id}"><persName><forename>{rng.choice(FORENAMES)}'
+            f"</forename><surname>{rng.choice(SURNAMES)}</surname></persName>"
+            f'<birth><date when="{year}-01-01">{year}</date><settlement><placeName>'
+            f"{rng.choice(PLACES)}</placeName></settlement></birth>"
+            f'<death><date when="{year + 60}-12-31">{year + 60}</date></death>'
+            f"{idno}{note_grp}</person>"
+        )
+    if kind == "place":
+        return (
+            f'<place xml:id="{ent_id}"><placeName>{rng.choice(PLACES)} {ent_id[-4:]}'
+            f"</placeName><location><geo>{rng.uniform(40, 55):.4f} "
+            f"{rng.uniform(5, 20):.4f}</geo></location>{idno}{note_grp}</place>"
+        )
+    if kind == "org":
+        return (
+            f'<org xml:id="{ent_id}"><orgName>{_words(rng, 3).title()}</orgName>'
+            f"{idno}{note_grp}</org>"
+        )
+    return (
+        f'<biblStruct xml:id="{ent_id}" type="book"><monogr><title level="m">'
+        f"{_words(rng, rng.randint(2, 16)).capitalize()}</title><author><forename>"
+        f"{rng.choice(FORENAMES)}</forename><surname>{rng.choice(SURNAMES)}</surname>"
+        f"</author><imprint><pubPlace>{rng.choice(PLACES)}</pubPlace>"
+        f"<date>{year}</date></imprint></monogr>{idno}{note_grp}</biblStruct>"
+    )
+
+
+def make_index(kind: str, ent_ids: list, notes: int = 0, seed: int = 0) -> str:
+    """returns a TEI index document listing the entities of one kind
+
+    :param kind: one of `ENTITY_KINDS`
+    :param ent_ids: ids as returned by `entity_ids`, ids of other kinds are left out
+    :param notes: number of tei:note elements in a tei:noteGrp of every entity
+    :param seed: seed of the random generator, the same arguments return the same document
+    :return: the serialized document
+    """
+    rng = random.Random(f"{seed}-{kind}")
+    file_name, list_name = INDEX_FILES[kind]
+    entries = "\n".join(
+        f"        {_entity(x, rng, notes)}" for x in ent_ids if x.startswith(f"{kind}_")
+    )
+    return f"""<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="{TEI_NS}" xml:id="{file_name}">
+  <teiHeader><fileDesc><titleStmt><title>{list_name}</title></titleStmt></fileDesc></teiHeader>
+  <text>
+    <body>
+      <{list_name}>
+{entries}
+      </{list_name}>
+    </body>
+  </text>
+</TEI>
+"""
+
+
+def make_edition(
+    n: int,
+    ent_ids: list,
+    refs: int = 10,
+    paragraphs: int = 3,
+    paragraph_words: int = 60,
+    depth: int = 0,
+    seed: int = 0,
+) -> str:
+    """returns a TEI edition referencing randomly chosen entities with tei:rs elements
+
+    Every document is generated with its own random generator, so the `n`-th\
+    document is the same in corpora of any size.
+
+    :param n: the number of the document, used in its @xml:id and title
+    :param ent_ids: ids as returned by `entity_ids`
+    :param refs: number of tei:rs elements, distributed over the paragraphs
+    :param paragraphs: number of tei:p elements in the tei:body
+    :param paragraph_words: number of words in every paragraph besides the tei:rs
+    :param depth: the content of every paragraph is nested in this many tei:seg elements
+    :param seed: seed of the random generator
+    :return: the serialized document
+    """
+    rng = random.Random(f"{seed}-{n}")
+    paragraphs = max(paragraphs, 1)
+    year = 1880 + n % 50
+    body = []
+    for p in range(paragraphs):
+        p_refs = refs // paragraphs + (1 if p < refs % paragraphs else 0)
+        parts = [_words(rng, paragraph_words)]
+        for _ in range(p_refs):
+            ent_id = rng.choice(ent_ids)
+            kind = ent_id.split("_", 1)[0]
+            parts.insert(
+                rng.randint(0, len(parts)),
+                f'<rs type="{kind}" ref="#{ent_id}">{_words(rng, 2)}</rs>',
+            )
+        content = " ".join(parts)
+        for _ in range(depth):
+            content = f"<seg>{content}</seg>"
+        body.append(f"      <p>{content}</p>")
+    body = "\n".join(body)
+    return f"""<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="{TEI_NS}" xml:base="https://example.org" xml:id="doc_{n:05d}.xml">
+  <teiHeader>
+    <fileDesc>
+      <titleStmt><title type="main">Brief {n}</title></titleStmt>
+      <sourceDesc><p><date when="{year}-{n % 12 + 1:02d}-01">{year}</date></p></sourceDesc>
+    </fileDesc>
+  </teiHeader>
+  <text>
+    <body>
+{body}
+    </body>
+  </text>
+</TEI>
+"""
+
+
+def generate_corpus(
+    output_dir: str,
+    docs: int = 100,
+    refs: int = 10,
+    entities: int = 500,
+    paragraphs: int = 3,
+    paragraph_words: int = 60,
+    depth: int = 0,
+    notes: int = 0,
+    seed: int = 0,
+) -> dict:
+    """writes synthetic editions into `output_dir/editions` and index files into `output_dir/indices`
+
+    No network access or randomness from outside is used: the same arguments always\
+    create the same files. The index files are `listperson.xml`, `listplace.xml`,\
+    `listorg.xml` and `listbibl.xml`, the latter holding tei:biblStruct elements.
+
+    :param output_dir: the directory to write to, created if missing
+    :param docs: number of editions
+    :param refs: number of tei:rs elements per edition
+    :param entities: number of entities in all index files
+    :param paragraphs: number of tei:p elements per edition
+    :param paragraph_words: number of words per paragraph besides the tei:rs
+    :param depth: nesting depth of tei:seg elements in every paragraph
+    :param notes: number of tei:note elements in a tei:noteGrp of every entity
+    :param seed: seed of the random generators
+    :return: a dict with the keys `editions` and `indices` holding the written file paths
+    """
+    ent_ids = entity_ids(max(entities, 1))
+    editions_dir = os.path.join(output_dir, "editions")
+    indices_dir = os.path.join(output_dir, "indices")
+    os.makedirs(editions_dir, exist_ok=True)
+    os.makedirs(indices_dir, exist_ok=True)
+    result = {"editions": [], "indices": []}
+    for n in range(docs):
+        file_path = os.path.join(editions_dir, f"doc_{n:05d}.xml")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(
+                make_edition(n, ent_ids, refs, paragraphs, paragraph_words, depth, seed)
+            )
+        result["editions"].append(file_path)
+    for kind in ENTITY_KINDS:
+        file_path = os.path.join(indices_dir, INDEX_FILES[kind][0])
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(make_index(kind, ent_ids, notes, seed))
+        result["indices"].append(file_path)
+    return result
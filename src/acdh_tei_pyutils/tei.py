@@ -1,8 +1,12 @@
 from lxml import etree as ET
+import bisect
 import re
 from acdh_xml_pyutils.xml import XMLReader
 from slugify import slugify
 
+from acdh_tei_pyutils.stats import IO_TIMES
+from acdh_tei_pyutils.xpath import cached_xpath
+
 
 class HandleAlreadyExist(Exception):
     pass
@@ -24,15 +28,52 @@ NER_TAG_MAP = {
 }
 
 
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+
+
 class TeiReader(XMLReader):
     """a class to read an process tei-documents"""
 
+    _id_index = None
+
+    def __init__(self, *args, **kwargs):
+        # the time spent parsing is reported by `stats.RunStats`
+        with IO_TIMES.timing("parse"):
+            super().__init__(*args, **kwargs)
+
+    @property
+    def id_index(self):
+        """a dict mapping @xml:id values to their elements
+
+        The index is built on first use in a single pass over the document. Methods of\
+        `TeiEnricher` keep it up to date; after changing the tree in other ways call\
+        `invalidate_id_index`. If an id is used more than once, the first element wins.
+        """
+        if self._id_index is None:
+            self._id_index = {}
+            for x in cached_xpath(self.tree, "//*[@xml:id]"):
+                self._id_index.setdefault(x.get(XML_ID), x)
+        return self._id_index
+
+    def invalidate_id_index(self):
+        """drops the index returned by `id_index`, it is rebuilt on next use"""
+        self._id_index = None
+
+    def get_element_by_id(self, xml_id, default=None):
+        """looks up an element by its @xml:id using `id_index`
+
+        :param xml_id: the @xml:id value, a leading '#' is not removed
+        :param default: returned if no element has this id
+        :return: the element or `default`
+        """
+        return self.id_index.get(xml_id, default)
+
     def any_xpath(self, any_xpath="//tei:rs"):
         """Runs any xpath expressions against the parsed document
         :param any_xpath: Any XPath expression.
         :return: The result of the xpath
         """
-        return self.tree.xpath(any_xpath, namespaces=self.ns_tei)
+        return cached_xpath(self.tree, any_xpath, self.ns_tei)
 
     def extract_ne_elements(self, parent_node, ne_xpath="//tei:rs"):
         """extract elements tagged as named entities
@@ -40,7 +81,7 @@ class TeiReader(XMLReader):
         :return: A list of elements
         """
 
-        ne_elements = parent_node.xpath(ne_xpath, namespaces=self.ns_tei)
+        ne_elements = cached_xpath(parent_node, ne_xpath, self.ns_tei)
         return ne_elements
 
     def extract_ne_dicts(
@@ -57,13 +98,9 @@ class TeiReader(XMLReader):
         ne_dicts = []
         for x in ne_elements:
             item = {}
-            text = "".join(x.xpath(".//text()"))
+            text = "".join(cached_xpath(x, ".//text()"))
             item["text"] = re.sub(r"\s+", " ", text).strip()
-            try:
-                ne_type = NER_TAG_MAP.get("{}".format(x.xpath("./@type")[0]), "MISC")
-            except IndexError:
-                ne_type = NER_TAG_MAP.get("{}".format(x.xpath("name()")), "MISC")
-            item["ne_type"] = ne_type
+            item["ne_type"] = self.get_ne_type(x, NER_TAG_MAP)
             ne_dicts.append(item)
 
         return ne_dicts
@@ -74,7 +111,7 @@ class TeiReader(XMLReader):
         an element which text nodes should be extracted
         :return: A normalized, cleaned plain text
         """
-        result = re.sub(r"\s+", " ", "".join(node.xpath(".//text()"))).strip()
+        result = re.sub(r"\s+", " ", "".join(cached_xpath(node, ".//text()"))).strip()
 
         return result
 
@@ -95,13 +132,41 @@ class TeiReader(XMLReader):
         "ne_type": "LOC"}]}]
         """
 
-        parents = self.tree.xpath(parent_nodes, namespaces=self.ns_tei)
-        result = []
+        return list(self.iter_text_nes(parent_nodes, ne_xpath, NER_TAG_MAP))
+
+    def iter_text_nes(
+        self,
+        parent_nodes=".//tei:body//tei:p",
+        ne_xpath=".//tei:rs",
+        NER_TAG_MAP=NER_TAG_MAP,
+    ):
+        """ like `get_text_nes_list` but yields the dicts one parent node at a time
+
+        :return: A generator of dicts like {"text": "Wien ist schön", "ner_dicts":\
+        [{"text": "Wien", "ne_type": "LOC"}]}
+        """
+
+        parents = cached_xpath(self.tree, parent_nodes, self.ns_tei)
+        whitespace = re.compile(r"\s+")
         for node in parents:
-            text = self.create_plain_text(node)
-            ner_dicts = self.extract_ne_dicts(node, ne_xpath, NER_TAG_MAP)
-            result.append({"text": text, "ner_dicts": ner_dicts})
-        return result
+            ne_elements = self.extract_ne_elements(node, ne_xpath)
+            raw, spans = self._walk_text_nodes(node, ne_elements)
+            ner_dicts = []
+            for x in ne_elements:
+                try:
+                    start, end = spans[x]
+                    text = raw[start:end]
+                except KeyError:
+                    # not a descendant of the parent node
+                    text = "".join(cached_xpath(x, ".//text()"))
+                ner_dicts.append(
+                    {
+                        "text": whitespace.sub(" ", text).strip(),
+                        "ne_type": self.get_ne_type(x, NER_TAG_MAP),
+                    }
+                )
+            text = whitespace.sub(" ", raw).strip()
+            yield {"text": text, "ner_dicts": ner_dicts}
 
     def extract_ne_offsets(
         self,
@@ -119,36 +184,119 @@ class TeiReader(XMLReader):
         :return: A list of spacy-like NER Tuples [('some text'), {'entities': [(15, 19, 'place')]}]
         """
 
-        text_nes_dict = self.get_text_nes_list(parent_nodes, ne_xpath, NER_TAG_MAP)
-        result = []
-        for x in text_nes_dict:
-            plain_text = x["text"]
-            ner_dicts = x["ner_dicts"]
-            entities = []
-            for x in ner_dicts:
-                if x["text"] != "":
-                    for m in re.finditer(re.escape(x["text"]), plain_text):
-                        entities.append([m.start(), m.end(), x["ne_type"]])
-            entities = [item for item in set(tuple(row) for row in entities)]
-            entities = sorted(entities, key=lambda x: x[0])
+        return list(self.iter_ne_offsets(parent_nodes, ne_xpath, NER_TAG_MAP))
+
+    def iter_ne_offsets(
+        self,
+        parent_nodes=".//tei:body//tei:p",
+        ne_xpath=".//tei:rs",
+        NER_TAG_MAP=NER_TAG_MAP,
+    ):
+        """ like `extract_ne_offsets` but yields the tuples one parent node at a time
+
+        :return: A generator of spacy-like NER Tuples ('some text', {'entities':\
+        [(15, 19, 'LOC')]})
+        """
+
+        parents = cached_xpath(self.tree, parent_nodes, self.ns_tei)
+        for node in parents:
+            plain_text, entities = self.get_ne_offsets(node, ne_xpath, NER_TAG_MAP)
             ents = []
-            next_item_index = 1
-            # remove entities with the same start offset
+            # remove entities with the same start offset, the outermost one is kept
+            starts = set()
             for x in entities:
-                cur_start = x[0]
-                try:
-                    next_start = entities[next_item_index][0]
-                except IndexError:
-                    next_start = 9999999999999999999999
-                if cur_start == next_start:
-                    pass
-                else:
+                if x[0] not in starts:
+                    starts.add(x[0])
                     ents.append(x)
-                next_item_index = next_item_index + 1
+            yield (plain_text, {"entities": ents})
 
-            train_data = (plain_text, {"entities": ents})
-            result.append(train_data)
-        return result
+    def get_ne_offsets(self, node, ne_xpath=".//tei:rs", NER_TAG_MAP=NER_TAG_MAP):
+        """ computes the plain text of the passed in element and the offsets of its NEs
+
+        The text nodes are walked once; the offsets point at the text of the tagged\
+        elements, i.e. repeated strings which are not tagged are not reported.
+
+        :param node: the element which text nodes should be extracted
+        :param ne_xpath: An XPath expression pointing to elements used to tagged NEs.\
+        Takes the node as context
+        :param NER_TAG_MAP: A dictionary providing mapping from TEI tags used to tag NEs to\
+        spacy-tags
+        :return: A tuple of the text as returned by `create_plain_text` and a list of\
+        (start, end, ne_type) tuples in document order
+        """
+        raw, spans = self._walk_text_nodes(
+            node, self.extract_ne_elements(node, ne_xpath)
+        )
+        # ends of whitespace runs and the number of chars removed up to there
+        run_ends = []
+        removed = []
+        total = 0
+        for m in re.finditer(r"\s+", raw):
+            total += m.end() - m.start() - 1
+            if m.start() == 0:
+                # the leading whitespace is stripped completely
+                total += 1
+            run_ends.append(m.end())
+            removed.append(total)
+        plain_text = re.sub(r"\s+", " ", raw).strip()
+
+        def to_plain(pos):
+            i = bisect.bisect_right(run_ends, pos)
+            return pos - removed[i - 1] if i else pos
+
+        entities = []
+        for el, (start, end) in spans.items():
+            segment = raw[start:end]
+            stripped = segment.strip()
+            if not stripped:
+                continue
+            first = start + len(segment) - len(segment.lstrip())
+            last = first + len(stripped) - 1
+            entities.append(
+                (to_plain(first), to_plain(last) + 1, self.get_ne_type(el, NER_TAG_MAP))
+            )
+        return plain_text, entities
+
+    def _walk_text_nodes(self, node, ne_elements):
+        """ concatenates the text nodes of the passed in element in a single traversal
+
+        :param node: the element which text nodes should be extracted
+        :param ne_elements: elements tagging NEs
+        :return: A tuple of the not normalized text and a dict mapping those NE elements\
+        which are descendants of the node to their (start, end) offsets in this text,\
+        in document order
+        """
+        ne_elements = {x: None for x in ne_elements if x is not node}
+        chunks = []
+        raw_length = 0
+        spans = {}
+        for event, el in ET.iterwalk(node, events=("start", "end", "comment", "pi")):
+            if event == "start":
+                if el in ne_elements:
+                    spans[el] = raw_length
+                if el.text:
+                    chunks.append(el.text)
+                    raw_length += len(el.text)
+                continue
+            if event == "end" and el in ne_elements:
+                spans[el] = (spans[el], raw_length)
+            if el.tail and el is not node:
+                chunks.append(el.tail)
+                raw_length += len(el.tail)
+        return "".join(chunks), spans
+
+    def get_ne_type(self, ne_element, NER_TAG_MAP=NER_TAG_MAP):
+        """maps an element tagging a NE to its spacy-tag, see `NER_TAG_MAP`
+
+        :return: the spacy-tag of the element's @type or name, defaults to 'MISC'
+        """
+        ne_type = ne_element.get("type")
+        if ne_type is None:
+            # the element's name() as used in the document
+            ne_type = ET.QName(ne_element).localname
+            if ne_element.prefix:
+                ne_type = f"{ne_element.prefix}:{ne_type}"
+        return NER_TAG_MAP.get(ne_type, "MISC")
 
 
 class TeiEnricher(TeiReader):
@@ -164,15 +312,31 @@ class TeiEnricher(TeiReader):
         """
 
         base = self.any_xpath("//tei:TEI")[0]
+        for key, value in self.base_and_id_attributes(
+            base_value, id_value, prev_value, next_value
+        ).items():
+            base.set(key, value)
+        if id_value:
+            self.invalidate_id_index()
+        return self.tree
+
+    @staticmethod
+    def base_and_id_attributes(base_value, id_value, prev_value, next_value):
+        """returns the attributes `add_base_and_id` sets, empty values are left out
+
+        :return: a dict mapping attribute names in Clark notation to their values
+        :rtype: dict
+        """
+        attributes = {}
         if base_value:
-            base.set(f"{{{self.ns_xml['xml']}}}base", base_value)
+            attributes["{http://www.w3.org/XML/1998/namespace}base"] = base_value
         if id_value:
-            base.set(f"{{{self.ns_xml['xml']}}}id", id_value)
+            attributes[XML_ID] = id_value
         if prev_value:
-            base.set("prev", f"{base_value}/{prev_value}")
+            attributes["prev"] = f"{base_value}/{prev_value}"
         if next_value:
-            base.set("next", f"{base_value}/{next_value}")
-        return self.tree
+            attributes["next"] = f"{base_value}/{next_value}"
+        return attributes
 
     def get_full_id(self):
         """returns the combination of @xml:base and @xml:id
@@ -183,11 +347,11 @@ class TeiEnricher(TeiReader):
         """
         base = self.any_xpath("//tei:TEI")[0]
         try:
-            base_base = base.xpath("./@xml:base", namespaces=self.ns_xml)[0]
+            base_base = cached_xpath(base, "./@xml:base", self.ns_xml)[0]
         except IndexError:
             return None
         try:
-            base_id = base.xpath("./@xml:id", namespaces=self.ns_xml)[0]
+            base_id = cached_xpath(base, "./@xml:id", self.ns_xml)[0]
         except IndexError:
             return None
         if base_base.endswith("/"):
@@ -237,30 +401,98 @@ class TeiEnricher(TeiReader):
             insert_node.append(idno_node)
             return idno_node
 
-    def create_mention_list(self, mentions, event_title=""):
+    def create_mention_list(self, mentions, event_title="", slug_cache=None):
         """creates a tei element with notes of mentions
 
         :param mentions: a list of dicts with keys `doc_id` and `doc_title`
         :type mentions: noteGrp
 
+        :param slug_cache: an optional dict caching the slugified `doc_id` values,\
+        pass the same dict to several calls to slugify every `doc_id` only once
+        :type slug_cache: dict
+
         :return: a etree.element
         """
+        if slug_cache is None:
+            slug_cache = {}
         tei_ns = f"{self.ns_tei['tei']}"
         node_root = ET.Element(f"{{{tei_ns}}}noteGrp")
-        mentions_added = {}
+        note_tag = f"{{{tei_ns}}}note"
+        mentions_added = set()
         for x in mentions:
+            doc_id = x["doc_id"]
             try:
-                mentions_added[slugify(x["doc_id"])]
+                key = slug_cache[doc_id]
             except KeyError:
-                note = ET.Element(f"{{{tei_ns}}}note")
-                note.attrib["target"] = x["doc_id"]
-                note.attrib["type"] = "mentions"
-                if x["doc_date"] is not None:
-                    note.attrib["corresp"] = x["doc_date"]
-                if x["doc_title_sec"] is not None:
-                    note.text = event_title + f"{x['doc_title']} {x['doc_title_sec']}"
-                else:
-                    note.text = x["doc_title"]
-                node_root.append(note)
-                mentions_added[slugify(x["doc_id"])] = True
+                key = slug_cache[doc_id] = slugify(doc_id)
+            if key in mentions_added:
+                continue
+            attrib = {"target": doc_id, "type": "mentions"}
+            if x["doc_date"] is not None:
+                attrib["corresp"] = x["doc_date"]
+            note = ET.SubElement(node_root, note_tag, attrib)
+            if x["doc_title_sec"] is not None:
+                note.text = event_title + f"{x['doc_title']} {x['doc_title_sec']}"
+            else:
+                note.text = x["doc_title"]
+            mentions_added.add(key)
         return node_root
+
+    def add_mention_lists(
+        self,
+        ref_doc_dict,
+        event_title="",
+        blacklist_ids=(),
+        ent_ids=None,
+        replace=False,
+        slug_cache=None,
+    ):
+        """adds a tei:noteGrp listing the mentioning documents to all entities of the document
+
+        :param ref_doc_dict: a dict mapping entity ids to lists of dicts as expected by\
+        `create_mention_list`
+        :type ref_doc_dict: dict
+
+        :param event_title: a prefix for the note's text, see `create_mention_list`
+        :type event_title: str
+
+        :param blacklist_ids: ids of entities which should not get a tei:noteGrp
+
+        :param ent_ids: if set, only entities with these ids are processed
+
+        :param replace: remove already existing mention lists before adding the new ones
+        :type replace: bool
+
+        :param slug_cache: see `create_mention_list`, a new one is used if not passed
+        :type slug_cache: dict
+
+        :return: a list of the ids of the processed entities
+        :rtype: list
+        """
+        if slug_cache is None:
+            slug_cache = {}
+        event_tag = f"{{{self.ns_tei['tei']}}}event"
+        processed = []
+        for ent in self.any_xpath(".//tei:body//*[@xml:id]"):
+            ent_id = ent.get(XML_ID)
+            if ent_id in blacklist_ids:
+                continue
+            if ent_ids is not None and ent_id not in ent_ids:
+                continue
+            if replace:
+                for note_grp in cached_xpath(
+                    ent, "./tei:noteGrp[tei:note[@type='mentions']]", self.ns_tei
+                ):
+                    ent.remove(note_grp)
+                    self.invalidate_id_index()
+            processed.append(ent_id)
+            mentions = ref_doc_dict.get(ent_id)
+            if not mentions:
+                continue
+            note_grp = self.create_mention_list(mentions, event_title, slug_cache)
+            # TEI schema does not allow noteGrp in event after e.g. listPerson, ... so we need to insert it before
+            if ent.tag == event_tag:
+                ent.insert(1, note_grp)
+            else:
+                ent.append(note_grp)
+        return processed
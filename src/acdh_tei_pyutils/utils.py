@@ -1,4 +1,7 @@
+import os
 import re
+from array import array
+from functools import lru_cache
 from itertools import chain, islice, tee
 from typing import Union
 
@@ -6,7 +9,11 @@ import lxml.etree as ET
 from acdh_xml_pyutils.xml import NSMAP
 from lxml.etree import Element
 
-from acdh_tei_pyutils.tei import TeiReader
+from acdh_tei_pyutils.fulltext import FulltextExtractor
+from acdh_tei_pyutils.parallel import parallel_map
+from acdh_tei_pyutils.tei import TeiEnricher, TeiReader
+from acdh_tei_pyutils.writer import write_tree
+from acdh_tei_pyutils.xpath import cached_xpath
 
 
 def any_xpath(node: Element, any_xpath: str) -> list:
@@ -16,7 +23,7 @@ def any_xpath(node: Element, any_xpath: str) -> list:
     :param any_xpath: Any XPath expression, e.g. .//tei:rs
     :return: The result of the xpath
     """
-    return node.xpath(any_xpath, namespaces=NSMAP)
+    return cached_xpath(node, any_xpath, NSMAP)
 
 
 def get_xmlid(element: ET.Element) -> str:
@@ -36,24 +43,18 @@ def extract_fulltext(root_node: ET.Element, tag_blacklist: list = None) -> str:
     """extracts all fulltext from given element and its children, except from blacklisted elements"""
     if tag_blacklist is None:
         tag_blacklist = []
+    return _fulltext_extractor(tuple(tag_blacklist))(root_node)
 
-    blacklisted_tags = set(tag_blacklist)
-    text_parts = []
 
-    def _collect_text(node: ET.Element) -> None:
-        if node.tag in blacklisted_tags:
-            return
-
-        if node.text:
-            text_parts.append(node.text)
-
-        for child in node:
-            _collect_text(child)
-            if child.tail:
-                text_parts.append(child.tail)
-
-    _collect_text(root_node)
-    return " ".join("".join(text_parts).split())
+@lru_cache(maxsize=64)
+def _fulltext_extractor(
+    tag_blacklist: tuple,
+    block_elements: tuple = (),
+    space_elements: tuple = (),
+    local_names: bool = False,
+) -> FulltextExtractor:
+    """returns the `FulltextExtractor` shared by all calls with the same configuration"""
+    return FulltextExtractor(tag_blacklist, block_elements, space_elements, local_names)
 
 
 def check_for_hash(value: str) -> str:
@@ -66,14 +67,21 @@ def check_for_hash(value: str) -> str:
 
 def add_graphic_url_to_pb(doc: TeiReader) -> TeiReader:
     """writes url attributes into tei:pb elements fetched from matching tei:surface//tei:graphic[1] elements"""
+    surface_tag = "{http://www.tei-c.org/ns/1.0}surface"
     for x in doc.any_xpath(".//tei:pb[@facs]"):
         facs_id = check_for_hash(x.attrib["facs"])
-        xpath_expr = f'.//tei:surface[@xml:id="{facs_id}"]//tei:graphic[1]/@url'
-        try:
-            facs_url = doc.any_xpath(xpath_expr)[0]
-        except IndexError:
-            continue
-        x.attrib["url"] = facs_url
+        surface = doc.get_element_by_id(facs_id)
+        if surface is not None and surface.tag == surface_tag:
+            facs_urls = any_xpath(surface, ".//tei:graphic[1]/@url")
+        else:
+            facs_urls = []
+        if not facs_urls:
+            # the id may also be used by another element before the surface
+            facs_urls = doc.any_xpath(
+                f'.//tei:surface[@xml:id="{facs_id}"]//tei:graphic[1]/@url'
+            )
+        if facs_urls:
+            x.attrib["url"] = facs_urls[0]
     return doc
 
 
@@ -96,6 +104,181 @@ def get_birth_death_year(
         return None
 
 
+MISSING_YEAR = -(2**31)
+TEI_FORENAME = "{http://www.tei-c.org/ns/1.0}forename"
+TEI_ENTITY_TAGS = (
+    "{http://www.tei-c.org/ns/1.0}person",
+    "{http://www.tei-c.org/ns/1.0}place",
+    "{http://www.tei-c.org/ns/1.0}org",
+)
+TEI_NAME_TAGS = (
+    "{http://www.tei-c.org/ns/1.0}persName",
+    "{http://www.tei-c.org/ns/1.0}placeName",
+    "{http://www.tei-c.org/ns/1.0}orgName",
+)
+ATTRIBUTE_XPATH = re.compile(r"^@([A-Za-z_][\w.-]*)$")
+
+
+def _name_node_texts(name_node: ET.Element) -> tuple[list, list, list]:
+    """collects the text nodes of a name node in a single walk
+
+    :return: a tuple of (text nodes within tei:forename, text nodes within tei:surname,\
+        all text nodes), like `.//tei:forename//text()`, `.//tei:surname//text()` and\
+        `.//text()`
+    """
+    fornames = []
+    surnames = []
+    texts = []
+    in_forename = 0
+    in_surname = 0
+    for event, el in ET.iterwalk(name_node, events=("start", "end", "comment", "pi")):
+        if event == "start":
+            if el.tag == TEI_FORENAME:
+                in_forename += 1
+            elif el.tag == TEI_SURNAME:
+                in_surname += 1
+            text = el.text
+        else:
+            if event == "end":
+                if el is name_node:
+                    break
+                if el.tag == TEI_FORENAME:
+                    in_forename -= 1
+                elif el.tag == TEI_SURNAME:
+                    in_surname -= 1
+            text = el.tail
+        if text:
+            texts.append(text)
+            if in_forename:
+                fornames.append(text)
+            if in_surname:
+                surnames.append(text)
+    return fornames, surnames, texts
+
+
+def _year(date_str) -> int:
+    """converts a date string like `get_birth_death_year` does, with `MISSING_YEAR` for None"""
+    if date_str is None:
+        return MISSING_YEAR
+    try:
+        return int(date_str[:4])
+    except ValueError:
+        return MISSING_YEAR
+
+
+def extract_entity_columns(
+    node,
+    entity_tags: tuple = TEI_ENTITY_TAGS,
+    entity_xpath: str = None,
+    name_tags: tuple = TEI_NAME_TAGS,
+    birth_xpath_part: str = "@when",
+    death_xpath_part: str = "@when",
+    default_msg="no label provided",
+    default_lang="en",
+) -> dict:
+    """extracts ids, labels, lang tags and birth/death years of all entities of an index\
+    in one pass and returns them column-wise
+
+    The label and lang tag of an entity are the ones `make_entity_label` returns for its\
+    first child named like one of `name_tags`; entities without such a child get\
+    `default_msg` and `default_lang`. The years are the ones returned by\
+    `get_birth_death_year`, with `MISSING_YEAR` instead of None. The children of an\
+    entity are read in a single loop; only `xpath_part` values other than a plain\
+    attribute like `@when` are evaluated as XPath.
+
+    Args:
+        node: a tei:listPerson (or any other) element, an element tree or a `TeiReader`
+        entity_tags (tuple, optional): Clark notation names of the entities, only\
+            descendants with an @xml:id are used.
+        entity_xpath (str, optional): selects the entities instead of `entity_tags`.
+        name_tags (tuple, optional): Clark notation names of the name elements.
+        birth_xpath_part (str, optional): see `xpath_part` of `get_birth_death_year`.
+        death_xpath_part (str, optional): see `xpath_part` of `get_birth_death_year`.
+        default_msg (str, optional): see `make_entity_label`.
+        default_lang (str, optional): see `make_entity_label`.
+
+    Returns:
+        dict: with the keys `ids`, `labels` and `langs` (lists) and `birth_years` and\
+        `death_years` (`array.array("i")`), all in the order of the entities
+    """
+    xml_id = "{http://www.w3.org/XML/1998/namespace}id"
+    xml_lang = "{http://www.w3.org/XML/1998/namespace}lang"
+    if isinstance(node, TeiReader):
+        node = node.tree
+    if entity_xpath is not None:
+        entities = any_xpath(node, entity_xpath)
+    else:
+        if isinstance(node, ET._ElementTree):
+            node = node.getroot()
+        entities = (x for x in node.iterdescendants(entity_tags) if xml_id in x.attrib)
+    name_tags = set(name_tags)
+    # (tag, attribute or None, XPath used if the attribute is None)
+    events = []
+    for event_tag, xpath_part in (
+        ("birth", birth_xpath_part),
+        ("death", death_xpath_part),
+    ):
+        match = ATTRIBUTE_XPATH.match(xpath_part)
+        events.append(
+            (
+                f"{{http://www.tei-c.org/ns/1.0}}{event_tag}",
+                match.group(1) if match else None,
+                f"./tei:{event_tag}/{xpath_part}",
+            )
+        )
+    (birth_tag, birth_attr, birth_xpath), (death_tag, death_attr, death_xpath) = events
+    ids = []
+    labels = []
+    langs = []
+    birth_years = array("i")
+    death_years = array("i")
+    for ent in entities:
+        name_node = None
+        birth = None
+        death = None
+        for x in ent:
+            tag = x.tag
+            if tag in name_tags:
+                if name_node is None:
+                    name_node = x
+            elif tag == birth_tag and birth is None and birth_attr is not None:
+                birth = x.get(birth_attr)
+            elif tag == death_tag and death is None and death_attr is not None:
+                death = x.get(death_attr)
+        if birth_attr is None:
+            birth = next(iter(any_xpath(ent, birth_xpath)), None)
+        if death_attr is None:
+            death = next(iter(any_xpath(ent, death_xpath)), None)
+        if name_node is None:
+            label, lang_tag = default_msg, default_lang
+        else:
+            lang_tag = name_node.get(xml_lang, default_lang)
+            fornames, surnames, texts = _name_node_texts(name_node)
+            fornames = [normalize_string(x) for x in fornames]
+            if surnames and fornames:
+                label = f"{normalize_string(surnames[0])}, {' '.join(fornames)}"
+            elif fornames:
+                label = " ".join(fornames)
+            elif surnames:
+                label = normalize_string(surnames[0])
+            else:
+                label = normalize_string(" ".join(texts))
+            if label == "":
+                label = default_msg
+        ids.append(ent.get(xml_id))
+        labels.append(label)
+        langs.append(lang_tag)
+        birth_years.append(_year(birth))
+        death_years.append(_year(death))
+    return {
+        "ids": ids,
+        "labels": labels,
+        "langs": langs,
+        "birth_years": birth_years,
+        "death_years": death_years,
+    }
+
+
 def previous_and_next(some_iterable):  # pragma: no cover
     """taken from https://stackoverflow.com/a/1012089"""
     prevs, items, nexts = tee(some_iterable, 3)
@@ -104,6 +287,80 @@ def previous_and_next(some_iterable):  # pragma: no cover
     return zip(prevs, items, nexts)
 
 
+TEI_ROOT = "{http://www.tei-c.org/ns/1.0}TEI"
+
+
+def root_attributes(file_path: str) -> tuple[str, dict]:
+    """reads only the start tag of the root element of a document
+
+    :param file_path: path to an XML document
+    :return: a tuple of (tag, dict of attributes) of the root element
+    """
+    parser = ET.XMLPullParser(events=("start",))
+    with open(file_path, "rb") as f:
+        while chunk := f.read(4096):
+            parser.feed(chunk)
+            for _, root in parser.read_events():
+                return root.tag, dict(root.attrib)
+    # raises an XMLSyntaxError as the document has no root element
+    parser.close()
+
+
+def add_base_and_id_to_file(
+    neighbours: tuple, base_value: str = None
+) -> tuple[bool, str]:
+    """adds @xml:base, @xml:id, @prev and @next to the root element of a document
+
+    The document is only parsed and rewritten if one of these attributes does not\
+    already have the value it would be set to; to detect this only the start tag of\
+    the root element is read.
+
+    :param neighbours: a tuple of (path of the previous file or None, path of the file,\
+        path of the next file or None); the ids are the file names
+    :param base_value: the value of @xml:base
+    :return: a tuple of (True if the file was rewritten, None or an error message)
+    """
+    prev_path, file_path, next_path = neighbours
+    ids = [
+        os.path.split(x)[1] if x else None for x in (file_path, prev_path, next_path)
+    ]
+    attributes = TeiEnricher.base_and_id_attributes(base_value, *ids)
+    try:
+        tag, current = root_attributes(file_path)
+        if tag == TEI_ROOT and all(current.get(k) == v for k, v in attributes.items()):
+            return False, None
+        doc = TeiEnricher(file_path)
+        doc.add_base_and_id(base_value, *ids)
+        write_tree(doc.tree, file_path)
+    except Exception as e:
+        return False, f"failed to process {file_path} due to {e}"
+    return True, None
+
+
+def add_base_and_id_to_files(
+    files: list, base_value: str = None, jobs: int = 1, progress=None
+) -> dict:
+    """runs `add_base_and_id_to_file` for all passed in files, optionally in worker processes
+
+    :param files: a sorted list of file paths, each file's @prev and @next point to its\
+        neighbours in this list
+    :param base_value: the value of @xml:base
+    :param jobs: number of worker processes, `1` runs in process, `0` uses all cores
+    :param progress: an optional callable wrapping the results iterator, e.g. `tqdm.tqdm`
+    :return: a dict mapping the file paths to tuples of (True if the file was rewritten,\
+        None or an error message)
+    """
+    results = parallel_map(
+        add_base_and_id_to_file,
+        list(previous_and_next(files)),
+        jobs=jobs,
+        base_value=base_value,
+    )
+    if progress is not None:
+        results = progress(results, total=len(files))
+    return dict(zip(files, results))
+
+
 def normalize_string(string: str) -> str:
     """removese any superfluos whitespace from a given string"""
     return " ".join(" ".join(string.split()).split())
@@ -165,32 +422,77 @@ def make_bibl_label(
     Returns:
         str: A nice, bibliograhpically useful label
     """
-    try:
-        author = any_xpath(node, ".//tei:author[1]/tei:surname[1]")[0].text
-    except IndexError:
-        try:
-            author = any_xpath(node, ".//tei:author[1]/tei:name[1]")[0].text
-        except IndexError:
-            try:
-                author = any_xpath(node, ".//tei:editor[1]/tei:surname[1]")[0].text
-                author = f"{author} {editor_abbr}"
-            except IndexError:
-                try:
-                    author = any_xpath(node, ".//tei:editor[1]/tei:name[1]")[0].text
-                    author = f"{author} {editor_abbr}"
-                except IndexError:
-                    author = no_author
-    try:
-        source_year = any_xpath(node, ".//tei:date[1]")[0].text
-        if source_year is not None:
-            pass
+    return _bibl_label(
+        _bibl_label_parts(node),
+        no_author,
+        no_title,
+        year,
+        editor_abbr,
+        max_title_length,
+    )
+
+
+TEI_AUTHOR = "{http://www.tei-c.org/ns/1.0}author"
+TEI_EDITOR = "{http://www.tei-c.org/ns/1.0}editor"
+TEI_SURNAME = "{http://www.tei-c.org/ns/1.0}surname"
+TEI_NAME = "{http://www.tei-c.org/ns/1.0}name"
+TEI_DATE = "{http://www.tei-c.org/ns/1.0}date"
+TEI_TITLE = "{http://www.tei-c.org/ns/1.0}title"
+BIBL_LABEL_TAGS = (TEI_AUTHOR, TEI_EDITOR, TEI_SURNAME, TEI_NAME, TEI_DATE, TEI_TITLE)
+
+
+def _bibl_label_parts(node: ET.Element) -> dict:
+    """walks the descendants of a tei:biblStruct once and collects the elements\
+    `make_bibl_label` looks for
+
+    Only elements which are the first child of their parent with their name are\
+    considered, i.e. the same ones as matched by e.g. `.//tei:author[1]/tei:surname[1]`.
+
+    :return: a dict with keys like `(TEI_AUTHOR, TEI_SURNAME)`, `TEI_DATE` or `TEI_TITLE`\
+        mapping to the first matching element in document order
+    """
+    parts = {}
+    first_children = set()
+    seen = set()
+    for el in node.iterdescendants(BIBL_LABEL_TAGS):
+        parent = el.getparent()
+        tag = el.tag
+        if (parent, tag) in seen:
+            continue
+        seen.add((parent, tag))
+        if tag == TEI_AUTHOR or tag == TEI_EDITOR:
+            first_children.add(el)
+        elif tag == TEI_SURNAME or tag == TEI_NAME:
+            if parent in first_children:
+                parts.setdefault((parent.tag, tag), el)
         else:
+            parts.setdefault(tag, el)
+    return parts
+
+
+def _bibl_label(
+    parts: dict, no_author, no_title, year, editor_abbr, max_title_length
+) -> str:
+    """builds the label of `make_bibl_label` from the result of `_bibl_label_parts`"""
+    if (TEI_AUTHOR, TEI_SURNAME) in parts:
+        author = parts[(TEI_AUTHOR, TEI_SURNAME)].text
+    elif (TEI_AUTHOR, TEI_NAME) in parts:
+        author = parts[(TEI_AUTHOR, TEI_NAME)].text
+    elif (TEI_EDITOR, TEI_SURNAME) in parts:
+        author = f"{parts[(TEI_EDITOR, TEI_SURNAME)].text} {editor_abbr}"
+    elif (TEI_EDITOR, TEI_NAME) in parts:
+        author = f"{parts[(TEI_EDITOR, TEI_NAME)].text} {editor_abbr}"
+    else:
+        author = no_author
+    try:
+        source_year = parts[TEI_DATE].text
+        if source_year is None:
             source_year = year
-    except IndexError:
+    except KeyError:
         source_year = year
     try:
-        title = any_xpath(node, ".//tei:title[1]")[0].text
-    except IndexError:
+        title = parts[TEI_TITLE].text
+    except KeyError:
         title = no_title
     if title:
         if len(title) > max_title_length:
@@ -200,6 +502,46 @@ def make_bibl_label(
     return f"{author}, {title}, {source_year}"
 
 
+def make_bibl_labels(
+    node,
+    bibl_xpath: str = ".//tei:biblStruct",
+    no_author="o.A.",
+    no_title="o.T.",
+    year="o.J.",
+    editor_abbr="(Hg.)",
+    max_title_length=75,
+) -> list[tuple[ET.Element, str]]:
+    """creates the labels of `make_bibl_label` for all tei:biblStruct elements of a list or document
+
+    Every tei:biblStruct is walked once instead of being searched with up to seven\
+    XPath expressions; the labels are the same as the ones of `make_bibl_label`.
+
+    Args:
+        node: a tei:listBibl (or any other) element, an element tree or a `TeiReader`
+        bibl_xpath (str, optional): selects the elements to label. Defaults to ".//tei:biblStruct".
+        no_author, no_title, year, editor_abbr, max_title_length: see `make_bibl_label`
+
+    Returns:
+        list[tuple[ET.Element, str]]: (element, label) tuples in document order
+    """
+    if isinstance(node, TeiReader):
+        node = node.tree
+    return [
+        (
+            x,
+            _bibl_label(
+                _bibl_label_parts(x),
+                no_author,
+                no_title,
+                year,
+                editor_abbr,
+                max_title_length,
+            ),
+        )
+        for x in any_xpath(node, bibl_xpath)
+    ]
+
+
 def extract_fulltext_with_spacing(
     root_node,
     tag_blacklist=None,
@@ -216,7 +558,8 @@ def extract_fulltext_with_spacing(
 ):
     """
     Extract full text content from an XML element tree with proper spacing.
-    This function recursively traverses an XML element tree and extracts all text
+    This function traverses an XML element tree (without recursion, see
+    `acdh_tei_pyutils.fulltext.FulltextExtractor`) and extracts all text
     content while preserving logical spacing around block-level elements. It handles
     XML namespaces and respects a blacklist of elements to exclude from extraction.
     Taken from https://github.com/arthur-schnitzler/schnitzler-briefe-static/blob/main/python/make_typesense_index.py
@@ -236,72 +579,11 @@ def extract_fulltext_with_spacing(
         - Handles XML namespaced tags by extracting the local name (part after '}').
         - Special handling for 'space' elements with unit='chars' attribute.
         - Preserves tail text from child elements.
-        - Automatically collapses multiple spaces into single spaces using regex.
+        - Automatically collapses multiple spaces into single spaces.
     """
 
     if tag_blacklist is None:
         tag_blacklist = []
-
-    def extract_text_recursive(element):
-        try:
-            if hasattr(element.tag, "split"):
-                element_tag_name = element.tag.split("}")[-1]
-            else:
-                element_tag_name = str(element.tag).split("}")[-1]
-        except (AttributeError, TypeError):
-            element_tag_name = ""
-
-        if element_tag_name in tag_blacklist:
-            return ""
-
-        text_parts = []
-
-        if element.text:
-            text_parts.append(element.text)
-
-        # Process children
-        for child in element:
-            try:
-                if hasattr(child.tag, "split"):
-                    tag_name = child.tag.split("}")[-1]  # Remove namespace
-                else:
-                    tag_name = str(child.tag).split("}")[-1]
-            except (AttributeError, TypeError):
-                # Skip if we can't determine the tag name
-                if hasattr(child, "tail") and child.tail:
-                    text_parts.append(child.tail)
-                continue
-
-            # Handle space elements
-            if tag_name == "space":
-                unit = child.get("unit", "")
-                if unit == "chars":
-                    # Add space for char-based spacing elements
-                    text_parts.append(" ")
-                # Add tail text before continuing
-                if child.tail:
-                    text_parts.append(child.tail)
-                continue
-
-            # Add space before block elements
-            if tag_name in block_elements:
-                text_parts.append(" ")
-
-            # Process child recursively
-            child_text = extract_text_recursive(child)
-            if child_text:
-                text_parts.append(child_text)
-
-            # Add space after block elements
-            if tag_name in block_elements:
-                text_parts.append(" ")
-
-            # Add tail text
-            if child.tail:
-                text_parts.append(child.tail)
-
-        return "".join(text_parts)
-
-    result = extract_text_recursive(root_node)
-    result = re.sub(r"\s+", " ", result).strip()
-    return result
+    return _fulltext_extractor(
+        tuple(tag_blacklist), tuple(block_elements), ("space",), True
+    )(root_node)
@@ -0,0 +1,153 @@
+"""Atomic writes of XML documents and a queue writing them in background threads"""
+
+import os
+import queue
+import threading
+
+from lxml import etree as ET
+
+from acdh_tei_pyutils.stats import IO_TIMES
+
+
+def write_tree(tree, file_path: str, xml_declaration: bool = True) -> str:
+    """serializes a tree like `XMLReader.tree_to_file` but never leaves a partly written file
+
+    The document is written into a temporary file next to `file_path` which then\
+    replaces `file_path` with `os.replace`, so readers (and an interrupted run) see\
+    either the old or the new document. The permissions of an existing file are kept,\
+    new files get the default permissions; if `file_path` is a symlink its target is\
+    replaced.
+
+    :param tree: an lxml element tree or element
+    :param file_path: the location to save the document to
+    :param xml_declaration: add an XML declaration
+    :return: the save-location
+    """
+    with IO_TIMES.timing("serialize"):
+        _write_tree(tree, file_path, xml_declaration)
+    return file_path
+
+
+def _create_temp_file(dir_name: str, base_name: str) -> tuple[int, str]:
+    """creates a hidden file next to `base_name` with the mode a new file would get"""
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        tmp_path = os.path.join(dir_name, f".{base_name}.{os.urandom(4).hex()}.tmp")
+        try:
+            # unlike tempfile.mkstemp the umask of the process applies
+            return os.open(tmp_path, flags, 0o666), tmp_path
+        except FileExistsError:
+            continue
+
+
+def _write_tree(tree, file_path: str, xml_declaration: bool) -> None:
+    data = ET.tostring(tree, xml_declaration=xml_declaration or None, encoding="UTF-8")
+    file_path = os.path.realpath(file_path)
+    try:
+        mode = os.stat(file_path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = None
+    fd, tmp_path = _create_temp_file(*os.path.split(file_path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class WriteBehindQueue:
+    """writes documents in background threads while the caller goes on parsing
+
+    `write` puts a document into a bounded queue which is drained by `workers`\
+    threads; lxml releases the GIL while serializing, so parsing the next document\
+    overlaps with writing the previous ones. If the queue is full `write` blocks, so\
+    at most `maxsize` documents wait in memory. Every file is written with\
+    `write_tree`. With `workers=0` documents are written right away in the calling thread.
+
+    A queued document must not be changed anymore, and documents sharing elements\
+    with it must not be changed until it was written, see `flush`.
+    """
+
+    def __init__(self, workers: int = 2, maxsize: int = 16):
+        """
+        :param workers: number of writer threads, `0` writes synchronously
+        :param maxsize: the maximum number of documents waiting to be written
+        """
+        self.workers = workers
+        self.written = 0
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max(maxsize, 1))
+        self._threads = [
+            threading.Thread(target=self._drain, name=f"write-behind-{n}")
+            for n in range(workers)
+        ]
+        for x in self._threads:
+            x.start()
+
+    def _write(self, doc, file_path: str) -> None:
+        tree = getattr(doc, "tree", doc)
+        try:
+            write_tree(tree, file_path)
+        except Exception as e:
+            with self._lock:
+                self.errors[file_path] = f"failed to write {file_path} due to {e}"
+            return
+        with self._lock:
+            self.written += 1
+
+    def _drain(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            finally:
+                self._queue.task_done()
+
+    def write(self, doc, file_path: str) -> None:
+        """queues a document for writing
+
+        :param doc: an `XMLReader` (e.g. a `TeiEnricher`), an lxml tree or element
+        :param file_path: the location to save the document to
+        """
+        if not self._threads:
+            self._write(doc, file_path)
+            return
+        self._queue.put((doc, file_path))
+
+    def flush(self) -> dict:
+        """waits until all queued documents are written
+
+        :return: a dict mapping the paths of files which could not be written to\
+            error messages
+        """
+        self._queue.join()
+        return self.errors
+
+    def close(self) -> dict:
+        """writes all queued documents and stops the writer threads
+
+        :return: a dict mapping the paths of files which could not be written to\
+            error messages
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for x in self._threads:
+            x.join()
+        self._threads = []
+        return self.errors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,181 @@
+"""A process-wide cache of compiled XPath expressions and an opt-in profiler of their evaluations"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from lxml import etree as ET
+
+
+class XPathProfile:
+    """aggregates the time spent evaluating XPath expressions by expression
+
+    See `enable_xpath_profiling`. Only evaluations in the current process are\
+    recorded, i.e. not those of worker processes started with `jobs` other than 1.
+    """
+
+    def __init__(self, callback=None):
+        """
+        :param callback: an optional callable receiving the expression and the seconds\
+            of every evaluation, e.g. to feed a metrics pipeline
+        """
+        self.callback = callback
+        self.expressions = {}
+        self._lock = threading.Lock()
+
+    def record(self, expression: str, seconds: float) -> None:
+        """adds an evaluation of `expression` which took `seconds`"""
+        with self._lock:
+            try:
+                entry = self.expressions[expression]
+            except KeyError:
+                entry = self.expressions[expression] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+        if self.callback is not None:
+            self.callback(expression, seconds)
+
+    def slowest(self, limit: int = 10, key: str = "total_seconds") -> list[dict]:
+        """returns the expressions ranked by the time spent evaluating them
+
+        :param limit: the maximum number of expressions, `None` returns all
+        :param key: rank by 'total_seconds', 'mean_seconds', 'max_seconds' or 'calls'
+        :return: a list of dicts with the keys `expression`, `calls`, `total_seconds`,\
+            `mean_seconds` and `max_seconds`
+        """
+        with self._lock:
+            rows = [
+                {
+                    "expression": expression,
+                    "calls": calls,
+                    "total_seconds": total,
+                    "mean_seconds": total / calls,
+                    "max_seconds": max_seconds,
+                }
+                for expression, (calls, total, max_seconds) in self.expressions.items()
+            ]
+        rows.sort(key=lambda x: x[key], reverse=True)
+        return rows[:limit] if limit is not None else rows
+
+    def table(self, limit: int = 10, key: str = "total_seconds") -> str:
+        """returns the result of `slowest` as a plain text table"""
+        lines = [
+            f"{'calls':>8} {'total s':>9} {'mean ms':>9} {'max ms':>9}  expression"
+        ]
+        for x in self.slowest(limit, key):
+            lines.append(
+                f"{x['calls']:>8} {x['total_seconds']:>9.3f} "
+                f"{x['mean_seconds'] * 1000:>9.3f} {x['max_seconds'] * 1000:>9.3f}"
+                f"  {x['expression']}"
+            )
+        return "\n".join(lines)
+
+    def clear(self) -> None:
+        """removes all recorded evaluations"""
+        with self._lock:
+            self.expressions.clear()
+
+
+class XPathCache:
+    """keeps compiled `lxml.etree.XPath` objects so expressions are compiled only once
+
+    `node.xpath(expression)` compiles the expression on every call. The cache is keyed\
+    by the expression and the namespace map; if it holds more than `maxsize`\
+    expressions the least recently used ones are evicted. If `profile` is set to an\
+    `XPathProfile` every evaluation through `__call__` is timed.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        """
+        :param maxsize: the maximum number of cached expressions
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.profile = None
+        self._compiled = OrderedDict()
+
+    def compile(self, expression: str, namespaces: dict = None) -> ET.XPath:
+        """returns the cached compiled expression or compiles and caches it
+
+        :param expression: an XPath expression
+        :param namespaces: a dict mapping prefixes used in the expression to namespace URIs
+        :raises: `lxml.etree.XPathSyntaxError` if the expression is invalid
+        :return: an `lxml.etree.XPath` object
+        """
+        key = (expression, tuple(namespaces.items()) if namespaces else None)
+        try:
+            compiled = self._compiled[key]
+        except KeyError:
+            self.misses += 1
+            compiled = ET.XPath(expression, namespaces=namespaces)
+            self._compiled[key] = compiled
+            if len(self._compiled) > self.maxsize:
+                self._compiled.popitem(last=False)
+            return compiled
+        self.hits += 1
+        self._compiled.move_to_end(key)
+        return compiled
+
+    def __call__(self, node, expression: str, namespaces: dict = None):
+        """evaluates the expression against the passed in element or tree
+
+        :return: the result of the xpath
+        """
+        compiled = self.compile(expression, namespaces)
+        profile = self.profile
+        if profile is None:
+            return compiled(node)
+        start = time.perf_counter()
+        try:
+            return compiled(node)
+        finally:
+            profile.record(expression, time.perf_counter() - start)
+
+    def clear(self) -> None:
+        """removes all compiled expressions and resets the counters"""
+        self._compiled.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._compiled)
+
+
+XPATH_CACHE = XPathCache()
+
+
+def cached_xpath(node, expression: str, namespaces: dict = None):
+    """evaluates an XPath expression using the compiled expressions of `XPATH_CACHE`
+
+    :param node: an lxml element or element tree
+    :param expression: an XPath expression
+    :param namespaces: a dict mapping prefixes used in the expression to namespace URIs
+    :return: the result of the xpath
+    """
+    return XPATH_CACHE(node, expression, namespaces)
+
+
+def enable_xpath_profiling(callback=None) -> XPathProfile:
+    """times every evaluation of `cached_xpath`, i.e. also of `TeiReader.any_xpath` and\
+    `utils.any_xpath`, until `disable_xpath_profiling` is called
+
+    While profiling is disabled, evaluating an expression costs only one attribute\
+    lookup more.
+
+    :param callback: see `XPathProfile`
+    :return: the `XPathProfile` collecting the times
+    """
+    XPATH_CACHE.profile = XPathProfile(callback)
+    return XPATH_CACHE.profile
+
+
+def disable_xpath_profiling() -> XPathProfile:
+    """stops timing evaluations
+
+    :return: the `XPathProfile` of the last `enable_xpath_profiling` call or None
+    """
+    profile = XPATH_CACHE.profile
+    XPATH_CACHE.profile = None
+    return profile
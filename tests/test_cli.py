@@ -72,3 +72,67 @@ class MentionsToIndex(unittest.TestCase):
         print(result.exception)
         assert result.exception is None
         assert result.exit_code == 0
+
+
+class DenormalizeIndices(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.cli.denormalize_indices`."""
+
+    def setUp(self):
+        self.test_path = "/tmp/acdh_pyutil_cli_denormalize_test"
+        os.makedirs(f"{self.test_path}/editions", exist_ok=True)
+        os.makedirs(f"{self.test_path}/indices", exist_ok=True)
+        self.edition_path = f"{self.test_path}/editions/doc_1.xml"
+        self.index_path = f"{self.test_path}/indices/listperson.xml"
+        self.edition = """<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:base="https://example.org" xml:id="doc_1.xml">
+  <teiHeader><fileDesc><titleStmt><title>Brief 1</title></titleStmt></fileDesc></teiHeader>
+  <text><body><p><rs type="person" ref="#p1">Maxi</rs></p></body></text>
+</TEI>
+"""
+        self.index = """<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xml:id="listperson.xml">
+  <text><body><listPerson>
+    <person xml:id="p1"><persName>Maxi Muster</persName></person>
+  </listPerson></body></text>
+</TEI>
+"""
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.test_path)
+
+    def run_cli(self, *options) -> bytes:
+        import click.testing
+
+        from acdh_tei_pyutils.cli import denormalize_indices
+
+        with open(self.edition_path, "w") as f:
+            f.write(self.edition)
+        with open(self.index_path, "w") as f:
+            f.write(self.index)
+        args = ["-f", f"{self.test_path}/editions/*.xml"]
+        args += ["-i", f"{self.test_path}/indices/*.xml"]
+        args += ["-x", ".//tei:title/text()", *options]
+        runner = click.testing.CliRunner()
+        result = runner.invoke(denormalize_indices, args, catch_exceptions=False)
+        assert result.exit_code == 0
+        with open(self.edition_path, "rb") as f:
+            return f.read()
+
+    def test_001_default_output(self):
+        output = self.run_cli()
+        # the entry is moved into the edition without the namespaces of the index root
+        self.assertIn(b'<person xml:id="p1">', output)
+        self.assertNotIn(b"xmlns:xsi", output)
+
+    def test_002_options_keep_output(self):
+        output = self.run_cli()
+        for options in (
+            ["--write-behind", "2"],
+            ["-j", "2"],
+            ["--cache-mb", "0"],
+            ["--manifest", f"{self.test_path}/manifest.json"],
+            ["--entity-store", f"{self.test_path}/entities.db"],
+        ):
+            self.assertEqual(self.run_cli(*options), output, options)
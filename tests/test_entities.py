@@ -0,0 +1,387 @@
+"""Tests for `acdh_tei_pyutils.entities` module."""
+
+import copy
+import os
+import pickle
+import shutil
+import unittest
+
+from lxml import etree as ET
+
+from acdh_tei_pyutils.entities import (
+    EntityProjection,
+    EntityStore,
+    ProjectedEntities,
+    SerializedEntities,
+    build_join_index,
+    denormalize_file,
+    denormalize_files,
+    denormalize_incremental,
+    load_entities,
+    project_entities,
+)
+from acdh_tei_pyutils.manifest import Manifest
+from acdh_tei_pyutils.mentions import collect_mentions
+from acdh_tei_pyutils.tei import TeiEnricher, TeiReader
+from acdh_tei_pyutils.writer import WriteBehindQueue, write_tree
+
+TEST_PATH = "/tmp/acdh_pyutil_entities_test"
+
+INDEX = """<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0">
+    <text>
+        <body>
+            <listPerson>
+                <person xml:id="person_1"><persName>Maxi Muster</persName></person>
+                <person xml:id="person_2"><persName>Erika Muster</persName></person>
+            </listPerson>
+            <listPlace>
+                <place xml:id="place_1"><placeName>Wien</placeName></place>
+            </listPlace>
+        </body>
+    </text>
+</TEI>
+"""
+
+NESTED_INDEX = """<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0">
+    <text>
+        <body>
+            <listPlace>
+                <place xml:id="place_1"><placeName>Wien</placeName>
+                    <place xml:id="place_2"><placeName>Leopoldstadt</placeName></place>
+                </place>
+            </listPlace>
+        </body>
+    </text>
+</TEI>
+"""
+
+EDITION = """<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:base="https://example.org" xml:id="letter.xml">
+    <text>
+        <body>
+            <p><rs ref="#person_2 #place_1">A</rs> and <rs ref="#person_2">B</rs></p>
+            <p><rs ref="#unknown">C</rs></p>
+        </body>
+        <back><p>outdated</p></back>
+    </text>
+</TEI>
+"""
+
+
+LETTER = """<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:base="https://example.org" xml:id="letter_{n}.xml">
+    <teiHeader><fileDesc><titleStmt><title>Letter {n}</title></titleStmt></fileDesc></teiHeader>
+    <text>
+        <body>
+            <p>Text {n} <rs ref="#{ref}">A</rs></p>
+        </body>
+    </text>
+</TEI>
+"""
+
+SETTINGS = {
+    "mention_xpath": ".//tei:rs[@ref]/@ref",
+    "title_xpath": ".//tei:title/text()",
+    "title_sec_xpath": None,
+    "date_xpath": None,
+    "standoff": False,
+    "blacklist_ids": [],
+    "streaming": False,
+}
+
+
+class TestEntities(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.entities` functions."""
+
+    def setUp(self):
+        os.makedirs(TEST_PATH, exist_ok=True)
+        self.index_path = os.path.join(TEST_PATH, "listperson.xml")
+        self.edition_path = os.path.join(TEST_PATH, "letter.xml")
+        with open(self.index_path, "w") as f:
+            f.write(INDEX)
+        with open(self.edition_path, "w") as f:
+            f.write(EDITION)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_PATH)
+
+    def test_001_serialized_entities(self):
+        entities = load_entities([self.index_path])
+        serialized = SerializedEntities(entities)
+        self.assertEqual(len(serialized), 3)
+        self.assertEqual(list(serialized), list(entities))
+        for key, value in entities.items():
+            self.assertEqual(
+                ET.tostring(serialized[key]), ET.tostring(value, with_tail=True)
+            )
+        self.assertRaises(KeyError, lambda: serialized["unknown"])
+
+    def test_002_denormalize_file(self):
+        entities = SerializedEntities(load_entities([self.index_path]))
+        self.assertIsNone(denormalize_file(self.edition_path, entities=entities))
+        doc = TeiReader(self.edition_path)
+        self.assertEqual(len(doc.any_xpath(".//tei:back")), 1)
+        self.assertEqual(doc.any_xpath(".//tei:back//@xml:id"), ["place_1", "person_2"])
+
+    def test_003_denormalize_file_error(self):
+        error = denormalize_file(
+            os.path.join(TEST_PATH, "missing.xml"), entities=SerializedEntities({})
+        )
+        self.assertTrue(error.startswith("failed to process"))
+
+    def test_004_entity_store(self):
+        with open(self.index_path, "w") as f:
+            f.write(
+                INDEX.replace(
+                    "<TEI ",
+                    '<TEI xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ',
+                )
+            )
+        db_path = os.path.join(TEST_PATH, "entities.db")
+        entities = load_entities([self.index_path])
+        store = EntityStore(db_path)
+        self.assertTrue(store.update([self.index_path]))
+        self.assertFalse(store.update([self.index_path]))
+        self.assertEqual(len(store), 3)
+        self.assertCountEqual(list(store), list(entities))
+        self.assertEqual(
+            ET.tostring(store["place_1"]),
+            ET.tostring(copy.deepcopy(entities["place_1"])),
+        )
+        self.assertRaises(KeyError, lambda: store["unknown"])
+        # only the namespaces used by an entity are declared
+        self.assertNotIn(b"xmlns:xsi", ET.tostring(store["person_1"]))
+        copied = pickle.loads(pickle.dumps(store))
+        self.assertEqual(copied["person_1"].tag, entities["person_1"].tag)
+        store.close()
+        with open(self.index_path, "a") as f:
+            f.write("<!-- changed -->")
+        self.assertTrue(EntityStore(db_path).update([self.index_path]))
+        self.assertIsNone(denormalize_file(self.edition_path, entities=copied))
+        doc = TeiReader(self.edition_path)
+        self.assertEqual(doc.any_xpath(".//tei:back//@xml:id"), ["place_1", "person_2"])
+        with open(self.edition_path, "rb") as f:
+            self.assertNotIn(b"xmlns:xsi", f.read())
+        # stores of an older version are rebuilt
+        store = EntityStore(db_path)
+        store.con.execute("PRAGMA user_version = 0")
+        self.assertTrue(store.update([self.index_path]))
+        self.assertFalse(store.update([self.index_path]))
+        store.close()
+
+    def test_005_build_join_index(self):
+        doc = TeiReader(
+            """<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><list xmlns="">
+            <item target="1900-01-02"><ref>person_2</ref><ref>person_1</ref></item>
+            <item target="1900-01-01"><ref>person_1</ref></item>
+            <item><ref>person_3</ref></item>
+            <item target="1900-01-02"><ref>place_1</ref></item>
+            </list></body></text></TEI>"""
+        )
+        join_index = build_join_index(doc)
+        self.assertEqual(
+            join_index,
+            {
+                "1900-01-02": ["person_2", "person_1", "place_1"],
+                "1900-01-01": ["person_1"],
+            },
+        )
+        for key, value in join_index.items():
+            self.assertEqual(
+                doc.any_xpath(f".//item[@target='{key}']/ref/text()"), value
+            )
+        self.assertEqual(
+            build_join_index(doc, item_xpath=".//item[ref='person_1']"),
+            {"1900-01-02": ["person_2", "person_1"], "1900-01-01": ["person_1"]},
+        )
+
+    def test_006_entity_projection(self):
+        entities = load_entities([self.index_path])
+        for ent in entities.values():
+            note_grp = ET.SubElement(ent, "{http://www.tei-c.org/ns/1.0}noteGrp")
+            for n in range(3):
+                ET.SubElement(note_grp, "{http://www.tei-c.org/ns/1.0}note").text = str(
+                    n
+                )
+        self.assertFalse(EntityProjection())
+        self.assertIs(project_entities(entities, EntityProjection()), entities)
+        serialized = SerializedEntities(entities)
+        projected = project_entities(serialized, EntityProjection(max_notes=2))
+        self.assertIsInstance(projected, ProjectedEntities)
+        self.assertEqual(projected["person_1"].xpath("*[2]/*/text()"), ["0", "1"])
+        self.assertEqual(len(serialized["person_1"].xpath("*[2]/*")), 3)
+        copied = pickle.loads(pickle.dumps(projected))
+        self.assertEqual(len(copied["place_1"].xpath("*[2]/*")), 2)
+        projected = project_entities(
+            serialized, EntityProjection(keep=["persName", "placeName"])
+        )
+        self.assertEqual(
+            [x.tag.split("}")[-1] for x in projected["place_1"]], ["placeName"]
+        )
+        projection = EntityProjection(strip=["noteGrp"])
+        self.assertEqual(
+            projection.settings(),
+            {
+                "strip": ["{http://www.tei-c.org/ns/1.0}noteGrp"],
+                "max_notes": None,
+                "keep": [],
+            },
+        )
+        self.assertIs(project_entities(entities, projection), entities)
+        self.assertIsNone(denormalize_file(self.edition_path, entities=entities))
+        doc = TeiReader(self.edition_path)
+        self.assertEqual(doc.any_xpath(".//tei:back//@xml:id"), ["place_1", "person_2"])
+        self.assertEqual(doc.any_xpath(".//tei:noteGrp"), [])
+
+    def test_007_denormalize_files_parallel(self):
+        # the index declares a namespace its entities do not use
+        with open(self.index_path, "w") as f:
+            f.write(
+                INDEX.replace(
+                    "<TEI ",
+                    '<TEI xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ',
+                )
+            )
+        outputs = {}
+        for jobs in (1, 2):
+            files = []
+            for n in range(4):
+                file_path = os.path.join(TEST_PATH, f"letter_{jobs}_{n}.xml")
+                shutil.copy(self.edition_path, file_path)
+                files.append(file_path)
+            errors = denormalize_files(
+                files, load_entities([self.index_path]), jobs=jobs
+            )
+            self.assertEqual(list(errors.values()), [None] * 4)
+            outputs[jobs] = []
+            for x in files:
+                with open(x, "rb") as f:
+                    outputs[jobs].append(f.read())
+        self.assertEqual(outputs[1], outputs[2])
+        self.assertIn(b'<person xml:id="person_2">', outputs[2][0])
+        self.assertNotIn(b"xmlns:xsi", outputs[2][0])
+        # a single file is processed in process, with the passed in entities
+        file_path = os.path.join(TEST_PATH, "letter_single.xml")
+        shutil.copy(self.edition_path, file_path)
+        errors = denormalize_files(
+            [file_path], load_entities([self.index_path]), jobs=2
+        )
+        self.assertEqual(errors, {file_path: None})
+        with open(file_path, "rb") as f:
+            self.assertEqual(f.read(), outputs[1][0])
+
+    def write_corpus(self, dir_name: str) -> tuple[list, list]:
+        """writes three letters mentioning one entity each and the index"""
+        os.makedirs(dir_name)
+        files = []
+        for n, ref in enumerate(["person_1", "person_2", "place_1"], 1):
+            files.append(os.path.join(dir_name, f"letter_{n}.xml"))
+            with open(files[-1], "w") as f:
+                f.write(LETTER.format(n=n, ref=ref))
+        index_path = os.path.join(dir_name, "listperson.xml")
+        with open(index_path, "w") as f:
+            f.write(INDEX)
+        return files, [index_path]
+
+    def change_corpus(self, files: list, index_files: list) -> None:
+        """edits the text of the first letter and the entry of the second one"""
+        for file_path, old, new in (
+            (files[0], "Text 1", "Changed text 1"),
+            (index_files[0], "Erika Muster", "Erika Musterfrau"),
+        ):
+            with open(file_path) as f:
+                content = f.read()
+            with open(file_path, "w") as f:
+                f.write(content.replace(old, new))
+
+    def read_all(self, paths: list) -> list:
+        result = []
+        for x in paths:
+            with open(x, "rb") as f:
+                result.append(f.read())
+        return result
+
+    def test_008_denormalize_incremental(self):
+        files, index_files = self.write_corpus(os.path.join(TEST_PATH, "inc"))
+        manifest_path = os.path.join(TEST_PATH, "manifest.json")
+        messages = []
+        errors = denormalize_incremental(
+            files, index_files, Manifest(manifest_path, SETTINGS), echo=messages.append
+        )
+        self.assertEqual(errors, [])
+        self.assertEqual(messages[-1], "3 changed index entries, writing 3 files")
+        self.change_corpus(files, index_files)
+        # files written again get a new modification time
+        for x in files + index_files:
+            os.utime(x, (0, 0))
+        messages = []
+        errors = denormalize_incremental(
+            files, index_files, Manifest(manifest_path, SETTINGS), echo=messages.append
+        )
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            messages,
+            [
+                "collecting list of mentions from 1 new or changed docs",
+                "1 changed index entries, writing 2 files",
+            ],
+        )
+        self.assertEqual([os.stat(x).st_mtime != 0 for x in files], [True, True, False])
+
+        # a full run on the changed corpus
+        full_files, full_index_files = self.write_corpus(
+            os.path.join(TEST_PATH, "full")
+        )
+        self.change_corpus(full_files, full_index_files)
+        ref_doc_dict = collect_mentions(
+            full_files,
+            title_xpath=SETTINGS["title_xpath"],
+        )
+        for x in full_index_files:
+            doc = TeiEnricher(x)
+            doc.add_mention_lists(ref_doc_dict)
+            write_tree(doc.tree, x)
+        errors = denormalize_files(full_files, load_entities(full_index_files))
+        self.assertEqual(list(errors.values()), [None] * 3)
+        self.assertEqual(
+            self.read_all(files + index_files),
+            self.read_all(full_files + full_index_files),
+        )
+
+    def denormalize_nested(self, name: str, entities, **kwargs) -> list:
+        """denormalizes two letters mentioning a place and a place nested in it"""
+        files = []
+        for n in range(2):
+            files.append(os.path.join(TEST_PATH, f"nested_{name}_{n}.xml"))
+            with open(files[-1], "w") as f:
+                f.write(EDITION.replace("#person_2 #place_1", "#place_2 #place_1"))
+        errors = denormalize_files(files, entities, **kwargs)
+        self.assertEqual(list(errors.values()), [None, None])
+        return self.read_all(files)
+
+    def test_009_nested_entities(self):
+        with open(self.index_path, "w") as f:
+            f.write(NESTED_INDEX)
+        output = self.denormalize_nested("dict", load_entities([self.index_path]))
+        # the nested place is moved out of its parent
+        doc = TeiReader(output[0].decode())
+        self.assertCountEqual(
+            doc.any_xpath(".//tei:back//@xml:id"), ["place_1", "place_2"]
+        )
+        self.assertEqual(
+            self.denormalize_nested("jobs", load_entities([self.index_path]), jobs=2),
+            output,
+        )
+        store = EntityStore(os.path.join(TEST_PATH, "nested.db"))
+        store.update([self.index_path])
+        self.assertEqual(self.denormalize_nested("store", store), output)
+        store.close()
+        with WriteBehindQueue(workers=2) as writer:
+            self.assertEqual(
+                self.denormalize_nested(
+                    "writer", load_entities([self.index_path]), writer=writer
+                ),
+                output,
+            )
@@ -0,0 +1,99 @@
+"""Tests for `acdh_tei_pyutils.fulltext` module."""
+
+import glob
+import json
+import os
+import shutil
+import unittest
+
+from lxml import etree as ET
+
+from acdh_tei_pyutils.fulltext import FulltextExtractor, export_fulltext, file_fulltext
+
+TEI = "{http://www.tei-c.org/ns/1.0}"
+TEST_PATH = "/tmp/acdh_pyutil_fulltext_test"
+
+EDITION = """<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:id="letter_{n}.xml">
+    <teiHeader>
+        <fileDesc><titleStmt><title>Brief {n}</title></titleStmt></fileDesc>
+        <profileDesc><creation><date when="1900-01-0{n}"/></creation></profileDesc>
+    </teiHeader>
+    <text>
+        <body>
+            <div><p>Lieber<note>Anm.</note> Freund,</p><p>Gruß</p></div>
+        </body>
+    </text>
+</TEI>
+"""
+
+
+class TestFulltext(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.fulltext.FulltextExtractor`."""
+
+    def test_001_extract(self):
+        root = ET.fromstring(
+            """<div xmlns="http://www.tei-c.org/ns/1.0"><p>Lieber<lb/>Freund,<space unit="chars">xx</space>wie
+            <abbr>geht's</abbr><!-- Kommentar --></p><p>Gruß</p></div>"""
+        )
+        self.assertEqual(
+            FulltextExtractor()(root),
+            "LieberFreund,xxwie geht's Kommentar Gruß",
+        )
+        extractor = FulltextExtractor(
+            [f"{TEI}abbr"], [f"{TEI}p"], [f"{TEI}space"], local_names=False
+        )
+        self.assertEqual(extractor(root), "LieberFreund, wie Kommentar Gruß")
+        extractor = FulltextExtractor(["abbr", "div"], ["p"], ["space"], True)
+        self.assertEqual(extractor(root[0]), "LieberFreund, wie Kommentar")
+        self.assertEqual(extractor(root), "")
+
+    def test_002_deep_nesting(self):
+        root = ET.Element(f"{TEI}p")
+        node = root
+        for _ in range(5000):
+            node = ET.SubElement(node, f"{TEI}seg")
+            node.text = "a"
+            node.tail = " "
+        extractor = FulltextExtractor(block_elements=["seg"], local_names=True)
+        self.assertEqual(extractor(root), " ".join(["a"] * 5000))
+
+    def test_003_export_fulltext(self):
+        os.makedirs(TEST_PATH, exist_ok=True)
+        self.addCleanup(shutil.rmtree, TEST_PATH, ignore_errors=True)
+        for n in range(1, 6):
+            with open(os.path.join(TEST_PATH, f"letter_{n}.xml"), "w") as f:
+                f.write(EDITION.format(n=n))
+        files = sorted(glob.glob(f"{TEST_PATH}/*.xml"))
+        doc, error = file_fulltext(
+            files[0],
+            date_xpath=".//tei:creation/tei:date/@when",
+            tag_blacklist=["note"],
+        )
+        self.assertIsNone(error)
+        self.assertEqual(
+            doc,
+            {
+                "id": "letter_1.xml",
+                "title": "Brief 1",
+                "date": "1900-01-01",
+                "file": files[0],
+                "fulltext": "Lieber Freund, Gruß",
+            },
+        )
+        doc, error = file_fulltext(files[0], id_xpath="./@n", block_elements=[])
+        self.assertEqual(doc["id"], "letter_1")
+        self.assertIsNone(doc["date"])
+        self.assertEqual(doc["fulltext"], "LieberAnm. Freund,Gruß")
+        output = os.path.join(TEST_PATH, "out", "fulltext.jsonl")
+        written, errors = export_fulltext(
+            files + [os.path.join(TEST_PATH, "missing.xml")], output, jobs=2
+        )
+        self.assertEqual(written, 5)
+        self.assertEqual(list(errors), [os.path.join(TEST_PATH, "missing.xml")])
+        with open(output, encoding="utf-8") as f:
+            docs = [json.loads(line) for line in f]
+        self.assertEqual(
+            [x["title"] for x in docs], [f"Brief {n}" for n in range(1, 6)]
+        )
+        self.assertEqual(docs[4]["fulltext"], "LieberAnm. Freund, Gruß")
@@ -0,0 +1,72 @@
+"""Tests for `acdh_tei_pyutils.manifest` module."""
+
+import os
+import shutil
+import unittest
+
+from lxml import etree as ET
+
+from acdh_tei_pyutils.manifest import Manifest, entity_hash, file_hash, mentions_hash
+
+TEST_PATH = "/tmp/acdh_pyutil_manifest_test"
+
+DOC_DICT = {
+    "doc_uri": "https://example.org/letter.xml",
+    "doc_id": "letter.xml",
+    "doc_path": f"{TEST_PATH}/letter.xml",
+    "doc_title": "A letter",
+    "doc_title_sec": None,
+    "doc_date": "1900-01-01",
+}
+
+
+class TestManifest(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.manifest.Manifest` class."""
+
+    def setUp(self):
+        os.makedirs(TEST_PATH, exist_ok=True)
+        self.manifest_path = os.path.join(TEST_PATH, "manifest.json")
+        self.file_path = os.path.join(TEST_PATH, "letter.xml")
+        with open(self.file_path, "w") as f:
+            f.write("<TEI/>")
+
+    def tearDown(self):
+        shutil.rmtree(TEST_PATH)
+
+    def test_001_hashes(self):
+        self.assertEqual(len(file_hash(self.file_path)), 64)
+        self.assertNotEqual(mentions_hash([DOC_DICT]), mentions_hash([]))
+        node = ET.Element("person")
+        self.assertEqual(entity_hash(node), entity_hash(ET.Element("person")))
+
+    def test_002_round_trip(self):
+        settings = {"mention_xpath": ".//tei:rs/@ref"}
+        manifest = Manifest(self.manifest_path, settings)
+        self.assertEqual(
+            manifest.changed_files([self.file_path], manifest.editions),
+            [self.file_path],
+        )
+        manifest.editions[self.file_path] = {
+            "sha256": file_hash(self.file_path),
+            "doc": DOC_DICT,
+            "refs": ["person_1", "place_1"],
+        }
+        manifest.save()
+        manifest = Manifest(self.manifest_path, settings)
+        self.assertEqual(
+            manifest.changed_files([self.file_path], manifest.editions), []
+        )
+        ref_doc_dict = manifest.ref_doc_dict([self.file_path])
+        self.assertEqual(ref_doc_dict["person_1"], [DOC_DICT])
+        with open(self.file_path, "w") as f:
+            f.write("<TEI>changed</TEI>")
+        self.assertEqual(
+            manifest.changed_files([self.file_path], manifest.editions),
+            [self.file_path],
+        )
+
+    def test_003_changed_settings(self):
+        manifest = Manifest(self.manifest_path, {"standoff": False})
+        manifest.editions["foo"] = {"sha256": None, "doc": None, "refs": []}
+        manifest.save()
+        self.assertEqual(Manifest(self.manifest_path, {"standoff": True}).editions, {})
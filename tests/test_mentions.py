@@ -0,0 +1,115 @@
+"""Tests for `acdh_tei_pyutils.mentions` module."""
+
+import glob
+import os
+import pickle
+import shutil
+import unittest
+
+from acdh_tei_pyutils.mentions import (
+    MentionIndex,
+    collect_mentions,
+    harvest_mentions,
+    split_refs,
+    streaming_pattern,
+)
+
+TEST_PATH = "/tmp/acdh_pyutil_mentions_test"
+
+EDITION = """<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:base="https://example.org" xml:id="{doc_id}">
+    <teiHeader>
+        <title type="main">Letter {n}</title>
+    </teiHeader>
+    <text>
+        <body>
+            <p><rs ref="#person_{n}">A</rs> and <rs ref="#person_x #place_{n}">B</rs></p>
+        </body>
+    </text>
+</TEI>
+"""
+
+
+class TestMentions(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.mentions` functions."""
+
+    def setUp(self):
+        os.makedirs(TEST_PATH, exist_ok=True)
+        for n in range(6):
+            doc_id = f"letter_{n}.xml"
+            with open(os.path.join(TEST_PATH, doc_id), "w") as f:
+                f.write(EDITION.format(doc_id=doc_id, n=n))
+        self.files = sorted(glob.glob(f"{TEST_PATH}/*.xml"))
+
+    def tearDown(self):
+        shutil.rmtree(TEST_PATH)
+
+    def test_001_split_refs(self):
+        self.assertEqual(split_refs("#a"), ["a"])
+        self.assertEqual(split_refs("a"), ["a"])
+        self.assertEqual(split_refs("#a #b #c"), ["b", "c", "a"])
+        self.assertEqual(split_refs("#a #b", multi_refs=False), ["a #b"])
+
+    def test_002_harvest_mentions(self):
+        doc_dict, mentioned, errors = harvest_mentions(
+            self.files[0],
+            title_xpath='.//tei:title[@type="main"]/text()',
+            date_xpath=".//tei:date/@when",
+        )
+        self.assertEqual(doc_dict["doc_uri"], "https://example.org/letter_0.xml")
+        self.assertEqual(doc_dict["doc_title"], "Letter 0")
+        self.assertIsInstance(doc_dict["doc_title"], str)
+        self.assertEqual(mentioned, ["person_0", "place_0", "person_x"])
+        self.assertEqual(errors, ["ERROR in -d date xpath of file: letter_0.xml"])
+
+    def test_003_collect_mentions_parallel(self):
+        serial = collect_mentions(self.files, jobs=1)
+        parallel = collect_mentions(self.files, jobs=2)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(len(serial["person_x"]), 6)
+        self.assertEqual(serial["place_3"][0]["doc_id"], "letter_3.xml")
+
+    def test_004_streaming_pattern(self):
+        self.assertEqual(
+            streaming_pattern(".//tei:rs[@ref]/@ref"),
+            ("{http://www.tei-c.org/ns/1.0}rs", "ref", "ref"),
+        )
+        self.assertEqual(
+            streaming_pattern("//*/@xml:id"),
+            (None, None, "{http://www.w3.org/XML/1998/namespace}id"),
+        )
+        self.assertRaises(
+            ValueError, lambda: streaming_pattern(".//tei:rs[@type='person']/@ref")
+        )
+
+    def test_005_harvest_mentions_streaming(self):
+        kwargs = {
+            "title_xpath": './/tei:title[@type="main"]/text()',
+            "date_xpath": ".//tei:date/@when",
+        }
+        for x in self.files:
+            for mention_xpath in [".//tei:rs[@ref]/@ref", ".//*[@ref]/@ref"]:
+                self.assertEqual(
+                    harvest_mentions(x, mention_xpath=mention_xpath, **kwargs),
+                    harvest_mentions(
+                        x, mention_xpath=mention_xpath, streaming=True, **kwargs
+                    ),
+                )
+
+    def test_006_mention_index(self):
+        a, b, c = {"id": "a"}, {"id": "b"}, {"id": "c"}
+        index = MentionIndex()
+        index.add(a, ["#p1", "#p2", "#p1"])
+        index.add(b, [])
+        index.add(c, ["#p2"])
+        self.assertEqual(index.docs, [a, c])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(sorted(index), ["#p1", "#p2"])
+        self.assertEqual(index["#p1"], [a, a])
+        self.assertEqual(index["#p2"], [a, c])
+        self.assertEqual(index["#p2"][-1], c)
+        self.assertEqual(index["#p2"][1:], [c])
+        self.assertIsNone(index.get("#p3"))
+        self.assertIs(index["#p2"][0], a)
+        restored = pickle.loads(pickle.dumps(index))
+        self.assertEqual(dict(restored), dict(index))
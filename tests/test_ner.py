@@ -0,0 +1,80 @@
+"""Tests for `acdh_tei_pyutils.ner` module."""
+
+import glob
+import json
+import os
+import shutil
+import unittest
+
+from acdh_tei_pyutils.ner import ShardWriter, export_ne_offsets, file_ne_offsets
+
+TEST_PATH = "/tmp/acdh_pyutil_ner_test"
+
+EDITION = """<?xml version='1.0' encoding='UTF-8'?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0">
+    <text>
+        <body>
+            <p>Brief {n} aus <rs type="place">Wien</rs> an <rs type="person">Anna</rs></p>
+            <p> </p>
+            <p>Wien und <placeName>Prag</placeName></p>
+        </body>
+    </text>
+</TEI>
+"""
+
+
+class TestNer(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.ner` functions."""
+
+    def setUp(self):
+        os.makedirs(TEST_PATH, exist_ok=True)
+        for n in range(5):
+            with open(os.path.join(TEST_PATH, f"letter_{n}.xml"), "w") as f:
+                f.write(EDITION.format(n=n))
+        self.files = sorted(glob.glob(f"{TEST_PATH}/*.xml"))
+        self.out = os.path.join(TEST_PATH, "out")
+
+    def tearDown(self):
+        shutil.rmtree(TEST_PATH, ignore_errors=True)
+
+    def test_001_file_ne_offsets(self):
+        examples, error = file_ne_offsets(
+            self.files[0], ne_xpath=".//tei:rs|.//tei:placeName"
+        )
+        self.assertIsNone(error)
+        self.assertEqual(
+            examples,
+            [
+                (
+                    "Brief 0 aus Wien an Anna",
+                    {"entities": [(12, 16, "LOC"), (20, 24, "PER")]},
+                ),
+                ("Wien und Prag", {"entities": [(9, 13, "LOC")]}),
+            ],
+        )
+        examples, error = file_ne_offsets(
+            self.files[0], NER_TAG_MAP={"place": "GPE"}, skip_empty=False
+        )
+        self.assertEqual(len(examples), 3)
+        self.assertEqual(
+            examples[0][1]["entities"], [(12, 16, "GPE"), (20, 24, "MISC")]
+        )
+        examples, error = file_ne_offsets(os.path.join(TEST_PATH, "missing.xml"))
+        self.assertEqual(examples, [])
+        self.assertIn("missing.xml", error)
+
+    def test_002_export_shards(self):
+        with ShardWriter(self.out, max_bytes=200) as writer:
+            errors = export_ne_offsets(self.files, writer, jobs=2)
+        self.assertEqual(errors, {})
+        self.assertEqual(writer.examples, 10)
+        self.assertEqual(writer.entities, 10)
+        self.assertEqual(len(writer.shards), 5)
+        self.assertEqual(sorted(glob.glob(f"{self.out}/*.jsonl")), writer.shards)
+        lines = []
+        for x in writer.shards:
+            with open(x, encoding="utf-8") as f:
+                lines += [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(lines[2]["file"], self.files[1])
+        self.assertEqual(lines[2]["entities"], [[12, 16, "LOC"], [20, 24, "PER"]])
@@ -0,0 +1,41 @@
+"""Tests for `acdh_tei_pyutils.parallel` module."""
+
+import glob
+import os
+import shutil
+import unittest
+
+from acdh_tei_pyutils.parallel import parallel_map
+
+TEST_PATH = "/tmp/acdh_pyutil_parallel_test"
+
+
+def touch(n: int, dir_name: str) -> int:
+    """creates a file for every processed item"""
+    with open(os.path.join(dir_name, f"{n}.done"), "w"):
+        pass
+    return n * 2
+
+
+class TestParallel(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.parallel.parallel_map`."""
+
+    def setUp(self):
+        os.makedirs(TEST_PATH, exist_ok=True)
+        self.addCleanup(shutil.rmtree, TEST_PATH, ignore_errors=True)
+
+    def test_001_order(self):
+        items = list(range(40))
+        for jobs in (1, 2):
+            self.assertEqual(
+                list(parallel_map(touch, items, jobs=jobs, dir_name=TEST_PATH)),
+                [x * 2 for x in items],
+            )
+
+    def test_002_bounded_window(self):
+        # only a window of chunks is submitted ahead of the consumer
+        items = list(range(40))
+        results = parallel_map(touch, items, jobs=2, chunksize=1, dir_name=TEST_PATH)
+        self.assertEqual(next(results), 0)
+        results.close()
+        self.assertLessEqual(len(glob.glob(f"{TEST_PATH}/*.done")), 4)
@@ -0,0 +1,45 @@
+"""Tests for `acdh_tei_pyutils.session` module."""
+
+import glob
+import os
+import unittest
+
+from acdh_tei_pyutils.session import TreeCache
+from acdh_tei_pyutils.tei import TeiEnricher, TeiReader
+
+FILES = sorted(glob.glob("./src/acdh_tei_pyutils/files/*.xml", recursive=False))
+
+
+class TestTreeCache(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.session.TreeCache` class."""
+
+    def test_001_get(self):
+        cache = TreeCache()
+        doc = cache.get(FILES[0])
+        self.assertIsInstance(doc, TeiEnricher)
+        self.assertIs(cache.get(FILES[0]), doc)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIn(FILES[0], cache)
+        self.assertIn(os.path.abspath(FILES[0]), cache)
+
+    def test_002_take(self):
+        cache = TreeCache()
+        doc = cache.get(FILES[0], doc_class=TeiReader)
+        self.assertIs(cache.take(FILES[0]), doc)
+        self.assertNotIn(FILES[0], cache)
+        self.assertIsNot(cache.take(FILES[0]), doc)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_003_eviction(self):
+        sizes = [os.path.getsize(x) for x in FILES]
+        cache = TreeCache(size_factor=1)
+        cache.max_bytes = sum(sizes) - 1
+        for x in FILES:
+            cache.get(x)
+        self.assertNotIn(FILES[0], cache)
+        self.assertIn(FILES[-1], cache)
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        cache = TreeCache(max_mb=0)
+        cache.get(FILES[0])
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,56 @@
+"""Tests for `acdh_tei_pyutils.stats` module."""
+
+import json
+import os
+import shutil
+import unittest
+
+from acdh_tei_pyutils.stats import RunStats
+from acdh_tei_pyutils.tei import TeiReader
+from acdh_tei_pyutils.writer import write_tree
+
+TEST_PATH = "/tmp/acdh_pyutil_stats_test"
+DOC = """<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><p>{n}</p></body></text></TEI>"""
+
+
+class TestStats(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.stats` classes."""
+
+    def setUp(self):
+        os.makedirs(TEST_PATH, exist_ok=True)
+        self.files = []
+        for n in range(3):
+            file_path = os.path.join(TEST_PATH, f"doc_{n}.xml")
+            with open(file_path, "w") as f:
+                f.write(DOC.format(n=n))
+            self.files.append(file_path)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_PATH)
+
+    def test_001_run_stats(self):
+        size = sum(os.path.getsize(x) for x in self.files)
+        stats = RunStats("test", trace_memory=True)
+        stats.begin("read", self.files)
+        docs = [TeiReader(x) for x in self.files]
+        stats.begin("write", self.files[:2])
+        for doc, x in zip(docs, self.files[:2]):
+            write_tree(doc.tree, x)
+        stats.begin("nothing")
+        report_path = os.path.join(TEST_PATH, "stats.json")
+        report = stats.write(report_path)
+        with open(report_path) as f:
+            self.assertEqual(json.load(f), report)
+        self.assertEqual(report["command"], "test")
+        read, write, nothing = report["phases"]
+        self.assertEqual(read["name"], "read")
+        self.assertEqual(read["files"], 3)
+        self.assertEqual(read["bytes"], size)
+        self.assertEqual((read["parse_count"], read["serialize_count"]), (3, 0))
+        self.assertEqual((write["parse_count"], write["serialize_count"]), (0, 2))
+        self.assertEqual(nothing["files"], 0)
+        for phase in report["phases"]:
+            self.assertGreaterEqual(phase["wall_seconds"], 0)
+            self.assertIn("tracemalloc_peak_mb", phase)
+        self.assertGreater(report["peak_rss_mb"], 0)
+        self.assertGreaterEqual(report["wall_seconds"], read["wall_seconds"])
@@ -0,0 +1,51 @@
+"""Tests for `acdh_tei_pyutils.synthetic` module."""
+
+import shutil
+import unittest
+
+from acdh_tei_pyutils.synthetic import (
+    entity_ids,
+    generate_corpus,
+    make_edition,
+)
+from acdh_tei_pyutils.tei import TeiReader
+
+TEST_PATH = "/tmp/acdh_pyutil_synthetic_test"
+
+
+class TestSynthetic(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.synthetic` functions."""
+
+    def tearDown(self):
+        shutil.rmtree(TEST_PATH, ignore_errors=True)
+
+    def test_001_make_edition(self):
+        ent_ids = entity_ids(10)
+        self.assertEqual(ent_ids[:2], ["person_000000", "place_000001"])
+        xml = make_edition(3, ent_ids, refs=7, paragraphs=2, depth=4, seed=1)
+        self.assertEqual(
+            xml, make_edition(3, ent_ids, refs=7, paragraphs=2, depth=4, seed=1)
+        )
+        self.assertNotEqual(xml, make_edition(3, ent_ids, refs=7, paragraphs=2, seed=2))
+        doc = TeiReader(xml)
+        self.assertEqual(len(doc.any_xpath(".//tei:body/tei:p")), 2)
+        self.assertEqual(len(doc.any_xpath(".//tei:rs[@ref]")), 7)
+        self.assertEqual(
+            len(doc.any_xpath(".//tei:p/tei:seg/tei:seg/tei:seg/tei:seg")), 2
+        )
+        for ref in doc.any_xpath(".//tei:rs/@ref"):
+            self.assertIn(ref[1:], ent_ids)
+
+    def test_002_generate_corpus(self):
+        corpus = generate_corpus(TEST_PATH, docs=5, refs=3, entities=9, notes=2)
+        self.assertEqual(len(corpus["editions"]), 5)
+        self.assertEqual(len(corpus["indices"]), 4)
+        ids = []
+        for x in corpus["indices"]:
+            ids += TeiReader(x).any_xpath(".//tei:body//*/@xml:id")
+        self.assertEqual(sorted(ids), sorted(entity_ids(9)))
+        with open(corpus["editions"][4]) as f:
+            first = f.read()
+        generate_corpus(TEST_PATH, docs=8, refs=3, entities=9, notes=2)
+        with open(corpus["editions"][4]) as f:
+            self.assertEqual(f.read(), first)
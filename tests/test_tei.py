@@ -7,7 +7,13 @@ import unittest
 
 import lxml.etree as ET
 
-from acdh_tei_pyutils.tei import NER_TAG_MAP, HandleAlreadyExist, TeiEnricher, TeiReader
+from acdh_tei_pyutils.tei import (
+    NER_TAG_MAP,
+    XML_ID,
+    HandleAlreadyExist,
+    TeiEnricher,
+    TeiReader,
+)
 from acdh_tei_pyutils.utils import (
     add_graphic_url_to_pb,
     check_for_hash,
@@ -67,6 +73,35 @@ class TestTeiEnricher(unittest.TestCase):
         self.assertEqual(handle_node.text, "1234/5432")
         self.assertEqual(hdl_no.handle_exist(), "1234/5432")
 
+    def test_005_add_mention_lists(self):
+        doc = TeiEnricher(
+            """<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>
+            <listPerson><person xml:id="p1"/><person xml:id="p2"/></listPerson>
+            <listEvent><event xml:id="e1"><label>x</label><listPerson/></event></listEvent>
+            </body></text></TEI>"""
+        )
+        mention = {
+            "doc_id": "doc_1.xml",
+            "doc_title": "a title",
+            "doc_title_sec": None,
+            "doc_date": "1900-01-01",
+        }
+        ref_doc_dict = {"p1": [mention, mention], "e1": [mention]}
+        slug_cache = {}
+        processed = doc.add_mention_lists(
+            ref_doc_dict, blacklist_ids=["p2"], slug_cache=slug_cache
+        )
+        self.assertEqual(processed, ["p1", "e1"])
+        self.assertEqual(slug_cache, {"doc_1.xml": "doc-1-xml"})
+        notes = doc.any_xpath(".//tei:person[@xml:id='p1']/tei:noteGrp/tei:note")
+        self.assertEqual(len(notes), 1)
+        self.assertEqual(notes[0].get("corresp"), "1900-01-01")
+        self.assertEqual(notes[0].text, "a title")
+        event = doc.any_xpath(".//tei:event")[0]
+        self.assertEqual(event[1].tag, "{http://www.tei-c.org/ns/1.0}noteGrp")
+        doc.add_mention_lists(ref_doc_dict, replace=True)
+        self.assertEqual(len(doc.any_xpath(".//tei:noteGrp")), 2)
+
 
 class TestTEIReader(unittest.TestCase):
     """Tests for `acdh_tei_pyutils.tei.TeiReader` class."""
@@ -108,6 +143,27 @@ class TestTEIReader(unittest.TestCase):
         ne_offsets = doc.extract_ne_offsets()
         print(ne_offsets[2])
         self.assertIsInstance(ne_offsets, list)
+        text, ents = ne_offsets[2]
+        self.assertEqual(
+            [(text[x[0] : x[1]], x[2]) for x in ents["entities"]],
+            [("Broschüre", "MISC"), ("Böhmen", "LOC")],
+        )
+        doc = TeiReader(
+            """<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><p>
+            Wien  <rs type="place">
+            Wien </rs>und <rs type="person"><persName>A</persName> B</rs><!-- c --> Wien
+            </p></body></text></TEI>"""
+        )
+        ne_offsets = doc.extract_ne_offsets(ne_xpath=".//tei:rs|.//tei:persName")
+        self.assertEqual(
+            ne_offsets,
+            [
+                (
+                    "Wien Wien und A B Wien",
+                    {"entities": [(5, 9, "LOC"), (14, 17, "PER")]},
+                )
+            ],
+        )
 
     def test_006_markup_cleanup(self):
         doc = TeiReader(xml=FILES[0])
@@ -225,6 +281,13 @@ mein schatz ich liebe    dich
         pb_urls = new_doc.any_xpath(".//tei:pb/@url")
         for x in pb_urls:
             self.assertTrue(x in graphic_urls)
+        # the id of the surface is also used by an element before it
+        doc = TeiReader(test_str)
+        note = ET.Element("{http://www.tei-c.org/ns/1.0}note")
+        note.set(XML_ID, "D_000002-003-000-facs001-l001-p002")
+        doc.tree.insert(0, note)
+        pb_urls = add_graphic_url_to_pb(doc).any_xpath(".//tei:pb/@url")
+        self.assertEqual(pb_urls, graphic_urls)
 
     def test_012_extract_fulltext(self):
         test_str = """
@@ -264,3 +327,42 @@ mein schatz ich liebe    dich
         node.attrib["{http://www.w3.org/XML/1998/namespace}id"] = "foo"
         xml_id = get_xmlid(node)
         self.assertEqual("foo", xml_id)
+
+    def test_014_text_nes_list_single_pass(self):
+        ne_xpath = ".//tei:rs|.//tei:note|.//tei:unclear"
+        for x in FILES:
+            doc = TeiReader(xml=x)
+            expected = [
+                {
+                    "text": doc.create_plain_text(node),
+                    "ner_dicts": doc.extract_ne_dicts(node, ne_xpath),
+                }
+                for node in doc.any_xpath(".//tei:body//tei:p")
+            ]
+            self.assertEqual(doc.get_text_nes_list(ne_xpath=ne_xpath), expected)
+
+    def test_015_iter_ner(self):
+        doc = TeiReader(xml=FILES[0])
+        text_nes = doc.iter_text_nes()
+        self.assertFalse(isinstance(text_nes, list))
+        self.assertEqual(next(text_nes), doc.get_text_nes_list()[0])
+        self.assertEqual(list(doc.iter_ne_offsets()), doc.extract_ne_offsets())
+
+    def test_016_id_index(self):
+        doc = TeiEnricher(
+            """<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:id="doc"><text><body>
+            <p xml:id="p1">a</p><p xml:id="p2">c</p>
+            </body></text></TEI>"""
+        )
+        self.assertEqual(list(doc.id_index), ["doc", "p1", "p2"])
+        self.assertEqual(doc.get_element_by_id("p1").text, "a")
+        self.assertIsNone(doc.get_element_by_id("#p1"))
+        doc.add_base_and_id("https://example.org", "new_id", None, None)
+        self.assertIsNone(doc.get_element_by_id("doc"))
+        self.assertEqual(
+            doc.get_element_by_id("new_id").tag, "{http://www.tei-c.org/ns/1.0}TEI"
+        )
+        p2 = doc.get_element_by_id("p2")
+        p2.getparent().remove(p2)
+        doc.invalidate_id_index()
+        self.assertNotIn("p2", doc.id_index)
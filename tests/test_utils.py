@@ -1,16 +1,29 @@
 """Tests for `acdh_tei_pyutils.utils` module."""
 
+import glob
+import os
+import shutil
 import unittest
 
 import lxml.etree as ET
 
 from acdh_tei_pyutils.tei import TeiReader
 from acdh_tei_pyutils.utils import (
+    MISSING_YEAR,
+    _fulltext_extractor,
+    add_base_and_id_to_files,
     any_xpath,
+    extract_entity_columns,
     extract_fulltext_with_spacing,
+    get_birth_death_year,
     make_bibl_label,
+    make_bibl_labels,
+    make_entity_label,
+    root_attributes,
 )
 
+TEST_PATH = "/tmp/acdh_pyutil_utils_test"
+
 
 class TestTeiUtils(unittest.TestCase):
     def test_001(self):
@@ -20,6 +33,58 @@ class TestTeiUtils(unittest.TestCase):
             n = x.attrib["n"]
             self.assertEqual(label, n)
 
+    def test_002_make_bibl_labels(self):
+        doc = TeiReader("tests/listbibl_test.xml")
+        bibls = doc.any_xpath(".//tei:biblStruct[@xml:id]")
+        labels = make_bibl_labels(
+            doc, bibl_xpath=".//tei:biblStruct[@xml:id]", max_title_length=50
+        )
+        self.assertEqual([x[0] for x in labels], bibls)
+        for node, label in labels:
+            self.assertEqual(label, node.attrib["n"])
+        node = ET.fromstring(
+            """<listBibl xmlns="http://www.tei-c.org/ns/1.0"><biblStruct><monogr>
+            <editor><name>Ed</name></editor><author><name>A</name></author>
+            <author><surname>B</surname></author><title/><date>1900</date>
+            </monogr></biblStruct></listBibl>"""
+        )
+        self.assertEqual(make_bibl_labels(node)[0][1], "A, o.T., 1900")
+        self.assertEqual(make_bibl_label(node[0]), "A, o.T., 1900")
+
+    def test_003_extract_entity_columns(self):
+        doc = TeiReader(
+            """<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>
+            <listPerson>
+                <person xml:id="p1">
+                    <persName xml:lang="de"><forename>Josef</forename>
+                    <forename type="taken">Karl</forename><surname>Crcil</surname></persName>
+                    <birth when="1850-01-01"/><death><date when="1901"/></death>
+                </person>
+                <person xml:id="p2"><persName>  Nur   Text </persName>
+                <death when="foo"/><death when="1930"/></person>
+                <person><persName>no id</persName></person>
+                <person xml:id="p3"/>
+            </listPerson>
+            <listPlace><place xml:id="pl1"><placeName>Wien</placeName></place></listPlace>
+            </body></text></TEI>"""
+        )
+        columns = extract_entity_columns(doc)
+        self.assertEqual(columns["ids"], ["p1", "p2", "p3", "pl1"])
+        self.assertEqual(
+            columns["labels"],
+            ["Crcil, Josef Karl", "Nur Text", "no label provided", "Wien"],
+        )
+        self.assertEqual(columns["langs"], ["de", "en", "en", "en"])
+        self.assertEqual(list(columns["birth_years"]), [1850] + [MISSING_YEAR] * 3)
+        self.assertEqual(list(columns["death_years"]), [MISSING_YEAR] * 4)
+        columns = extract_entity_columns(doc, death_xpath_part="tei:date/@when")
+        self.assertEqual(columns["death_years"][0], 1901)
+        for ent, label in zip(
+            doc.any_xpath(".//tei:person[@xml:id][*]"), columns["labels"]
+        ):
+            self.assertEqual(make_entity_label(ent[0])[0], label)
+            self.assertEqual(get_birth_death_year(ent, birth=False), None)
+
     def test_01_extract_fulltext_with_spacing(self):
         """Test extract_fulltext_with_spacing with TEI namespace XML"""
         # Create a sample TEI XML document
@@ -54,6 +119,14 @@ class TestTeiUtils(unittest.TestCase):
         self.assertNotIn("The Author", result_blacklist)
         self.assertIn("Test Header", result_blacklist)
 
+        # the extractor of a configuration is built once
+        hits = _fulltext_extractor.cache_info().hits
+        self.assertEqual(
+            extract_fulltext_with_spacing(root, tag_blacklist=["closer"]),
+            result_blacklist,
+        )
+        self.assertEqual(_fulltext_extractor.cache_info().hits, hits + 1)
+
     def test_02_extract_fulltext_with_spacing_space_elements(self):
         """Test extract_fulltext_with_spacing with space elements"""
         tei_ns = "http://www.tei-c.org/ns/1.0"
@@ -96,3 +169,43 @@ class TestTeiUtils(unittest.TestCase):
         node = doc.any_xpath(".//tei:back")[0]
         name = any_xpath(node, ".//tei:forename/text()")[0]
         self.assertCountEqual(name, "Johann")
+
+    def test_04_add_base_and_id_to_files(self):
+        os.makedirs(TEST_PATH, exist_ok=True)
+        self.addCleanup(shutil.rmtree, TEST_PATH, ignore_errors=True)
+        for n in range(4):
+            with open(os.path.join(TEST_PATH, f"doc_{n}.xml"), "w") as f:
+                f.write('<TEI xmlns="http://www.tei-c.org/ns/1.0"><text/></TEI>')
+        files = sorted(glob.glob(f"{TEST_PATH}/*.xml"))
+        results = add_base_and_id_to_files(files, "https://example.org", jobs=2)
+        self.assertEqual(list(results.values()), [(True, None)] * 4)
+        tag, attrib = root_attributes(files[1])
+        self.assertEqual(tag, "{http://www.tei-c.org/ns/1.0}TEI")
+        self.assertEqual(
+            attrib,
+            {
+                "{http://www.w3.org/XML/1998/namespace}base": "https://example.org",
+                "{http://www.w3.org/XML/1998/namespace}id": "doc_1.xml",
+                "prev": "https://example.org/doc_0.xml",
+                "next": "https://example.org/doc_2.xml",
+            },
+        )
+        self.assertNotIn("prev", root_attributes(files[0])[1])
+        mtimes = [os.stat(x).st_mtime_ns for x in files]
+        results = add_base_and_id_to_files(files, "https://example.org")
+        self.assertEqual(list(results.values()), [(False, None)] * 4)
+        self.assertEqual([os.stat(x).st_mtime_ns for x in files], mtimes)
+        # a new file changes @next of its predecessor only
+        with open(os.path.join(TEST_PATH, "doc_4.xml"), "w") as f:
+            f.write('<TEI xmlns="http://www.tei-c.org/ns/1.0"><text/></TEI>')
+        files = sorted(glob.glob(f"{TEST_PATH}/*.xml"))
+        results = add_base_and_id_to_files(files, "https://example.org")
+        self.assertEqual([x[0] for x in results.values()], [False] * 3 + [True] * 2)
+        with open(os.path.join(TEST_PATH, "broken.xml"), "w") as f:
+            f.write("<TEI")
+        results = add_base_and_id_to_files(
+            [os.path.join(TEST_PATH, "broken.xml")], "https://example.org"
+        )
+        changed, error = results[os.path.join(TEST_PATH, "broken.xml")]
+        self.assertFalse(changed)
+        self.assertIn("broken.xml", error)
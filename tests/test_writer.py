@@ -0,0 +1,68 @@
+"""Tests for `acdh_tei_pyutils.writer` module."""
+
+import glob
+import os
+import shutil
+import unittest
+
+from lxml import etree as ET
+
+from acdh_tei_pyutils.tei import TeiEnricher
+from acdh_tei_pyutils.writer import WriteBehindQueue, write_tree
+
+TEST_PATH = "/tmp/acdh_pyutil_writer_test"
+
+DOC = '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><p>{n}</p></body></text></TEI>'
+
+
+class TestWriter(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.writer` functions."""
+
+    def setUp(self):
+        os.makedirs(TEST_PATH, exist_ok=True)
+        self.addCleanup(shutil.rmtree, TEST_PATH, ignore_errors=True)
+
+    def test_001_write_tree(self):
+        file_path = os.path.join(TEST_PATH, "doc.xml")
+        doc = TeiEnricher(DOC.format(n=1))
+        self.assertEqual(write_tree(doc.tree, file_path), file_path)
+        other = os.path.join(TEST_PATH, "other.xml")
+        doc.tree_to_file(file=other)
+        with open(file_path, "rb") as f, open(other, "rb") as g:
+            self.assertEqual(f.read(), g.read())
+        # new files get the same permissions as with a plain open
+        self.assertEqual(os.stat(file_path).st_mode, os.stat(other).st_mode)
+        os.chmod(file_path, 0o640)
+        write_tree(ET.fromstring(DOC.format(n=2)), file_path, xml_declaration=False)
+        self.assertEqual(os.stat(file_path).st_mode & 0o777, 0o640)
+        with open(file_path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), DOC.format(n=2))
+        # a failing write leaves no temporary file behind
+        os.makedirs(os.path.join(TEST_PATH, "dir.xml"))
+        with self.assertRaises(OSError):
+            write_tree(doc.tree, os.path.join(TEST_PATH, "dir.xml"))
+        self.assertEqual(
+            sorted(os.listdir(TEST_PATH)), ["dir.xml", "doc.xml", "other.xml"]
+        )
+        # the target of a symlink is replaced, not the link
+        link = os.path.join(TEST_PATH, "link.xml")
+        os.symlink(other, link)
+        write_tree(ET.fromstring(DOC.format(n=3)), link, xml_declaration=False)
+        self.assertTrue(os.path.islink(link))
+        with open(other, encoding="utf-8") as f:
+            self.assertEqual(f.read(), DOC.format(n=3))
+
+    def test_002_write_behind_queue(self):
+        files = [os.path.join(TEST_PATH, f"doc_{n}.xml") for n in range(20)]
+        missing = os.path.join(TEST_PATH, "missing", "doc.xml")
+        for workers in (0, 2):
+            with WriteBehindQueue(workers=workers, maxsize=2) as writer:
+                for n, x in enumerate(files):
+                    writer.write(TeiEnricher(DOC.format(n=n)), x)
+                writer.write(TeiEnricher(DOC.format(n=0)), missing)
+                writer.flush()
+                self.assertEqual(writer.written, 20)
+            self.assertEqual(list(writer.errors), [missing])
+            self.assertEqual(sorted(glob.glob(f"{TEST_PATH}/*")), sorted(files))
+            for n, x in enumerate(files):
+                self.assertEqual(TeiEnricher(x).any_xpath(".//tei:p/text()"), [str(n)])
@@ -0,0 +1,89 @@
+"""Tests for `acdh_tei_pyutils.xpath` module."""
+
+import unittest
+
+from lxml import etree as ET
+
+from acdh_tei_pyutils.xpath import (
+    XPATH_CACHE,
+    XPathCache,
+    XPathProfile,
+    cached_xpath,
+    disable_xpath_profiling,
+    enable_xpath_profiling,
+)
+
+NS_A = {"x": "http://example.org/a"}
+NS_B = {"x": "http://example.org/b"}
+DOC = ET.fromstring(
+    '<root xmlns:a="http://example.org/a" xmlns:b="http://example.org/b">'
+    "<a:item>1</a:item><b:item>2</b:item><a:item>3</a:item></root>"
+)
+
+
+class TestXPathCache(unittest.TestCase):
+    """Tests for `acdh_tei_pyutils.xpath.XPathCache` class."""
+
+    def test_001_hits_and_misses(self):
+        cache = XPathCache()
+        self.assertEqual(cache(DOC, ".//x:item/text()", NS_A), ["1", "3"])
+        self.assertEqual(cache(DOC, ".//x:item/text()", NS_A), ["1", "3"])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # the namespace map is part of the key
+        self.assertEqual(cache(DOC, ".//x:item/text()", NS_B), ["2"])
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 2, 2))
+        cache.clear()
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 0, 0))
+
+    def test_002_eviction(self):
+        cache = XPathCache(maxsize=2)
+        cache.compile("count(//*)")
+        cache.compile("name(/*)")
+        cache.compile("count(//*)")
+        cache.compile("string(/*)")
+        self.assertEqual(len(cache), 2)
+        cache.compile("count(//*)")
+        self.assertEqual(cache.hits, 2)
+        cache.compile("name(/*)")
+        self.assertEqual(cache.misses, 4)
+
+    def test_003_shared_cache(self):
+        XPATH_CACHE.clear()
+        self.assertEqual(cached_xpath(DOC, "count(//*)"), 4.0)
+        self.assertEqual(cached_xpath(DOC, "count(//*)"), 4.0)
+        self.assertEqual(XPATH_CACHE.hits, 1)
+        self.assertRaises(ET.XPathSyntaxError, lambda: cached_xpath(DOC, "//["))
+
+    def test_004_profiling(self):
+        calls = []
+        profile = enable_xpath_profiling(lambda x, seconds: calls.append(x))
+        try:
+            for _ in range(3):
+                cached_xpath(DOC, "count(//*)")
+            cached_xpath(DOC, ".//x:item/text()", NS_A)
+            self.assertRaises(ET.XPathSyntaxError, lambda: cached_xpath(DOC, "//["))
+        finally:
+            self.assertIs(disable_xpath_profiling(), profile)
+        cached_xpath(DOC, "name(/*)")
+        self.assertIsNone(XPATH_CACHE.profile)
+        self.assertEqual(calls, ["count(//*)"] * 3 + [".//x:item/text()"])
+        rows = profile.slowest(key="calls")
+        self.assertEqual(next(x["expression"] for x in rows), "count(//*)")
+        self.assertEqual(rows[0]["calls"], 3)
+        self.assertAlmostEqual(
+            rows[0]["mean_seconds"], rows[0]["total_seconds"] / 3, places=9
+        )
+        self.assertLessEqual(rows[0]["max_seconds"], rows[0]["total_seconds"])
+        self.assertEqual(len(profile.slowest(limit=1)), 1)
+        self.assertEqual(len(profile.table().splitlines()), 3)
+        profile.clear()
+        self.assertEqual(profile.slowest(), [])
+
+    def test_005_profile_without_callback(self):
+        profile = XPathProfile()
+        cache = XPathCache()
+        cache.profile = profile
+        self.assertEqual(cache(DOC, "count(//*)"), 4.0)
+        profile.record("count(//*)", 1.0)
+        self.assertEqual(profile.slowest()[0]["calls"], 2)
+        self.assertGreaterEqual(profile.slowest()[0]["max_seconds"], 1.0)